@@ -1,14 +1,164 @@
 import os
+import copy
+import time
+import uuid
 import json
-from groq import Groq
+import asyncio
+import logging
+import httpx
+import groq
+from groq import Groq, AsyncGroq
 from dotenv import load_dotenv
-from typing import Dict, Any
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Any, List, Optional, AsyncIterator
+from pydantic import BaseModel, ValidationError
+from app.cache import recommendation_cache, make_cache_key, normalize_text
+from app.similarity import similarity_index, make_scope, SIMILAR_MATCHING, SIMILAR_REFRESH, SIMILAR_REFRESH_MAX
+from app.stream_parser import IncrementalRecommendationParser
+from app.json_repair import repair_json
+from app.resilience import TokenBucket, CircuitBreaker, backoff_delay, parse_retry_after
+from app.metrics import timed_stage, record_usage, PARSE_RESULTS, QUEUE_DEPTH
+from app.routing import ModelRouter, parse_prices, hedged_call, count_tokens, request_complexity
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 
-# Initialize Groq client
-groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+# LLM call tuning
+LLM_MODEL = "llama3-8b-8192"
+LLM_MODELS = [m.strip() for m in os.getenv("LLM_MODELS", LLM_MODEL).split(",") if m.strip()]  # Routed models, cheapest first
+LLM_MODEL_PRICES = os.getenv("LLM_MODEL_PRICES", "")  # "model=prompt/completion,..." in USD per million tokens
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "0"))  # Max prompt tokens of a generation call, 0 for no limit
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))  # Max in-flight LLM calls per worker
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))  # Per-call timeout in seconds
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "64"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "32"))
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "0"))  # Token-bucket refill rate, 0 for no limit
+LLM_BURST = float(os.getenv("LLM_BURST", "5"))  # Token-bucket capacity
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1"))  # Seconds, doubled per attempt
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))  # Consecutive failures before opening
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))  # Seconds before a trial call is allowed
+LLM_JSON_MODE = os.getenv("LLM_JSON_MODE", "true").lower() in ("1", "true", "yes")  # Ask the model for a JSON object
+LLM_JSON_FIX = os.getenv("LLM_JSON_FIX", "true").lower() in ("1", "true", "yes")  # Ask the model to fix unrepairable JSON
+LLM_FIX_MODEL = os.getenv("LLM_FIX_MODEL", "llama3-8b-8192")  # Model for the JSON fix call
+LLM_FAN_OUT = os.getenv("LLM_FAN_OUT", "false").lower() in ("1", "true", "yes")  # Default for per-component generation
+LLM_FAN_OUT_MAX_COMPONENTS = int(os.getenv("LLM_FAN_OUT_MAX_COMPONENTS", "6"))  # Components generated concurrently
+LLM_DEDUP_LEASE = float(os.getenv("LLM_DEDUP_LEASE", "180"))  # Max seconds to wait for another server process generating the same request
+LLM_DEDUP_POLL = 0.25  # Seconds between checks for that result
+
+# Groq clients, built on first use so importing the app stays cheap and works without a key
+_groq_client: Optional[Groq] = None
+_async_groq_client: Optional[AsyncGroq] = None
+
+def get_groq_client() -> Groq:
+    global _groq_client
+    if _groq_client is None:
+        _groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+    return _groq_client
+
+def get_async_groq_client() -> AsyncGroq:
+    """
+    Async Groq client backed by a single pooled HTTP client, so connections are reused across calls
+    """
+    global _async_groq_client
+    if _async_groq_client is None:
+        # Retries are handled by create_chat_completion, so the client's own retries are disabled
+        _async_groq_client = AsyncGroq(
+            api_key=os.getenv("GROQ_API_KEY"),
+            timeout=LLM_TIMEOUT,
+            max_retries=0,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS
+                ),
+                timeout=LLM_TIMEOUT
+            )
+        )
+    return _async_groq_client
+
+async def close_clients():
+    global _async_groq_client
+    if _async_groq_client is not None:
+        await _async_groq_client.close()
+        _async_groq_client = None
+
+# Caps the number of concurrent LLM calls from the async path
+llm_semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+# Shared rate limiter and circuit breaker around the async Groq client
+groq_rate_limiter = TokenBucket(rate=LLM_REQUESTS_PER_MINUTE / 60, capacity=LLM_BURST)
+groq_circuit_breaker = CircuitBreaker(failure_threshold=LLM_BREAKER_THRESHOLD, reset_timeout=LLM_BREAKER_RESET)
+
+# Per-request model choice, hedging and per-model latency and cost stats
+model_router = ModelRouter(LLM_MODELS, parse_prices(LLM_MODEL_PRICES))
+
+# In-flight generations keyed by cache key, so identical concurrent requests share one upstream call
+_inflight_requests: Dict[str, asyncio.Future] = {}
+
+# Background regenerations of requests answered from a similar one
+_refresh_tasks = set()
+
+# Text sections of a recommendation, in report order
+RECOMMENDATION_SECTIONS = ["general_recommendations", "alt_materials", "manufacturing_considerations", "cost_considerations"]
+
+# Material name used when the AI response could not be parsed
+FALLBACK_MATERIAL_NAME = "See recommendations"
+
+# Groq JSON mode, not supported together with streaming
+JSON_RESPONSE_FORMAT = {"type": "json_object"}
+
+FIX_JSON_PROMPT = """The following JSON is malformed. Return it as a single valid JSON object with the same content and
+the keys "materials" (a list of objects with "name", "properties", "application" and "rationale"),
+"general_recommendations", "alt_materials", "manufacturing_considerations" and "cost_considerations".
+Do not add, remove or reword any content. Return only the JSON object."""
+
+
+class MaterialSchema(BaseModel):
+    name: str
+    properties: Dict[str, Any] = {}
+    application: str = ""
+    rationale: str = ""
+
+
+class RecommendationSchema(BaseModel):
+    """
+    The JSON format requested in SYSTEM_PROMPT
+    """
+    materials: List[MaterialSchema]
+    general_recommendations: str = ""
+    alt_materials: str = ""
+    manufacturing_considerations: str = ""
+    cost_considerations: str = ""
+
+
+class ComponentSchema(BaseModel):
+    name: str
+    function: str = ""
+
+
+class DecompositionSchema(BaseModel):
+    components: List[ComponentSchema]
+
+
+class SectionsSchema(BaseModel):
+    general_recommendations: str
+    alt_materials: str = ""
+    manufacturing_considerations: str = ""
+    cost_considerations: str = ""
+
+
+class RefinementSchema(BaseModel):
+    """
+    The patch format requested in REFINE_PROMPT, material indexes refer to the previous result
+    """
+    remove: List[int] = []
+    replace: Dict[str, MaterialSchema] = {}
+    add: List[MaterialSchema] = []
+    sections: Dict[str, str] = {}
 
 # System prompt for the AI
 SYSTEM_PROMPT = """You are MaterialMind, an expert AI advisor for mechanical engineers specializing in material selection.
@@ -81,84 +231,1020 @@ Follow these formatting and syntax rules with zero tolerance for deviation:
 IMPORTANT: DO NOT HALLUCINATE. DO NOT GIVE FALSE INFORMATION. DO NOT MENTION YOUR NAME, OR THAT YOU ARE AN AI. ANSWER ONLY THOSE QUESTIONS RELATED TO PRODUC DEVELOPMENT AND MATERIAL SELECTION. DO NOT ENGAGE IN CONVERSATIONS OF ANY OTHER MATTER. FOR IRRELEVANT QUESTIONS ASKED, RETURN BACK AN ERROR MESSAGE SAYING INVALID PRODUCT DESCRIPTION. 
 """
 
-def get_material_recommendations(product_description: str, additional_requirements: Any = None) -> Dict[str, Any]:
-    """
-    Get material recommendations from Groq AI for a given product description
-    """
-    # Check for API key
-    if not os.getenv("GROQ_API_KEY"):
-        raise Exception("GROQ_API_KEY environment variable is required")
-    
-    # Combine the product description with additional requirements
+# Same contract without the JSON syntax rules, used when a long request would exceed PROMPT_TOKEN_BUDGET
+COMPACT_SYSTEM_PROMPT = """You are MaterialMind, an expert AI advisor for mechanical engineers specializing in material selection.
+For the product described by the user, recommend materials for its components. For each material give its full scientific
+and common name, key properties (density, tensile strength, thermal conductivity, endurance limit, fatigue strength, etc.,
+wherever relevant), where it is used, why it is suitable and the rough cost of the part in INR (write INR, not the symbol).
+
+Return only a single valid JSON object, all keys and values in double quotes, in this format:
+
+{
+  "materials": [
+    {"name": "Material name", "properties": {"property1": "value1"}, "application": "Where to use this material", "rationale": "Why this material is suitable"}
+  ],
+  "general_recommendations": "Overall advice about material selection. Atleast 120 words",
+  "alt_materials": "Potential material alternatives with Pros and Cons as a simple text paragraph. Atleast 120 words",
+  "manufacturing_considerations": "Manufacturing considerations related to material choices. Atleast 120 words",
+  "cost_considerations": "Cost considerations and trade-offs. Atleast 120 words"
+}
+
+DO NOT HALLUCINATE. DO NOT GIVE FALSE INFORMATION. DO NOT MENTION YOUR NAME, OR THAT YOU ARE AN AI. For anything unrelated
+to product development and material selection, return an error message saying INVALID PRODUCT DESCRIPTION.
+"""
+
+SYSTEM_PROMPT_TOKENS = count_tokens(SYSTEM_PROMPT) + 4
+COMPACT_SYSTEM_PROMPT_TOKENS = count_tokens(COMPACT_SYSTEM_PROMPT) + 4
+
+# Fan-out mode: decompose the product, generate materials per component concurrently, then merge
+DECOMPOSE_PROMPT = f"""You are MaterialMind, an expert advisor for mechanical engineers specializing in material selection.
+Break the product described by the user into its main physical components that each need a material choice.
+List at most {LLM_FAN_OUT_MAX_COMPONENTS} components, merging minor parts into the component they belong to.
+
+Return only a JSON object with the following format:
+
+{{
+  "components": [
+    {{"name": "Component name", "function": "What the component does and the loads, environment or constraints it sees"}}
+  ]
+}}
+"""
+
+COMPONENT_PROMPT = """You are MaterialMind, an expert advisor for mechanical engineers specializing in material selection.
+Recommend the best 1 or 2 materials for ONE component of the product described by the user. For each material include
+its full scientific and common name, key properties (density, tensile strength, thermal conductivity, endurance limit,
+fatigue strength, etc., wherever relevant), where it is used in the component, why it is suitable and the rough cost
+of the material for this part in INR (write INR, not the symbol).
+
+Return only a JSON object with the following format:
+
+{
+  "materials": [
+    {
+      "name": "Material name",
+      "properties": {"property1": "value1", "property2": "value2"},
+      "application": "Where to use this material",
+      "rationale": "Why this material is suitable"
+    }
+  ]
+}
+
+All values must be strings. DO NOT HALLUCINATE. DO NOT GIVE FALSE INFORMATION.
+"""
+
+SECTIONS_PROMPT = """You are MaterialMind, an expert advisor for mechanical engineers specializing in material selection.
+The user gives a product and the materials selected for its components. Write the summary sections of the material report.
+
+Return only a JSON object with the following format:
+
+{
+  "general_recommendations": "Overall advice about material selection. Atleast 120 words",
+  "alt_materials": "Potential material alternatives with Pros and Cons as a simple text paragraph. Atleast 120 words",
+  "manufacturing_considerations": "Manufacturing considerations related to the material choices. Atleast 120 words",
+  "cost_considerations": "Cost considerations and trade-offs. Atleast 120 words"
+}
+
+DO NOT HALLUCINATE. DO NOT GIVE FALSE INFORMATION. DO NOT MENTION YOUR NAME, OR THAT YOU ARE AN AI.
+"""
+
+# Refinement: patch a previous result for one new requirement instead of regenerating it
+REFINE_PROMPT = """You are MaterialMind, an expert advisor for mechanical engineers specializing in material selection.
+The user gives a product, the current material recommendation in compact form and ONE new requirement.
+Update the recommendation for the new requirement, changing only what the new requirement affects.
+
+Return only a JSON object with the following format, leaving out every key that has no changes:
+
+{
+  "remove": [indexes of current materials that no longer fit],
+  "replace": {"index of a current material": {"name": "Material name", "properties": {"property1": "value1"}, "application": "Where to use this material", "rationale": "Why this material is suitable"}},
+  "add": [new materials in the same format as "replace"],
+  "sections": {"section name": "The full rewritten section, only for sections the new requirement changes"}
+}
+
+Section names are general_recommendations, alt_materials, manufacturing_considerations and cost_considerations.
+Give costs in INR (write INR, not the symbol). All values must be strings.
+DO NOT HALLUCINATE. DO NOT GIVE FALSE INFORMATION. DO NOT MENTION YOUR NAME, OR THAT YOU ARE AN AI.
+"""
+
+# Characters of each section shown to the model when refining, enough to judge whether it changes
+REFINE_SECTION_PREVIEW = 240
+
+def describe_product(product_description: str, additional_requirements: Any = None, material_context: Optional[str] = None) -> str:
     prompt = f"Product description: {product_description}"
     if additional_requirements:
         prompt += f"\nAdditional requirements: {additional_requirements}"
-    
+    if material_context:
+        prompt += f"\n\nCandidate materials that meet the constraints, with vetted property values. Prefer these materials and use these property values rather than estimating them:\n{material_context}"
+    return prompt
+
+def build_prompt(product_description: str, additional_requirements: Any = None, material_context: Optional[str] = None) -> str:
+    """
+    Build the user prompt for a product description, optional requirements and an optional
+    shortlist of screened materials
+    """
+    prompt = describe_product(product_description, additional_requirements, material_context)
     prompt += "\n\nPlease provide detailed material recommendations for this product, including specific materials for each component, their properties, applications, and rationale."
-    
+    return prompt
+
+def fit_prompt(product_description: str, additional_requirements: Any = None, material_context: Optional[str] = None,
+               log: bool = True) -> tuple:
+    """
+    (system_prompt, user_prompt) within PROMPT_TOKEN_BUDGET: the full system prompt when it fits,
+    else the compact one, then with trailing shortlist materials dropped. The product description
+    and requirements are never cut. Compacting is logged unless log is False.
+    """
+    prompt = build_prompt(product_description, additional_requirements, material_context)
+    if not PROMPT_TOKEN_BUDGET:
+        return SYSTEM_PROMPT, prompt
+    prompt_tokens = count_tokens(prompt) + 4
+    if SYSTEM_PROMPT_TOKENS + prompt_tokens <= PROMPT_TOKEN_BUDGET:
+        return SYSTEM_PROMPT, prompt
+    # The shortlist has one material per line (materials_db.format_shortlist)
+    lines = material_context.splitlines() if material_context else []
+    shortlist_size = len(lines)
+    while lines and COMPACT_SYSTEM_PROMPT_TOKENS + prompt_tokens > PROMPT_TOKEN_BUDGET:
+        lines.pop()
+        prompt = build_prompt(product_description, additional_requirements, "\n".join(lines) or None)
+        prompt_tokens = count_tokens(prompt) + 4
+    if log:
+        if len(lines) < shortlist_size:
+            logger.warning(
+                "Prompt over PROMPT_TOKEN_BUDGET=%d, using the compact system prompt and %d of %d screened materials",
+                PROMPT_TOKEN_BUDGET, len(lines), shortlist_size
+            )
+        else:
+            logger.info("Prompt over PROMPT_TOKEN_BUDGET=%d, using the compact system prompt", PROMPT_TOKEN_BUDGET)
+    return COMPACT_SYSTEM_PROMPT, prompt
+
+def build_messages(system_prompt: str, prompt: str) -> list:
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": prompt}
+    ]
+
+def validate_recommendations(material_data: Any, schema: type = RecommendationSchema) -> Optional[Dict[str, Any]]:
     try:
-        # Call Groq API
-        response = groq_client.chat.completions.create(
-            model="llama3-8b-8192",  # Using Llama 3 model
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.2  # Lower temperature for more consistent responses
-        )
-        
-        response_content = response.choices[0].message.content
-        print("RESPONSE FORM AI IS : \n", response_content)
-        
-        # Try to parse as JSON
-        try:
+        return schema.model_validate(material_data).model_dump()
+    except ValidationError as e:
+        logger.info("AI response does not match the %s: %s", schema.__name__, e.errors()[:3])
+        return None
+
+def is_error_object(material_data: Any) -> bool:
+    """
+    The model's JSON answer to an invalid description, e.g. {"error": "INVALID PRODUCT DESCRIPTION"}
+    """
+    return isinstance(material_data, dict) and "materials" not in material_data
+
+def validate_or_reject(material_data: Any, schema: type) -> Optional[Dict[str, Any]]:
+    if schema is RecommendationSchema and is_error_object(material_data):
+        # No materials to recommend, nothing for the JSON fix call to repair
+        logger.info("AI response has no materials: %s", str(material_data)[:200])
+        return {**material_data, "materials": []}
+    return validate_recommendations(material_data, schema)
+
+def decode_recommendations(response_content: str, schema: type = RecommendationSchema) -> tuple:
+    """
+    Decode and validate the AI response, repairing it locally when it isn't valid JSON.
+    Returns (material_data, tier) with tier "json", "repaired" or "truncated" (repaired from
+    output that stopped early, so items may be missing), or (None, None).
+    """
+    try:
+        with timed_stage("json_parse"):
             material_data = json.loads(response_content)
-            print("return data loaded as JSON is : \n ", material_data)
-        except json.JSONDecodeError:
-            print("JSON PARSING FAILED.")
-            # If parsing fails, we'll need to extract JSON from the text
-            import re
-            json_match = re.search(r'```json\n(.*?)\n```', response_content, re.DOTALL)
-            if json_match:
-                material_data = json.loads(json_match.group(1))
-            else:
-                # As a fallback, create a simple structure with the raw text
-                print("Warning: Could not parse JSON from AI response, using text format instead")
-                material_data = {
-                    "materials": [
-                        {
-                            "name": "See recommendations",
-                            "properties": {"info": "NA"},
-                            "application": "NA",
-                            "rationale": "NA"
-                        }
-                    ],
-                    "general_recommendations": response_content
-                }
-        
-        # Process and structure the response
-        materials = []
-        general_recommendations = material_data.get("general_recommendations", "")
-        alt_materials = material_data.get("alt_materials", "")
-        manufacturing_considerations = material_data.get("manufacturing_considerations", "")
-        cost_considerations = material_data.get("cost_considerations", "")
-        
-        for material in material_data.get("materials", []):
-            materials.append({
-                "name": material.get("name", ""),
-                "properties": material.get("properties", {}),
-                "application": material.get("application", ""),
-                "rationale": material.get("rationale", "")
-            })
-        
-        return {
-            "materials": materials,
-            "general_recommendations": general_recommendations,
-            "alt_materials": alt_materials,
-            "manufacturing_considerations": manufacturing_considerations,
-            "cost_considerations": cost_considerations
-        }
+        validated = validate_or_reject(material_data, schema)
+        if validated is not None:
+            return validated, "json"
+    except json.JSONDecodeError:
+        logger.info("JSON parsing failed, trying local repair")
+
+    with timed_stage("json_repair"):
+        material_data, truncated = repair_json(response_content)
+    if material_data is not None:
+        validated = validate_or_reject(material_data, schema)
+        if validated is not None:
+            return validated, "truncated" if truncated else "repaired"
+    return None, None
+
+def fallback_recommendations(response_content: str) -> Dict[str, Any]:
+    """
+    Wrap an unparsable AI response in a stub material, keeping the raw text
+    """
+    logger.warning("Could not parse JSON from AI response, using text format instead")
+    PARSE_RESULTS.labels("fallback").inc()
+    return build_recommendations({
+        "materials": [
+            {
+                "name": FALLBACK_MATERIAL_NAME,
+                "properties": {"info": "NA"},
+                "application": "NA",
+                "rationale": "NA"
+            }
+        ],
+        "general_recommendations": response_content
+    })
+
+def parse_recommendations(response_content: str, allow_fallback: bool = True, tier: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Parse the raw AI response into the recommendations dict.
+
+    Returns None instead of the raw-text stub when allow_fallback is False. tier overrides the
+    label counted in PARSE_RESULTS, e.g. for responses of the JSON fix call.
+    """
+    logger.debug("Response from AI: %s", response_content)
+
+    material_data, parsed_tier = decode_recommendations(response_content)
+    if material_data is None:
+        return fallback_recommendations(response_content) if allow_fallback else None
+    PARSE_RESULTS.labels(tier or parsed_tier).inc()
+    recommendations = build_recommendations(material_data)
+    if parsed_tier == "truncated":
+        # Served once, but never cached or stored, a retry may get the whole response
+        recommendations["truncated"] = True
+    return recommendations
+
+def build_recommendations(material_data: Dict[str, Any]) -> Dict[str, Any]:
+    # Process and structure the response
+    recommendations = {
+        "materials": [normalize_material(material) for material in material_data.get("materials", [])]
+    }
+    for section in RECOMMENDATION_SECTIONS:
+        recommendations[section] = material_data.get(section, "")
     
+    return recommendations
+
+def needs_json_fix(response_content: str) -> bool:
+    # Plain-text answers (e.g. the invalid description message) have nothing to fix
+    return LLM_JSON_FIX and "{" in response_content
+
+def build_fix_messages(response_content: str) -> list:
+    return [
+        {"role": "system", "content": FIX_JSON_PROMPT},
+        {"role": "user", "content": response_content}
+    ]
+
+def failed_generation(error: Exception) -> Optional[str]:
+    """
+    The rejected output Groq returns with a json_validate_failed error in JSON mode
+    """
+    body = getattr(error, "body", None)
+    if isinstance(body, dict):
+        body = body.get("error", body)
+        if isinstance(body, dict) and body.get("failed_generation"):
+            return body["failed_generation"]
+    return None
+
+def completion_content(response: Any = None, error: Optional[Exception] = None) -> Optional[str]:
+    """
+    Text of a completion, or the rejected output of a call that failed with a json_validate_failed
+    error in JSON mode (None for any other error)
+    """
+    if error is not None:
+        return failed_generation(error)
+    record_usage(response.usage)
+    return response.choices[0].message.content
+
+def fix_request(response_content: str) -> Dict[str, Any]:
+    return {
+        "model": LLM_FIX_MODEL,
+        "messages": build_fix_messages(response_content),
+        "temperature": 0,
+        "response_format": JSON_RESPONSE_FORMAT
+    }
+
+def parse_fixed(response_content: str, response: Any = None, error: Optional[Exception] = None) -> Dict[str, Any]:
+    """
+    Recommendations from the JSON fix call's response, or from the error it failed with, falling
+    back to the raw-text stub of the original response
+    """
+    # In JSON mode the fix itself may be rejected, its output still goes through local repair
+    fixed_content = completion_content(response, error)
+    if fixed_content is None:
+        logger.warning("JSON fix call failed: %s", error)
+    else:
+        recommendations = parse_recommendations(fixed_content, allow_fallback=False, tier="llm_fix")
+        if recommendations is not None:
+            return recommendations
+    return fallback_recommendations(response_content)
+
+def fix_recommendations(response_content: str) -> Dict[str, Any]:
+    """
+    Last resort for output local repair can't handle: ask the model to fix just the JSON.
+    Much cheaper than regenerating, the prompt is only the broken text.
+    """
+    if not needs_json_fix(response_content):
+        return fallback_recommendations(response_content)
+    try:
+        with timed_stage("json_fix_llm"):
+            response = get_groq_client().chat.completions.create(timeout=LLM_TIMEOUT, **fix_request(response_content))
     except Exception as e:
-        print(f"Error communicating with Groq API: {str(e)}")
-        raise Exception(f"AI recommendation failed: {str(e)}")
+        return parse_fixed(response_content, error=e)
+    return parse_fixed(response_content, response)
+
+async def fix_recommendations_async(response_content: str) -> Dict[str, Any]:
+    """
+    Async variant of fix_recommendations
+    """
+    if not needs_json_fix(response_content):
+        return fallback_recommendations(response_content)
+    try:
+        with timed_stage("json_fix_llm"):
+            async with llm_slot():
+                response = await create_chat_completion(**fix_request(response_content))
+    except Exception as e:
+        return parse_fixed(response_content, error=e)
+    return parse_fixed(response_content, response)
+
+def require_api_key():
+    if not os.getenv("GROQ_API_KEY"):
+        raise Exception("GROQ_API_KEY environment variable is required")
+
+@contextmanager
+def llm_failure(action: str = "recommendation"):
+    """
+    Log an error of the LLM calls in the block and re-raise it as "AI <action> failed: ..."
+    """
+    try:
+        yield
+    except Exception as e:
+        logger.error("Error communicating with Groq API: %s", e)
+        raise Exception(f"AI {action} failed: {str(e)}")
+
+def parse_generation(response_content: str) -> Optional[Dict[str, Any]]:
+    # None when only the JSON fix call can help, see fix_recommendations
+    return parse_recommendations(response_content, allow_fallback=not needs_json_fix(response_content))
+
+def normalize_material(material: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "name": material.get("name", ""),
+        "properties": material.get("properties", {}),
+        "application": material.get("application", ""),
+        "rationale": material.get("rationale", "")
+    }
+
+async def create_chat_completion(**kwargs):
+    """
+    Call the async Groq client under the rate limiter and circuit breaker.
+
+    429s pause the limiter for the server's Retry-After and are retried, connection errors and
+    5xx responses are retried with exponential backoff and count against the breaker.
+    A half-open trial call always ends the trial, whatever the outcome, so a 429 or a cancelled
+    caller can't leave the breaker rejecting every later call. Cancellation, e.g. of the losing
+    call of a hedged pair, ends the trial without counting as a failure: a hung upstream shows up
+    as a timeout after LLM_TIMEOUT instead.
+    """
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        trial = groq_circuit_breaker.check()
+        try:
+            with timed_stage("llm_rate_limit"):
+                await groq_rate_limiter.acquire()
+            try:
+                # For streams this is the time until the response starts
+                with timed_stage("llm_stream_open" if kwargs.get("stream") else "llm_generation"):
+                    response = await get_async_groq_client().chat.completions.create(timeout=LLM_TIMEOUT, **kwargs)
+            except groq.RateLimitError as e:
+                delay = parse_retry_after(e.response.headers)
+                if delay is None:
+                    delay = backoff_delay(attempt, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX)
+                groq_rate_limiter.pause(delay)
+                if attempt == LLM_MAX_RETRIES:
+                    raise
+                logger.warning("Groq rate limit hit, retrying in %.1fs", delay)
+            except (groq.APIConnectionError, groq.InternalServerError):
+                groq_circuit_breaker.record_failure()
+                if attempt == LLM_MAX_RETRIES:
+                    raise
+                delay = backoff_delay(attempt, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX)
+                await asyncio.sleep(delay)
+            else:
+                groq_circuit_breaker.record_success()
+                return response
+        finally:
+            # Any other outcome (a 429, a bad request, an auth error, cancellation) leaves the breaker as it was
+            if trial:
+                groq_circuit_breaker.release_trial()
+
+@asynccontextmanager
+async def llm_slot():
+    """
+    Hold one of the LLM_MAX_CONCURRENCY slots, recording how long the call queued for it
+    """
+    QUEUE_DEPTH.labels("llm").inc()
+    try:
+        with timed_stage("llm_queue"):
+            await llm_semaphore.acquire()
+    finally:
+        QUEUE_DEPTH.labels("llm").dec()
+    try:
+        yield
+    finally:
+        llm_semaphore.release()
+
+def json_mode_kwargs() -> Dict[str, Any]:
+    return {"response_format": JSON_RESPONSE_FORMAT} if LLM_JSON_MODE else {}
+
+def is_fallback_result(recommendations: Dict[str, Any]) -> bool:
+    """
+    True when the recommendations are the raw-text stub produced by a failed parse
+    """
+    return any(m.get("name") == FALLBACK_MATERIAL_NAME for m in recommendations.get("materials", []))
+
+def is_incomplete_result(recommendations: Dict[str, Any]) -> bool:
+    """
+    True for results not worth keeping: the raw-text stub or a response repaired after truncation
+    """
+    return recommendations.get("truncated", False) or is_fallback_result(recommendations)
+
+def cache_system_prompt(fan_out: bool = False, material_context: Optional[str] = None) -> str:
+    # Fan-out results come from different prompts, so they are cached separately
+    system_prompt = DECOMPOSE_PROMPT + COMPONENT_PROMPT + SECTIONS_PROMPT if fan_out else SYSTEM_PROMPT
+    if material_context:
+        system_prompt += material_context
+    return system_prompt
+
+def get_cache_key(product_description: str, additional_requirements: Any = None, fan_out: bool = False, material_context: Optional[str] = None) -> str:
+    system_prompt = cache_system_prompt(fan_out, material_context)
+    if not fan_out:
+        # A request over the prompt budget is generated from a compacted prompt, cache it apart
+        fitted_system_prompt, fitted_prompt = fit_prompt(product_description, additional_requirements, material_context, log=False)
+        if fitted_system_prompt is not SYSTEM_PROMPT:
+            system_prompt += fitted_system_prompt + fitted_prompt
+    return make_cache_key(product_description, additional_requirements, "+".join(LLM_MODELS), system_prompt)
+
+def get_similarity_scope(fan_out: bool = False, material_context: Optional[str] = None) -> str:
+    return make_scope("+".join(LLM_MODELS), cache_system_prompt(fan_out, material_context))
+
+def store_result(cache_key: str, recommendations: Dict[str, Any], product_description: str, additional_requirements: Any = None,
+                 fan_out: bool = False, material_context: Optional[str] = None):
+    """
+    Cache a result and index its request for similar-request matching
+    """
+    # Don't cache unparsable or truncated responses, a retry may do better
+    if is_incomplete_result(recommendations):
+        return
+    recommendation_cache.set(cache_key, recommendations)
+    similarity_index.add(get_similarity_scope(fan_out, material_context), cache_key, product_description, additional_requirements)
+
+def find_similar(product_description: str, additional_requirements: Any = None, fan_out: bool = False,
+                 material_context: Optional[str] = None) -> Optional[tuple]:
+    """
+    Cached result of a near-duplicate earlier request: (recommendations, match) or None, match
+    being {"score", "product_description", "additional_requirements"} of the earlier request
+    """
+    with timed_stage("similar_lookup"):
+        match = similarity_index.find(get_similarity_scope(fan_out, material_context), product_description, additional_requirements)
+    if match is None:
+        return None
+    cached = recommendation_cache.get(match.pop("cache_key"))
+    if cached is None:
+        return None
+    recommendation_cache.record("similar")
+    return cached, match
+
+def refresh_in_background(product_description: str, additional_requirements: Any = None, fan_out: bool = False,
+                          material_context: Optional[str] = None):
+    """
+    Generate the real result for a request that was answered from a similar one, so it is cached
+    under its own key for next time
+    """
+    cache_key = get_cache_key(product_description, additional_requirements, fan_out, material_context)
+    if not SIMILAR_REFRESH or cache_key in _inflight_requests or len(_refresh_tasks) >= SIMILAR_REFRESH_MAX:
+        return
+
+    async def refresh():
+        try:
+            await get_material_recommendations_async(
+                product_description, additional_requirements,
+                fan_out=fan_out, material_context=material_context, allow_similar=False
+            )
+        except Exception as e:
+            logger.warning("Background refresh of a similar match failed: %s", e)
+
+    task = asyncio.create_task(refresh())
+    _refresh_tasks.add(task)
+    task.add_done_callback(_refresh_tasks.discard)
+
+async def drain_refreshes(timeout: float):
+    """
+    Wait up to `timeout` seconds for background refreshes to finish, then cancel the rest
+    """
+    if not _refresh_tasks:
+        return
+    _, pending = await asyncio.wait(list(_refresh_tasks), timeout=timeout)
+    for task in pending:
+        task.cancel()
+
+def get_cache_stats() -> Dict[str, Any]:
+    stats = recommendation_cache.get_stats()
+    stats["inflight"] = len(_inflight_requests)
+    stats["refreshing"] = len(_refresh_tasks)
+    stats["similarity"] = similarity_index.get_stats()
+    return stats
+
+def get_llm_stats() -> Dict[str, Any]:
+    stats = model_router.get_stats()
+    stats["prompt_token_budget"] = PROMPT_TOKEN_BUDGET
+    stats["system_prompt_tokens"] = {"full": SYSTEM_PROMPT_TOKENS, "compact": COMPACT_SYSTEM_PROMPT_TOKENS}
+    return stats
+
+def get_material_recommendations(product_description: str, additional_requirements: Any = None, use_cache: bool = True, material_context: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Get material recommendations from Groq AI for a given product description
+    """
+    cache_key = get_cache_key(product_description, additional_requirements, material_context=material_context)
+    if use_cache:
+        cached = recommendation_cache.get(cache_key)
+        if cached is not None:
+            return cached
+    else:
+        recommendation_cache.record("bypassed")
+
+    require_api_key()
+    messages = build_messages(*fit_prompt(product_description, additional_requirements, material_context))
+    model = model_router.choose(request_complexity(product_description, additional_requirements, material_context))
+
+    with llm_failure():
+        try:
+            start = time.perf_counter()
+            with timed_stage("llm_generation"):
+                try:
+                    response = get_groq_client().chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        temperature=0.2,  # Lower temperature for more consistent responses
+                        timeout=LLM_TIMEOUT,
+                        **json_mode_kwargs()
+                    )
+                except Exception:
+                    model_router.record_error(model)
+                    raise
+            model_router.record(model, time.perf_counter() - start, response.usage)
+            response_content = completion_content(response)
+        except groq.BadRequestError as e:
+            # JSON mode rejects invalid output, but returns it so it can still be repaired
+            response_content = completion_content(error=e)
+            if response_content is None:
+                raise
+
+        recommendations = parse_generation(response_content)
+        if recommendations is None:
+            recommendations = fix_recommendations(response_content)
+
+    store_result(cache_key, recommendations, product_description, additional_requirements, material_context=material_context)
+    return recommendations
+
+async def _generate_recommendations_async(product_description: str, additional_requirements: Any = None, material_context: Optional[str] = None) -> Dict[str, Any]:
+    require_api_key()
+    messages = build_messages(*fit_prompt(product_description, additional_requirements, material_context))
+    complexity = request_complexity(product_description, additional_requirements, material_context)
+
+    with llm_failure():
+        # Wait for a free slot, then call Groq API on the pooled async client
+        try:
+            async with llm_slot():
+                response = await routed_completion(
+                    complexity,
+                    messages=messages,
+                    temperature=0.2,
+                    **json_mode_kwargs()
+                )
+            response_content = completion_content(response)
+        except groq.BadRequestError as e:
+            # JSON mode rejects invalid output, but returns it so it can still be repaired
+            response_content = completion_content(error=e)
+            if response_content is None:
+                raise
+
+        recommendations = parse_generation(response_content)
+        if recommendations is None:
+            recommendations = await fix_recommendations_async(response_content)
+        return recommendations
+
+async def routed_completion(complexity: float, **kwargs):
+    """
+    create_chat_completion on the model model_router picks for the request's complexity, called
+    while holding an llm_slot. Calls running past the model's p95 latency are hedged with a
+    duplicate in a second slot when LLM_HEDGE is on and a slot is free, the first response wins.
+    Streams are routed but not hedged, their caller records their latency.
+    """
+    model = model_router.choose(complexity)
+    stream = kwargs.get("stream", False)
+
+    async def hedge():
+        # The caller holds one slot, the duplicate needs its own
+        async with llm_slot():
+            return await create_chat_completion(model=model, **kwargs)
+
+    start = time.perf_counter()
+    try:
+        response, hedged, hedge_won = await hedged_call(
+            lambda: create_chat_completion(model=model, **kwargs),
+            None if stream else model_router.hedge_delay(model),
+            hedge=hedge,
+            # Only hedge when a slot is free, queueing for one would defeat the point
+            can_hedge=lambda: not llm_semaphore.locked()
+        )
+    except Exception:
+        model_router.record_error(model)
+        raise
+    if hedged:
+        model_router.record_hedge(model, hedge_won)
+    if not stream:
+        model_router.record(model, time.perf_counter() - start, response.usage)
+    return response
+
+async def json_completion(messages: list, schema: type, complexity: float = 0.0) -> Optional[Dict[str, Any]]:
+    """
+    One JSON-mode call on the async client, decoded and validated against schema. None when unparsable.
+    """
+    try:
+        async with llm_slot():
+            response = await routed_completion(
+                complexity,
+                messages=messages,
+                temperature=0.2,
+                **json_mode_kwargs()
+            )
+        response_content = completion_content(response)
+    except groq.BadRequestError as e:
+        response_content = completion_content(error=e)
+        if response_content is None:
+            raise
+
+    data, tier = decode_recommendations(response_content, schema)
+    PARSE_RESULTS.labels(tier or "failed").inc()
+    return data
+
+def build_component_prompt(product_description: str, additional_requirements: Any, component: Dict[str, Any], material_context: Optional[str] = None) -> str:
+    prompt = describe_product(product_description, additional_requirements, material_context)
+    prompt += f"\nComponent: {component['name']}"
+    if component.get("function"):
+        prompt += f"\nComponent function: {component['function']}"
+    return prompt
+
+def build_sections_prompt(product_description: str, additional_requirements: Any, materials: List[Dict[str, Any]]) -> str:
+    # Only names and applications, the sections don't need every property again
+    prompt = describe_product(product_description, additional_requirements)
+    prompt += "\nSelected materials:\n" + "\n".join(f"- {m['name']}: {m['application']}" for m in materials)
+    return prompt
+
+def merge_material(existing: Dict[str, Any], material: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Combine two recommendations of the same material for different components
+    """
+    merged = dict(existing)
+    if material["application"] and material["application"] not in existing["application"]:
+        merged["application"] = "; ".join(a for a in (existing["application"], material["application"]) if a)
+    merged["properties"] = {**material["properties"], **existing["properties"]}
+    return merged
+
+async def stream_fan_out_recommendations(product_description: str, additional_requirements: Any = None, material_context: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Fan-out generation: a short call splits the product into components, each component's
+    materials are generated concurrently, then materials are deduped and one last call writes the
+    text sections. Yields the same events as stream_material_recommendations, materials as their
+    component finishes.
+    """
+    with timed_stage("fan_out_decompose"):
+        decomposition = await json_completion([
+            {"role": "system", "content": DECOMPOSE_PROMPT},
+            {"role": "user", "content": describe_product(product_description, additional_requirements)}
+        ], DecompositionSchema)
+    components = (decomposition or {}).get("components", [])[:LLM_FAN_OUT_MAX_COMPONENTS]
+
+    if len(components) < 2:
+        # Nothing to parallelize
+        logger.info("Product decomposed into %d components, using a single generation", len(components))
+        recommendations = await _generate_recommendations_async(product_description, additional_requirements, material_context)
+        for material in recommendations["materials"]:
+            yield {"type": "material", "data": material}
+        for section in RECOMMENDATION_SECTIONS:
+            yield {"type": "section", "name": section, "data": recommendations.get(section, "")}
+        yield {"type": "complete", "data": recommendations}
+        return
+
+    tasks = [
+        asyncio.create_task(json_completion([
+            {"role": "system", "content": COMPONENT_PROMPT},
+            {"role": "user", "content": build_component_prompt(product_description, additional_requirements, component, material_context)}
+        ], RecommendationSchema))
+        for component in components
+    ]
+    # Normalized name -> material, in the order materials first appeared
+    materials: Dict[str, Dict[str, Any]] = {}
+    try:
+        with timed_stage("fan_out_components"):
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    result = await next_done
+                except Exception as e:
+                    logger.warning("Component generation failed: %s", e)
+                    continue
+                if result is None:
+                    logger.warning("Component generation returned no usable materials")
+                    continue
+                for material in result["materials"]:
+                    material = normalize_material(material)
+                    key = normalize_text(material["name"])
+                    if key in materials:
+                        materials[key] = merge_material(materials[key], material)
+                    else:
+                        materials[key] = material
+                        yield {"type": "material", "data": material}
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    if not materials:
+        raise Exception("No component produced usable material recommendations")
+
+    with timed_stage("fan_out_merge"):
+        sections = await json_completion([
+            {"role": "system", "content": SECTIONS_PROMPT},
+            {"role": "user", "content": build_sections_prompt(product_description, additional_requirements, list(materials.values()))}
+        ], SectionsSchema)
+    if sections is None:
+        raise Exception("Could not generate the recommendation sections")
+
+    recommendations = {"materials": list(materials.values())}
+    for section in RECOMMENDATION_SECTIONS:
+        recommendations[section] = sections[section]
+        yield {"type": "section", "name": section, "data": sections[section]}
+    yield {"type": "complete", "data": recommendations}
+
+async def _generate_fan_out_async(product_description: str, additional_requirements: Any = None, material_context: Optional[str] = None) -> Dict[str, Any]:
+    require_api_key()
+    with llm_failure():
+        async for event in stream_fan_out_recommendations(product_description, additional_requirements, material_context):
+            if event["type"] == "complete":
+                return event["data"]
+
+def compact_recommendations(recommendations: Dict[str, Any]) -> str:
+    """
+    Short text form of a result for the refine prompt: numbered materials with their properties,
+    and the start of each section
+    """
+    lines = ["Current materials:"]
+    for index, material in enumerate(recommendations.get("materials", [])):
+        properties = "; ".join(f"{key}: {value}" for key, value in (material.get("properties") or {}).items())
+        lines.append(f"{index}. {material.get('name', '')} ({material.get('application', '')}) {properties}")
+    lines.append("Current sections (start of each):")
+    for section in RECOMMENDATION_SECTIONS:
+        text = " ".join(str(recommendations.get(section) or "").split())
+        if len(text) > REFINE_SECTION_PREVIEW:
+            text = text[:REFINE_SECTION_PREVIEW].rsplit(" ", 1)[0] + " ..."
+        lines.append(f"- {section}: {text}")
+    return "\n".join(lines)
+
+def build_refine_prompt(product_description: str, additional_requirements: Any, recommendations: Dict[str, Any], requirement: str) -> str:
+    prompt = describe_product(product_description, additional_requirements)
+    prompt += f"\n\n{compact_recommendations(recommendations)}\n\nNew requirement: {requirement}"
+    return prompt
+
+def apply_refinement(recommendations: Dict[str, Any], patch: Dict[str, Any]) -> tuple:
+    """
+    Apply a RefinementSchema patch to a result. Returns (refined, changes), changes listing the
+    removed, replaced and added material names and the rewritten sections.
+    """
+    materials = list(recommendations.get("materials", []))
+    changes = {"removed": [], "replaced": [], "added": [], "sections": []}
+
+    replaced = set()
+    for key, material in patch.get("replace", {}).items():
+        index = int(key) if str(key).isdigit() else -1
+        if 0 <= index < len(materials):
+            changes["replaced"].append(materials[index]["name"])
+            materials[index] = normalize_material(material)
+            replaced.add(index)
+
+    removed = {index for index in patch.get("remove", []) if 0 <= index < len(materials) and index not in replaced}
+    changes["removed"] = [materials[index]["name"] for index in sorted(removed)]
+    materials = [material for index, material in enumerate(materials) if index not in removed]
+
+    for material in patch.get("add", []):
+        materials.append(normalize_material(material))
+        changes["added"].append(material["name"])
+
+    refined = {**recommendations, "materials": materials}
+    for section, text in patch.get("sections", {}).items():
+        if section in RECOMMENDATION_SECTIONS and text.strip():
+            refined[section] = text
+            changes["sections"].append(section)
+    return refined, changes
+
+async def refine_recommendations_async(product_description: str, additional_requirements: Any, recommendations: Dict[str, Any], requirement: str) -> tuple:
+    """
+    Patch a previous result for one new requirement. The model sees a compact form of the result
+    and answers with only the changed materials and sections, see apply_refinement.
+    Returns (refined, changes).
+    """
+    require_api_key()
+    with llm_failure("refinement"), timed_stage("refine_generation"):
+        patch = await json_completion([
+            {"role": "system", "content": REFINE_PROMPT},
+            {"role": "user", "content": build_refine_prompt(product_description, additional_requirements, recommendations, requirement)}
+        ], RefinementSchema, request_complexity(product_description, f"{additional_requirements or ''}\n{requirement}"))
+    if patch is None:
+        raise Exception("AI refinement failed: the response could not be parsed")
+    return apply_refinement(recommendations, patch)
+
+async def wait_for_other_process(cache_key: str) -> Optional[Dict[str, Any]]:
+    """
+    Result of an identical generation running in another server process, None when that process
+    stops without storing one (it failed, or its lease expired)
+    """
+    while recommendation_cache.is_claimed(cache_key):
+        await asyncio.sleep(LLM_DEDUP_POLL)
+    return recommendation_cache.get(cache_key, count_miss=False)
+
+async def get_material_recommendations_async(product_description: str, additional_requirements: Any = None, use_cache: bool = True, fan_out: Optional[bool] = None, material_context: Optional[str] = None, allow_similar: Optional[bool] = None) -> Dict[str, Any]:
+    """
+    Async variant of get_material_recommendations that does not block the event loop.
+
+    Concurrent identical requests are collapsed into a single upstream call, within this process
+    and, through a lease in the cache, across server processes. fan_out generates
+    per component in parallel (see stream_fan_out_recommendations), defaulting to LLM_FAN_OUT.
+    material_context is a screened shortlist (materials_db.format_shortlist) added to the prompt.
+    allow_similar (default SIMILAR_MATCHING) answers from the cached result of a near-duplicate
+    earlier request, flagged with a "similar_match" key, and regenerates this one in the background.
+    """
+    if fan_out is None:
+        fan_out = LLM_FAN_OUT
+    if allow_similar is None:
+        allow_similar = SIMILAR_MATCHING
+    cache_key = get_cache_key(product_description, additional_requirements, fan_out, material_context)
+    if use_cache:
+        cached = recommendation_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        similar = find_similar(product_description, additional_requirements, fan_out, material_context) if allow_similar else None
+        if similar is not None:
+            recommendations, match = similar
+            refresh_in_background(product_description, additional_requirements, fan_out, material_context)
+            return {**recommendations, "similar_match": match}
+
+        # Join an identical generation that is already running
+        inflight = _inflight_requests.get(cache_key)
+        while inflight is not None:
+            try:
+                recommendations = await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                # The leader's caller went away, take over unless this caller is cancelled too
+                if inflight.cancelled() and not asyncio.current_task().cancelling():
+                    inflight = _inflight_requests.get(cache_key)
+                    continue
+                raise
+            recommendation_cache.record("coalesced")
+            return copy.deepcopy(recommendations)
+    else:
+        recommendation_cache.record("bypassed")
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight_requests[cache_key] = future
+    owner = uuid.uuid4().hex
+    claimed = False
+    try:
+        # Wait for another server process generating the same request, or take over when it gives up
+        while use_cache and not recommendation_cache.claim(cache_key, owner, LLM_DEDUP_LEASE):
+            recommendations = await wait_for_other_process(cache_key)
+            if recommendations is not None:
+                recommendation_cache.record("coalesced")
+                future.set_result(copy.deepcopy(recommendations))
+                return recommendations
+        claimed = use_cache
+
+        generate = _generate_fan_out_async if fan_out else _generate_recommendations_async
+        recommendations = await generate(product_description, additional_requirements, material_context)
+        store_result(cache_key, recommendations, product_description, additional_requirements, fan_out, material_context)
+        future.set_result(copy.deepcopy(recommendations))
+        return recommendations
+    except BaseException as e:
+        if not future.done():
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                future.exception()  # Mark as retrieved when nobody else was waiting
+        raise
+    finally:
+        if claimed:
+            recommendation_cache.release(cache_key, owner)
+        if _inflight_requests.get(cache_key) is future:
+            del _inflight_requests[cache_key]
+
+async def stream_material_recommendations(product_description: str, additional_requirements: Any = None, use_cache: bool = True, fan_out: Optional[bool] = None, material_context: Optional[str] = None, allow_similar: Optional[bool] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Stream recommendation events as the LLM generates them.
+
+    Yields {"type": "material"} events as each material object closes, {"type": "section"} events as
+    each text section completes, and finally a {"type": "complete"} event carrying the full result.
+    A result served from a similar earlier request is preceded by a {"type": "similar_match"} event.
+    """
+    if fan_out is None:
+        fan_out = LLM_FAN_OUT
+    if allow_similar is None:
+        allow_similar = SIMILAR_MATCHING
+    cache_key = get_cache_key(product_description, additional_requirements, fan_out, material_context)
+    if use_cache:
+        cached = recommendation_cache.get(cache_key)
+        if cached is None and allow_similar:
+            similar = find_similar(product_description, additional_requirements, fan_out, material_context)
+            if similar is not None:
+                cached, match = similar
+                refresh_in_background(product_description, additional_requirements, fan_out, material_context)
+                yield {"type": "similar_match", "data": match}
+        if cached is not None:
+            for material in cached["materials"]:
+                yield {"type": "material", "data": material}
+            for section in RECOMMENDATION_SECTIONS:
+                yield {"type": "section", "name": section, "data": cached.get(section, "")}
+            yield {"type": "complete", "data": cached}
+            return
+    else:
+        recommendation_cache.record("bypassed")
+
+    require_api_key()
+    if fan_out:
+        with llm_failure():
+            async for event in stream_fan_out_recommendations(product_description, additional_requirements, material_context):
+                if event["type"] == "complete":
+                    store_result(cache_key, event["data"], product_description, additional_requirements, fan_out, material_context)
+                yield event
+        return
+
+    messages = build_messages(*fit_prompt(product_description, additional_requirements, material_context))
+    model = model_router.choose(request_complexity(product_description, additional_requirements, material_context))
+    parser = IncrementalRecommendationParser()
+    streamed_materials = []
+    streamed_sections = {}
+    events = asyncio.Queue()
+
+    async def read_stream():
+        # Runs apart from the client, so a slow reader doesn't hold the LLM slot
+        usage = None
+        try:
+            async with llm_slot():
+                start = time.perf_counter()
+                stream = await create_chat_completion(
+                    model=model,
+                    messages=messages,
+                    temperature=0.2,
+                    stream=True
+                )
+                async for chunk in stream:
+                    # Groq reports usage on the final chunk
+                    x_groq = getattr(chunk, "x_groq", None)
+                    if isinstance(x_groq, dict) and x_groq.get("usage"):
+                        usage = x_groq["usage"]
+                        record_usage(usage)
+                    if not chunk.choices or not chunk.choices[0].delta.content:
+                        continue
+                    for event in parser.feed(chunk.choices[0].delta.content):
+                        if event["type"] == "material":
+                            material = normalize_material(event["data"])
+                            streamed_materials.append(material)
+                            events.put_nowait({"type": "material", "data": material})
+                        elif event["name"] in RECOMMENDATION_SECTIONS:
+                            streamed_sections[event["name"]] = event["data"]
+                            events.put_nowait(event)
+                model_router.record(model, time.perf_counter() - start, usage)
+        except Exception:
+            model_router.record_error(model)
+            raise
+        finally:
+            events.put_nowait(None)
+
+    reader = asyncio.create_task(read_stream())
+    try:
+        with llm_failure():
+            while True:
+                event = await events.get()
+                if event is None:
+                    break
+                yield event
+            await reader
+    finally:
+        reader.cancel()
+
+    # Parse the full text once more, and emit whatever the incremental parser could not
+    recommendations = parse_generation(parser.text)
+    if recommendations is None:
+        recommendations = await fix_recommendations_async(parser.text)
+    if streamed_materials:
+        # The client already has these, the result must not contradict them
+        if is_fallback_result(recommendations):
+            # Only the streamed part could be parsed, the raw text is no section
+            recommendations["general_recommendations"] = ""
+            recommendations["truncated"] = True
+        recommendations["materials"] = streamed_materials
+    else:
+        for material in recommendations["materials"]:
+            yield {"type": "material", "data": material}
+    for section in RECOMMENDATION_SECTIONS:
+        if section in streamed_sections:
+            recommendations[section] = streamed_sections[section]
+        else:
+            yield {"type": "section", "name": section, "data": recommendations.get(section, "")}
+
+    store_result(cache_key, recommendations, product_description, additional_requirements, fan_out, material_context)
+    yield {"type": "complete", "data": recommendations}
@@ -0,0 +1,159 @@
+import os
+import copy
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+from app.db import thread_local_connection
+
+# Cache configuration
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(os.getcwd(), "cache"))
+CACHE_TTL = float(os.getenv("CACHE_TTL", str(24 * 3600)))  # Seconds before an entry expires
+CACHE_MEMORY_SIZE = int(os.getenv("CACHE_MEMORY_SIZE", "512"))  # Max entries kept in memory
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """
+    Lowercase and collapse whitespace so trivially different inputs share a key
+    """
+    if not text:
+        return ""
+    return " ".join(str(text).lower().split())
+
+
+def make_cache_key(product_description: str, additional_requirements: Any, model: str, system_prompt: str) -> str:
+    """
+    Build a cache key from the normalized request, the model name and a hash of the system prompt
+    """
+    prompt_hash = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+    key_data = json.dumps([
+        normalize_text(product_description),
+        normalize_text(additional_requirements),
+        model,
+        prompt_hash
+    ])
+    return hashlib.sha256(key_data.encode("utf-8")).hexdigest()
+
+
+CACHE_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS recommendations ("
+    "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL);"
+    "CREATE INDEX IF NOT EXISTS idx_recommendations_expires ON recommendations (expires_at);"
+    "CREATE TABLE IF NOT EXISTS generations ("
+    "key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL);"
+)
+
+
+class RecommendationCache:
+    """
+    Two-level recommendation cache: an in-memory LRU with TTL in front of a SQLite store.
+
+    The SQLite file runs in WAL mode so several workers can share it and it survives restarts.
+    It also holds leases on keys being generated, so server processes can wait for each other's
+    result instead of generating the same request twice.
+    """
+
+    def __init__(self, path: str, ttl: float = CACHE_TTL, memory_size: int = CACHE_MEMORY_SIZE):
+        self.path = path
+        self.ttl = ttl
+        self.memory_size = memory_size
+        self._memory = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0, "bypassed": 0, "similar": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        return thread_local_connection(self.path, self._local, CACHE_SCHEMA)
+
+    def _remember(self, key: str, value: Dict[str, Any], expires_at: float):
+        with self._lock:
+            self._memory[key] = (expires_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def get(self, key: str, count_miss: bool = True) -> Optional[Dict[str, Any]]:
+        now = time.time()
+
+        # In-memory LRU first
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return copy.deepcopy(entry[1])
+                del self._memory[key]
+
+        # Then the shared on-disk store
+        row = self._connect().execute(
+            "SELECT value, expires_at FROM recommendations WHERE key = ?", (key,)
+        ).fetchone()
+        if row is not None and row[1] > now:
+            value = json.loads(row[0])
+            self._remember(key, copy.deepcopy(value), row[1])
+            with self._lock:
+                self.stats["disk_hits"] += 1
+            return value
+
+        if count_miss:
+            with self._lock:
+                self.stats["misses"] += 1
+        return None
+
+    def set(self, key: str, value: Dict[str, Any]):
+        expires_at = time.time() + self.ttl
+        self._remember(key, copy.deepcopy(value), expires_at)
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO recommendations (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value), expires_at)
+        )
+        conn.execute("DELETE FROM recommendations WHERE expires_at <= ?", (time.time(),))
+        conn.commit()
+
+    def claim(self, key: str, owner: str, lease: float) -> bool:
+        """
+        Take the lease on generating `key` for `lease` seconds. False while another owner holds it.
+        """
+        now = time.time()
+        conn = self._connect()
+        claimed = conn.execute(
+            "INSERT INTO generations (key, owner, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+            "WHERE generations.expires_at <= ?",
+            (key, owner, now + lease, now)
+        ).rowcount
+        conn.commit()
+        return claimed == 1
+
+    def is_claimed(self, key: str) -> bool:
+        row = self._connect().execute(
+            "SELECT 1 FROM generations WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row is not None
+
+    def release(self, key: str, owner: str):
+        conn = self._connect()
+        conn.execute("DELETE FROM generations WHERE key = ? AND owner = ?", (key, owner))
+        conn.commit()
+
+    def record(self, stat: str):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self._memory)
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        lookups = hits + stats["misses"]
+        stats["hits"] = hits
+        stats["hit_rate"] = round(hits / lookups, 4) if lookups else 0.0
+        return stats
+
+
+recommendation_cache = RecommendationCache(os.path.join(CACHE_DIR, "recommendations.db"))
@@ -1,10 +1,14 @@
 import typer
 import os
+import sys
 import json
-import requests
+import tempfile
+import importlib.util
 from rich.console import Console
 from rich.table import Table
 from rich.panel import Panel
+from rich.live import Live
+from rich.spinner import Spinner
 from rich import print as rprint
 from typing import Optional
 from dotenv import load_dotenv
@@ -12,6 +16,7 @@ from dotenv import load_dotenv
 # Initialize Typer app
 app = typer.Typer(help="MaterialMind - AI-powered material selection advisor for mechanical engineers")
 console = Console()
+err_console = Console(stderr=True)  # Keeps progress off stdout when results are printed there
 
 # Load environment variables
 load_dotenv()
@@ -19,75 +24,313 @@ load_dotenv()
 # Define the API URL
 API_URL = os.getenv("API_URL", "http://localhost:8000")
 
+# Production server defaults
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", str(os.cpu_count() or 1)))  # Server processes
+SERVE_GRACEFUL_TIMEOUT = int(os.getenv("SERVE_GRACEFUL_TIMEOUT", "30"))  # Seconds a stopping worker gets to drain
+
+_session = None
+
+def get_session():
+    """
+    Keep-alive HTTP session shared by all API calls of this process
+    """
+    global _session
+    if _session is None:
+        # Imported here, --direct runs never need it
+        import requests
+        _session = requests.Session()
+    return _session
+
+def create_materials_table() -> Table:
+    table = Table(title="Recommended Materials")
+    table.add_column("Material", style="cyan")
+    table.add_column("Properties", style="green")
+    table.add_column("Application", style="yellow")
+    table.add_column("Rationale", style="blue")
+    return table
+
+def add_material_row(table: Table, material: dict):
+    # Format properties as a string
+    properties_str = "\n".join([f"{k}: {v}" for k, v in material["properties"].items()])
+    
+    table.add_row(
+        material["name"],
+        properties_str,
+        material["application"],
+        material["rationale"]
+    )
+
+def print_pdf_path(pdf_path: Optional[str]):
+    if pdf_path:
+        console.print(f"\n[bold green]PDF Report generated:[/bold green] {os.path.join('outputs', pdf_path)}")
+
+def print_similar_match(match: Optional[dict]):
+    if match:
+        console.print(f"[dim]Served from a similar earlier request ({match['score']:.0%} match): {match['product_description']}[/dim]")
+
+def stream_recommendations(data: dict):
+    """Render table rows as the API streams materials back"""
+    response = get_session().post(f"{API_URL}/api/recommend-materials/stream", json=data, stream=True)
+    if response.status_code != 200:
+        console.print(f"[bold red]Error:[/bold red] {response.status_code} - {response.text}")
+        return
+
+    table = create_materials_table()
+    general_recommendations = None
+    with Live(Spinner("dots", text="[bold green]Consulting AI for material recommendations..."), console=console, refresh_per_second=8) as live:
+        for line in response.iter_lines():
+            if not line:
+                continue
+            event = json.loads(line)
+
+            if event["type"] == "start":
+                console.print(Panel.fit(
+                    f"[bold]Product:[/bold] {event['product_description']}",
+                    title="MaterialMind Results",
+                    border_style="green"
+                ))
+            elif event["type"] == "similar_match":
+                print_similar_match(event["data"])
+            elif event["type"] == "material":
+                add_material_row(table, event["data"])
+                live.update(table)
+            elif event["type"] == "section" and event["name"] == "general_recommendations":
+                general_recommendations = event["data"]
+            elif event["type"] == "done":
+                live.update(table)
+                live.stop()
+                if general_recommendations:
+                    # Display general recommendations
+                    console.print(Panel(
+                        general_recommendations,
+                        title="General Recommendations",
+                        border_style="blue"
+                    ))
+                print_pdf_path(event.get("pdf_path"))
+            elif event["type"] == "error":
+                live.stop()
+                console.print(f"[bold red]Error:[/bold red] {event['detail']}")
+
+def print_result(result: dict):
+    console.print(Panel.fit(
+        f"[bold]Product:[/bold] {result['product_description']}",
+        title="MaterialMind Results",
+        border_style="green"
+    ))
+    print_similar_match(result.get("similar_match"))
+
+    # Create a table for the materials
+    table = create_materials_table()
+    for material in result["materials"]:
+        add_material_row(table, material)
+    console.print(table)
+
+    # Display general recommendations
+    console.print(Panel(
+        result["recommendations"],
+        title="General Recommendations",
+        border_style="blue"
+    ))
+
+    # Display PDF path
+    print_pdf_path(result.get("pdf_path"))
+
+def fetch_recommendations(data: dict) -> dict:
+    """Get a result from the API server"""
+    response = get_session().post(f"{API_URL}/api/recommend-materials", json=data)
+    if response.status_code != 200:
+        raise Exception(f"{response.status_code} - {response.text}")
+    return response.json()
+
+def generate_direct(data: dict) -> dict:
+    """
+    Generate a result in this process, without an API server: the LLM call and the PDF report.
+    The report and the history entry go to the same stores the API uses, so a server sharing them
+    can serve and refine the result. Returns the same shape as the API.
+    """
+    # Imported here, so server-mode runs don't pay for the AI service and PDF imports
+    import uuid
+    import asyncio
+    from app.ai_service import get_material_recommendations_async, is_incomplete_result, drain_refreshes, close_clients
+    from app.report_store import report_store, content_hash, content_filename
+    from app.responses import build_response
+
+    async def generate():
+        try:
+            return await get_material_recommendations_async(
+                data["description"],
+                data["additional_requirements"],
+                fan_out=bool(data.get("fan_out")),
+                allow_similar=data.get("allow_similar")
+            )
+        finally:
+            # A one-shot run doesn't wait for the background refresh of a similar match
+            await drain_refreshes(0)
+            # The async client is bound to this event loop, close it before asyncio.run closes the loop
+            await close_clients()
+
+    recommendations = asyncio.run(generate())
+    similar_match = recommendations.pop("similar_match", None)
+
+    # Reports are named by content, a repeated (cached) result reuses its PDF
+    report_hash = content_hash(recommendations)
+    pdf_filename = content_filename(report_hash)
+    if not report_store.has_blob(report_hash):
+        from app.pdf_service import generate_pdf
+        if generate_pdf(recommendations, pdf_filename) is None:
+            raise Exception("PDF rendering failed")
+        report_store.add_blob(report_hash)
+    report_id = str(uuid.uuid4())
+    report_store.add_report(report_id, report_hash)
+
+    if not is_incomplete_result(recommendations):
+        from app.history import history_store
+        try:
+            history_store.add(report_id, data["description"], data["additional_requirements"], recommendations)
+        except Exception as e:
+            # History is a side record, never fail the request over it
+            err_console.print(f"[yellow]Could not store the result in history: {str(e)}[/yellow]")
+
+    return build_response(data["description"], recommendations, report_id, pdf_filename, similar_match)
+
 @app.command("recommend")
 def recommend_materials(
     description: str = typer.Argument(..., help="Description of the product you want to build"),
-    requirements: Optional[str] = typer.Option(None, "--req", "-r", help="Additional requirements or constraints")
+    requirements: Optional[str] = typer.Option(None, "--req", "-r", help="Additional requirements or constraints"),
+    stream: bool = typer.Option(True, "--stream/--no-stream", help="Show materials as they are generated"),
+    fan_out: bool = typer.Option(False, "--fan-out", help="Generate each component's materials in parallel (large assemblies)"),
+    similar: Optional[bool] = typer.Option(None, "--similar/--exact", help="Allow or forbid reusing the result of a similar earlier request (default: the server's SIMILAR_MATCHING)"),
+    direct: bool = typer.Option(False, "--direct", help="Generate in this process instead of calling the API server"),
+    as_json: bool = typer.Option(False, "--json", help="Print the result as one JSON object, for scripts")
 ):
-    with console.status("[bold green]Consulting AI for material recommendations..."):
+    # Prepare request data
+    data = {
+        "description": description,
+        "additional_requirements": requirements
+    }
+    if fan_out:
+        data["fan_out"] = True
+    if similar is not None:
+        data["allow_similar"] = similar
+
+    if as_json:
+        # No tables or spinners: the result on stdout, errors on stderr and in the exit code
         try:
-            # Prepare request data
-            data = {
-                "description": description,
-                "additional_requirements": requirements
-            }
-            
-            # Make API request
-            response = requests.post(f"{API_URL}/api/recommend-materials", json=data)
-            
-            if response.status_code == 200:
-                result = response.json()
-                
-                # Display the results
-                console.print(Panel.fit(
-                    f"[bold]Product:[/bold] {result['product_description']}",
-                    title="MaterialMind Results",
-                    border_style="green"
-                ))
+            result = generate_direct(data) if direct else fetch_recommendations(data)
+        except Exception as e:
+            err_console.print(f"[bold red]Error:[/bold red] {str(e)}")
+            raise typer.Exit(code=1)
+        print(json.dumps(result, ensure_ascii=False))
+        return
 
-                print("API RESULT RECIEVED IN CLI.PY IS:   ", result)
-                
-                # Create a table for the materials
-                table = Table(title="Recommended Materials")
-                table.add_column("Material", style="cyan")
-                table.add_column("Properties", style="green")
-                table.add_column("Application", style="yellow")
-                table.add_column("Rationale", style="blue")
-                
-                for material in result["materials"]:
-                    # Format properties as a string
-                    properties_str = "\n".join([f"{k}: {v}" for k, v in material["properties"].items()])
-                    
-                    table.add_row(
-                        material["name"],
-                        properties_str,
-                        material["application"],
-                        material["rationale"]
-                    )
-                
-                console.print(table)
-                
-                # Display general recommendations
-                console.print(Panel(
-                    result["recommendations"],
-                    title="General Recommendations",
-                    border_style="blue"
-                ))
-                
-                # Display PDF path
-                if result.get("pdf_path"):
-                    console.print(f"\n[bold green]PDF Report generated:[/bold green] {os.path.join('outputs', result['pdf_path'])}")
-            else:
-                console.print(f"[bold red]Error:[/bold red] {response.status_code} - {response.text}")
-        
+    if stream and not direct:
+        try:
+            stream_recommendations(data)
+        except Exception as e:
+            console.print(f"[bold red]Error:[/bold red] {str(e)}")
+        return
+
+    with console.status("[bold green]Consulting AI for material recommendations..."):
+        try:
+            result = generate_direct(data) if direct else fetch_recommendations(data)
         except Exception as e:
             console.print(f"[bold red]Error:[/bold red] {str(e)}")
+            return
+    print_result(result)
+
+@app.command("batch")
+def batch_recommend(
+    input_file: str = typer.Argument(..., help="JSONL file with one product request per line"),
+    output_file: Optional[str] = typer.Option(None, "--output", "-o", help="Write JSONL results here instead of stdout"),
+    concurrency: Optional[int] = typer.Option(None, "--concurrency", "-c", help="Max requests generated at once")
+):
+    """Get recommendations for every product request in a JSONL file"""
+    params = {"concurrency": concurrency} if concurrency else None
+    ok_count = 0
+    error_count = 0
+    try:
+        with open(input_file, "rb") as f:
+            response = get_session().post(
+                f"{API_URL}/api/recommend-materials/batch",
+                data=f,
+                params=params,
+                headers={"Content-Type": "application/x-ndjson"},
+                stream=True
+            )
+            if response.status_code != 200:
+                err_console.print(f"[bold red]Error:[/bold red] {response.status_code} - {response.text}")
+                raise typer.Exit(code=1)
+
+            out = open(output_file, "w") if output_file else None
+            try:
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    item = json.loads(line)
+                    if item["status"] == "ok":
+                        ok_count += 1
+                    else:
+                        error_count += 1
+                        err_console.print(f"[bold red]Item {item['index']} failed:[/bold red] {item['error']}")
+                    if out:
+                        out.write(line.decode("utf-8") + "\n")
+                        out.flush()
+                    else:
+                        print(line.decode("utf-8"), flush=True)
+            finally:
+                if out:
+                    out.close()
+    except typer.Exit:
+        raise
+    except Exception as e:
+        err_console.print(f"[bold red]Error:[/bold red] {str(e)}")
+        raise typer.Exit(code=1)
+
+    err_console.print(f"[bold green]Batch finished:[/bold green] {ok_count} succeeded, {error_count} failed")
+
+def server_command(host: str, port: int, workers: int, reload: bool, graceful_timeout: int) -> list:
+    """
+    Command line for the API server: gunicorn with uvicorn workers when installed, else uvicorn
+    """
+    if reload:
+        # Development: one process with a file watcher
+        return ["uvicorn", "app.main:app", "--host", host, "--port", str(port), "--reload"]
+    if importlib.util.find_spec("gunicorn") is not None:
+        # --preload imports the app once in the master, workers fork from it
+        return [
+            "gunicorn", "app.main:app",
+            "--worker-class", "uvicorn.workers.UvicornWorker",
+            "--workers", str(workers),
+            "--bind", f"{host}:{port}",
+            "--preload",
+            "--graceful-timeout", str(graceful_timeout)
+        ]
+    return [
+        "uvicorn", "app.main:app", "--host", host, "--port", str(port),
+        "--workers", str(workers),
+        "--timeout-graceful-shutdown", str(graceful_timeout)
+    ]
 
 @app.command("serve")
-def serve_api():
+def serve_api(
+    host: str = typer.Option("0.0.0.0", "--host", help="Address to bind"),
+    port: int = typer.Option(8000, "--port", "-p", help="Port to bind"),
+    workers: int = typer.Option(SERVE_WORKERS, "--workers", "-w", help="Server processes"),
+    reload: bool = typer.Option(False, "--reload", help="Development mode: one process, restart on code changes"),
+    graceful_timeout: int = typer.Option(SERVE_GRACEFUL_TIMEOUT, "--graceful-timeout", help="Seconds a stopping worker gets to finish in-flight work")
+):
     """Start the MaterialMind API server"""
-    console.print("[bold green]Starting MaterialMind API server...[/bold green]")
-    os.system("uvicorn app.main:app --host 0.0.0.0 --port 8000 --reload")
+    command = server_command(host, port, max(1, workers), reload, graceful_timeout)
+    if workers > 1 and not reload and not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # Workers write their metrics to files in a fresh directory, so /metrics covers all of them
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="materialmind-metrics-")
+    mode = "development mode" if reload else f"{max(1, workers)} workers via {command[0]}"
+    if not reload and command[0] == "uvicorn":
+        console.print("[bold yellow]Warning:[/bold yellow] gunicorn is not installed, so the app is not preloaded and every worker imports it on its own. Install it with `pip install -r requirements.txt` (not available on Windows).")
+    console.print(f"[bold green]Starting MaterialMind API server ({mode})...[/bold green]")
+    sys.stdout.flush()
+    # Replace this process, so the server gets signals directly and its workers never import the CLI
+    os.execv(sys.executable, [sys.executable, "-m", *command])
 
 if __name__ == "__main__":
     app()
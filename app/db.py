@@ -0,0 +1,27 @@
+import os
+import sqlite3
+import threading
+from typing import Optional
+
+
+def thread_local_connection(path: str, local: threading.local, schema: str, row_factory: Optional[type] = None) -> sqlite3.Connection:
+    """
+    This thread's connection to the SQLite database at `path`, kept in `local`.
+
+    One connection per thread, sqlite3 connections can't be shared across threads, nor with the
+    parent of a forked worker when the app is preloaded. Connections use WAL mode so readers
+    don't block the writer of another process. The directory and `schema` (CREATE ... IF NOT
+    EXISTS statements) are created with the first connection, so stores touch the disk on first use.
+    """
+    conn = getattr(local, "conn", None)
+    if conn is None or local.pid != os.getpid():
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = sqlite3.connect(path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(schema)
+        if row_factory is not None:
+            conn.row_factory = row_factory
+        local.conn = conn
+        local.pid = os.getpid()
+    return conn
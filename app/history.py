@@ -0,0 +1,240 @@
+import os
+import re
+import json
+import time
+import heapq
+import sqlite3
+import threading
+from typing import Dict, Any, List, Optional, Iterable
+from app.units import parse_properties
+from app.db import thread_local_connection
+
+# Recommendation history, kept for cross-run queries
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", os.path.join(os.getcwd(), "history", "history.db"))
+HISTORY_MAX_LIMIT = int(os.getenv("HISTORY_MAX_LIMIT", "500"))  # Max rows per query
+HISTORY_PREFIX_NAMES = int(os.getenv("HISTORY_PREFIX_NAMES", "32"))  # Distinct names a prefix query merges
+
+# Spellings that should match each other in name queries
+NAME_SYNONYMS = {"aluminum": "aluminium", "sulfide": "sulphide", "fiber": "fibre"}
+
+
+def normalize_name(name: Optional[str]) -> str:
+    """
+    Material name as indexed: "Aluminum 6061-T6" -> "aluminium 6061 t6"
+    """
+    words = re.sub(r"[^\w.%]+", " ", str(name or "").lower()).split()
+    return " ".join(NAME_SYNONYMS.get(word, word) for word in words)
+
+
+def prefix_bounds(prefix: str) -> tuple:
+    # A range rather than LIKE 'x%', which can't use the index with the default case-insensitive LIKE
+    return prefix, prefix + "\uffff"
+
+
+HISTORY_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS recommendations ("
+    "id INTEGER PRIMARY KEY, request_id TEXT NOT NULL UNIQUE, created_at REAL NOT NULL, "
+    "product_description TEXT NOT NULL, additional_requirements TEXT, data TEXT NOT NULL);"
+    "CREATE TABLE IF NOT EXISTS materials ("
+    "id INTEGER PRIMARY KEY, recommendation_id INTEGER NOT NULL, position INTEGER NOT NULL, "
+    "name TEXT NOT NULL, name_norm TEXT NOT NULL);"
+    "CREATE INDEX IF NOT EXISTS idx_materials_name ON materials (name_norm);"
+    "CREATE TABLE IF NOT EXISTS material_names (name_norm TEXT PRIMARY KEY) WITHOUT ROWID;"
+    "CREATE TABLE IF NOT EXISTS properties ("
+    "material_id INTEGER NOT NULL, prop_key TEXT NOT NULL, name_norm TEXT NOT NULL, "
+    "name TEXT NOT NULL, raw_value TEXT, value_si REAL, min_si REAL, max_si REAL, unit TEXT, "
+    "PRIMARY KEY (material_id, prop_key)) WITHOUT ROWID;"
+    "CREATE INDEX IF NOT EXISTS idx_properties_name_value ON properties (prop_key, name_norm, value_si);"
+    "CREATE INDEX IF NOT EXISTS idx_properties_value ON properties (prop_key, value_si);"
+)
+
+
+class HistoryStore:
+    """
+    SQLite store of past recommendations with every material property parsed into SI units.
+
+    `recommendations` holds one row per request with the full result, `materials` one row per
+    suggested material and `properties` one row per parsed property. The normalized material name
+    is copied into `properties`, so "material X sorted by property Y" reads one index range in order.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        return thread_local_connection(self.path, self._local, HISTORY_SCHEMA, sqlite3.Row)
+
+    def add(self, request_id: str, product_description: str, additional_requirements: Optional[str],
+            recommendations: Dict[str, Any], created_at: Optional[float] = None):
+        """
+        Store a recommendation with its materials and parsed properties
+        """
+        self.add_many([(request_id, product_description, additional_requirements, recommendations, created_at)])
+
+    def add_many(self, entries: Iterable[tuple]):
+        """
+        Store (request_id, product_description, additional_requirements, recommendations, created_at)
+        entries in one transaction
+        """
+        conn = self._connect()
+        with conn:
+            for request_id, product_description, additional_requirements, recommendations, created_at in entries:
+                recommendation_id = conn.execute(
+                    "INSERT INTO recommendations "
+                    "(request_id, created_at, product_description, additional_requirements, data) VALUES (?, ?, ?, ?, ?)",
+                    (request_id, time.time() if created_at is None else created_at, product_description,
+                     additional_requirements, json.dumps(recommendations, ensure_ascii=False))
+                ).lastrowid
+                rows = []
+                for position, material in enumerate(recommendations.get("materials", [])):
+                    name_norm = normalize_name(material.get("name"))
+                    material_id = conn.execute(
+                        "INSERT INTO materials (recommendation_id, position, name, name_norm) VALUES (?, ?, ?, ?)",
+                        (recommendation_id, position, material.get("name") or "", name_norm)
+                    ).lastrowid
+                    conn.execute("INSERT OR IGNORE INTO material_names (name_norm) VALUES (?)", (name_norm,))
+                    properties = material.get("properties") or {}
+                    for name, parsed in parse_properties(properties).items():
+                        rows.append((
+                            material_id, parsed["key"], name_norm, name, str(properties[name]),
+                            parsed["value"], parsed["min"], parsed["max"], parsed["unit"]
+                        ))
+                # Two names for the same property ("UTS", "Tensile Strength"): keep the first
+                conn.executemany(
+                    "INSERT OR IGNORE INTO properties "
+                    "(material_id, prop_key, name_norm, name, raw_value, value_si, min_si, max_si, unit) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+
+    def matching_names(self, prefix: str, limit: int) -> List[str]:
+        rows = self._connect().execute(
+            "SELECT name_norm FROM material_names WHERE name_norm >= ? AND name_norm < ? LIMIT ?",
+            (*prefix_bounds(prefix), limit)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def query_materials(self, name: Optional[str] = None, exact: bool = False, sort_by: Optional[str] = None,
+                        order: str = "desc", min_value: Optional[float] = None, max_value: Optional[float] = None,
+                        limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        """
+        Past suggestions of a material, newest first or sorted by a property's SI value.
+
+        `name` matches normalized names by prefix ("aluminium 6061" matches "Aluminum 6061-T6"), or
+        exactly with exact=True. With `sort_by` only materials that state that property are returned,
+        optionally within [min_value, max_value] in SI units.
+        """
+        if order not in ("asc", "desc"):
+            raise ValueError("order must be 'asc' or 'desc'")
+        if sort_by is None and (min_value is not None or max_value is not None):
+            raise ValueError("min_value and max_value need sort_by")
+        limit = max(0, min(limit, HISTORY_MAX_LIMIT))
+        offset = max(0, offset)
+
+        if not name:
+            rows = self._select(None, sort_by, order, min_value, max_value, limit, offset)
+        else:
+            name_norm = normalize_name(name)
+            names = [name_norm] if exact else self.matching_names(name_norm, HISTORY_PREFIX_NAMES + 1)
+            if len(names) > HISTORY_PREFIX_NAMES:
+                # Broad prefix, let SQLite sort the whole range
+                rows = self._select(prefix_bounds(name_norm), sort_by, order, min_value, max_value, limit, offset)
+            else:
+                # Each name is already ordered in its index, merge the top rows of each
+                per_name = [self._select(n, sort_by, order, min_value, max_value, offset + limit, 0) for n in names]
+                sort_key = (lambda row: row["value_si"]) if sort_by else (lambda row: row["material_id"])
+                merged = heapq.merge(*per_name, key=sort_key, reverse=order == "desc")
+                rows = list(merged)[offset:offset + limit]
+        return [self._row_result(row, sort_by) for row in rows]
+
+    def _select(self, name, sort_by: Optional[str], order: str, min_value: Optional[float],
+                max_value: Optional[float], limit: int, offset: int) -> list:
+        """
+        One ordered query, `name` being None, an exact normalized name or a (low, high) range
+        """
+        conditions, params = [], []
+        if sort_by is None:
+            alias = "m"
+            sql = (
+                "SELECT m.id AS material_id, r.request_id, r.created_at, r.product_description, m.name, m.position "
+                "FROM materials m JOIN recommendations r ON r.id = m.recommendation_id"
+            )
+            # Material ids follow insertion order, so this is newest first without a timestamp index
+            order_by = f"m.id {order}"
+        else:
+            alias = "p"
+            sql = (
+                "SELECT m.id AS material_id, r.request_id, r.created_at, r.product_description, m.name, m.position, "
+                "p.name AS prop_name, p.raw_value, p.value_si, p.min_si, p.max_si, p.unit "
+                "FROM properties p JOIN materials m ON m.id = p.material_id "
+                "JOIN recommendations r ON r.id = m.recommendation_id"
+            )
+            conditions.append("p.prop_key = ?")
+            params.append(sort_by)
+            conditions.append("p.value_si IS NOT NULL")
+            if min_value is not None:
+                conditions.append("p.value_si >= ?")
+                params.append(min_value)
+            if max_value is not None:
+                conditions.append("p.value_si <= ?")
+                params.append(max_value)
+            order_by = f"p.value_si {order}"
+
+        if isinstance(name, tuple):
+            conditions.append(f"{alias}.name_norm >= ? AND {alias}.name_norm < ?")
+            params.extend(name)
+        elif name is not None:
+            conditions.append(f"{alias}.name_norm = ?")
+            params.append(name)
+
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += f" ORDER BY {order_by} LIMIT ? OFFSET ?"
+        return self._connect().execute(sql, params + [limit, offset]).fetchall()
+
+    @staticmethod
+    def _row_result(row: sqlite3.Row, sort_by: Optional[str]) -> Dict[str, Any]:
+        result = {
+            "request_id": row["request_id"],
+            "created_at": row["created_at"],
+            "product_description": row["product_description"],
+            "material": row["name"],
+            "position": row["position"]
+        }
+        if sort_by is not None:
+            result["property"] = {
+                "key": sort_by,
+                "name": row["prop_name"],
+                "value": row["raw_value"],
+                "value_si": row["value_si"],
+                "min_si": row["min_si"],
+                "max_si": row["max_si"],
+                "unit": row["unit"]
+            }
+        return result
+
+    def get_recommendation(self, request_id: str, with_si: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        A stored recommendation, with the SI values of its material properties unless with_si=False
+        """
+        row = self._connect().execute(
+            "SELECT request_id, created_at, product_description, additional_requirements, data "
+            "FROM recommendations WHERE request_id = ?", (request_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        data = json.loads(row["data"])
+        if with_si:
+            for material in data.get("materials", []):
+                material["properties_si"] = parse_properties(material.get("properties") or {})
+        return {
+            "request_id": row["request_id"],
+            "created_at": row["created_at"],
+            "product_description": row["product_description"],
+            "additional_requirements": row["additional_requirements"],
+            "recommendations": data
+        }
+
+
+history_store = HistoryStore(HISTORY_DB_PATH)
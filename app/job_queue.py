@@ -0,0 +1,343 @@
+import os
+import math
+import json
+import time
+import uuid
+import asyncio
+import logging
+import sqlite3
+import threading
+from typing import Dict, Any, List, Optional, Callable, Awaitable
+from app.metrics import STAGE_LATENCY, register_queue_depth
+from app.db import thread_local_connection
+
+logger = logging.getLogger(__name__)
+
+# Job queue configuration
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", os.path.join(os.getcwd(), "jobs", "jobs.db"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))  # Jobs run at once per server process
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "200"))  # Queued jobs before new ones get a 429
+JOB_CLIENT_MAX = int(os.getenv("JOB_CLIENT_MAX", "50"))  # Queued jobs per client before a 429
+JOB_LEASE = float(os.getenv("JOB_LEASE", "60"))  # Seconds a running job stays claimed without a heartbeat
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))  # Claims before a job that keeps dying is failed
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", str(24 * 3600)))  # Seconds finished jobs are kept
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))  # Seconds between checks for jobs queued by other processes
+
+FINISHED_STATUSES = ("done", "failed")
+
+# With the pid, identifies this process's claims so a shutdown can hand its running jobs back
+BOOT_ID = uuid.uuid4().hex
+
+
+def current_worker_id() -> str:
+    # The pid keeps forked workers of a preloaded app apart, they share BOOT_ID
+    return f"{BOOT_ID}-{os.getpid()}"
+
+
+class QueueFullError(Exception):
+    """
+    Raised by JobQueue.submit when the queue, or the client's share of it, is full
+    """
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+JOB_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS jobs ("
+    "seq INTEGER PRIMARY KEY, job_id TEXT NOT NULL UNIQUE, client_id TEXT NOT NULL, "
+    "status TEXT NOT NULL, request TEXT NOT NULL, result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+    "worker_id TEXT, lease_until REAL, created_at REAL NOT NULL, started_at REAL, finished_at REAL);"
+    "CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, client_id, seq);"
+    "CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (finished_at);"
+    "CREATE TABLE IF NOT EXISTS clients (client_id TEXT PRIMARY KEY, last_served INTEGER NOT NULL) WITHOUT ROWID;"
+)
+
+
+class JobQueue:
+    """
+    Persistent job queue in SQLite, shared by all server processes and kept across restarts.
+
+    Workers claim jobs round-robin across clients: `clients.last_served` records when each client
+    last had a job claimed, and the next claim takes the oldest job of the least recently served
+    client. A client queueing a large batch then waits its turn instead of delaying everyone else.
+    Running jobs hold a lease renewed by their process, so jobs of a crashed process run again.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.average_seconds = 10.0  # Running estimate of job duration, for Retry-After
+
+    def _connect(self) -> sqlite3.Connection:
+        return thread_local_connection(self.path, self._local, JOB_SCHEMA, sqlite3.Row)
+
+    def retry_after(self, rounds: int = 1) -> int:
+        """
+        Seconds until a queue slot is likely free: `rounds` jobs per worker at the average duration
+        """
+        with self._lock:
+            average = self.average_seconds
+        return max(1, math.ceil(rounds * average / max(1, JOB_WORKERS)))
+
+    def submit(self, client_id: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Queue a request for a client, raising QueueFullError when the queue or the client's share is full
+        """
+        job_id = str(uuid.uuid4())
+        conn = self._connect()
+        with conn:
+            # Count and insert in one write transaction so processes can't overfill the queue together
+            conn.execute("BEGIN IMMEDIATE")
+            depth = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+            if depth >= JOB_QUEUE_MAX:
+                raise QueueFullError("Job queue is full", self.retry_after())
+            client_depth = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND client_id = ?", (client_id,)
+            ).fetchone()[0]
+            if client_depth >= JOB_CLIENT_MAX:
+                # The client gets one job per round across the clients with queued work
+                clients = conn.execute("SELECT COUNT(DISTINCT client_id) FROM jobs WHERE status = 'queued'").fetchone()[0]
+                raise QueueFullError("Too many queued jobs for this client", self.retry_after(clients))
+            conn.execute(
+                "INSERT INTO jobs (job_id, client_id, status, request, created_at) VALUES (?, ?, 'queued', ?, ?)",
+                (job_id, client_id, json.dumps(request, ensure_ascii=False), time.time())
+            )
+        return {"job_id": job_id, "status": "queued", "queue_depth": depth + 1}
+
+    def claim(self, worker_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Take the next job, fairly across clients, and mark it running. None when nothing is queued.
+        """
+        worker_id = worker_id or current_worker_id()
+        conn = self._connect()
+        now = time.time()
+        with conn:
+            # Jobs whose process stopped renewing the lease go back in the queue, or fail for good
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Job was interrupted too many times', finished_at = ? "
+                "WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                (now, now, JOB_MAX_ATTEMPTS)
+            )
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', worker_id = NULL WHERE status = 'running' AND lease_until < ?",
+                (now,)
+            )
+
+        while True:
+            row = conn.execute(
+                "SELECT q.first_seq FROM ("
+                "SELECT client_id, MIN(seq) AS first_seq FROM jobs WHERE status = 'queued' GROUP BY client_id"
+                ") q LEFT JOIN clients c ON c.client_id = q.client_id "
+                "ORDER BY COALESCE(c.last_served, 0), q.first_seq LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            with conn:
+                claimed = conn.execute(
+                    "UPDATE jobs SET status = 'running', worker_id = ?, lease_until = ?, started_at = ?, "
+                    "attempts = attempts + 1 WHERE seq = ? AND status = 'queued'",
+                    (worker_id, now + JOB_LEASE, now, row["first_seq"])
+                ).rowcount
+                if not claimed:
+                    # Another worker got there first
+                    continue
+                job = conn.execute("SELECT * FROM jobs WHERE seq = ?", (row["first_seq"],)).fetchone()
+                conn.execute(
+                    "INSERT OR REPLACE INTO clients (client_id, last_served) "
+                    "VALUES (?, (SELECT COALESCE(MAX(last_served), 0) + 1 FROM clients))",
+                    (job["client_id"],)
+                )
+            STAGE_LATENCY.labels("job_queue_wait").observe(now - job["created_at"])
+            return {"job_id": job["job_id"], "client_id": job["client_id"], "request": json.loads(job["request"])}
+
+    def renew(self, worker_id: Optional[str] = None):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE status = 'running' AND worker_id = ?",
+                (time.time() + JOB_LEASE, worker_id or current_worker_id())
+            )
+
+    def finish(self, job_id: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            row = conn.execute("SELECT started_at FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, worker_id = NULL, lease_until = NULL "
+                "WHERE job_id = ?",
+                ("failed" if error else "done", None if result is None else json.dumps(result, ensure_ascii=False),
+                 error, now, job_id)
+            )
+            conn.execute("DELETE FROM jobs WHERE finished_at < ?", (now - JOB_RESULT_TTL,))
+        if row is not None and row["started_at"] and not error:
+            with self._lock:
+                self.average_seconds = 0.8 * self.average_seconds + 0.2 * (now - row["started_at"])
+
+    def release(self, worker_id: Optional[str] = None) -> int:
+        """
+        Put the running jobs of a stopping process back in the queue, returns how many
+        """
+        conn = self._connect()
+        with conn:
+            return conn.execute(
+                "UPDATE jobs SET status = 'queued', worker_id = NULL, lease_until = NULL, attempts = attempts - 1 "
+                "WHERE status = 'running' AND worker_id = ?",
+                (worker_id or current_worker_id(),)
+            ).rowcount
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(
+            "SELECT job_id, status, result, error, created_at, started_at, finished_at FROM jobs WHERE job_id = ?",
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def depth(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+    def get_stats(self) -> Dict[str, Any]:
+        rows = self._connect().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        stats = {status: 0 for status in ("queued", "running", "done", "failed")}
+        stats.update({row[0]: row[1] for row in rows})
+        clients = self._connect().execute(
+            "SELECT COUNT(DISTINCT client_id) FROM jobs WHERE status = 'queued'"
+        ).fetchone()[0]
+        with self._lock:
+            average = self.average_seconds
+        return {**stats, "queued_clients": clients, "average_seconds": round(average, 3)}
+
+
+job_queue = JobQueue(JOB_DB_PATH)
+register_queue_depth("jobs", job_queue.depth)
+
+# In-process wakeups, other processes' jobs are picked up within JOB_POLL_INTERVAL
+_wake: Optional[asyncio.Event] = None
+_job_events: Dict[str, asyncio.Event] = {}
+_job_waiters: Dict[str, int] = {}
+_worker_tasks: List[asyncio.Task] = []
+_heartbeat_tasks: List[asyncio.Task] = []
+_draining = False
+
+
+def _get_wake() -> asyncio.Event:
+    global _wake
+    if _wake is None:
+        _wake = asyncio.Event()
+    return _wake
+
+
+async def submit_job(client_id: str, request: Dict[str, Any]) -> Dict[str, Any]:
+    job = await asyncio.to_thread(job_queue.submit, client_id, request)
+    _get_wake().set()
+    return job
+
+
+async def wait_for_job(job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+    """
+    A job's status, waiting up to `timeout` seconds for it to finish
+    """
+    deadline = time.monotonic() + timeout
+    _job_waiters[job_id] = _job_waiters.get(job_id, 0) + 1
+    try:
+        while True:
+            job = await asyncio.to_thread(job_queue.get, job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job["status"] in FINISHED_STATUSES or remaining <= 0:
+                return job
+            event = _job_events.setdefault(job_id, asyncio.Event())
+            try:
+                await asyncio.wait_for(event.wait(), min(remaining, JOB_POLL_INTERVAL))
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        # Jobs run by another process never pop their event here, the last waiter does
+        _job_waiters[job_id] -= 1
+        if _job_waiters[job_id] <= 0:
+            del _job_waiters[job_id]
+            _job_events.pop(job_id, None)
+
+
+async def run_job_worker(handler: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]):
+    """
+    Background loop running queued jobs through `handler`, which returns the job result.
+    Stops claiming jobs once drain_job_workers is called.
+    """
+    wake = _get_wake()
+    while not _draining:
+        wake.clear()
+        try:
+            job = await asyncio.to_thread(job_queue.claim)
+        except Exception as e:
+            logger.error("Could not claim a job: %s", e)
+            job = None
+        if job is None:
+            try:
+                await asyncio.wait_for(wake.wait(), JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        try:
+            result, error = await handler(job["request"]), None
+        except asyncio.CancelledError:
+            # Drain timed out, drain_job_workers hands the job back to the queue
+            raise
+        except Exception as e:
+            result, error = None, str(e)
+        try:
+            await asyncio.to_thread(job_queue.finish, job["job_id"], result, error)
+        except Exception as e:
+            logger.error("Could not store the result of job %s: %s", job["job_id"], e)
+        event = _job_events.pop(job["job_id"], None)
+        if event is not None:
+            event.set()
+
+
+async def run_job_heartbeat():
+    """
+    Background loop renewing the leases of this process's running jobs
+    """
+    while True:
+        await asyncio.sleep(JOB_LEASE / 3)
+        try:
+            await asyncio.to_thread(job_queue.renew)
+        except Exception as e:
+            logger.error("Could not renew job leases: %s", e)
+
+
+def start_job_workers(handler: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]):
+    global _draining
+    _draining = False
+    _worker_tasks.extend(asyncio.create_task(run_job_worker(handler)) for _ in range(JOB_WORKERS))
+    _heartbeat_tasks.append(asyncio.create_task(run_job_heartbeat()))
+
+
+async def drain_job_workers(timeout: float):
+    """
+    Stop claiming jobs and give running ones up to `timeout` seconds to finish. Jobs still
+    running after that are cancelled and handed back to the queue.
+    """
+    global _draining
+    _draining = True
+    _get_wake().set()
+    if _worker_tasks:
+        _, pending = await asyncio.wait(_worker_tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*_worker_tasks, return_exceptions=True)
+        _worker_tasks.clear()
+    for task in _heartbeat_tasks:
+        task.cancel()
+    _heartbeat_tasks.clear()
+
+    released = await asyncio.to_thread(job_queue.release)
+    if released:
+        logger.info("Requeued %d running jobs", released)
@@ -0,0 +1,157 @@
+import re
+import json
+from typing import Any, Optional
+
+# Markdown ```json / ``` fence, only stripped outside JSON strings
+FENCE_PATTERN = re.compile(r"```(?:json|JSON)?")
+
+CLOSERS = {"{": "}", "[": "]"}
+
+# Complete values to back off to when closing a truncated text where it stopped fails
+MAX_BACKOFF_ATTEMPTS = 8
+
+# Balanced top-level objects to try, prose before the JSON may contain braces of its own
+MAX_CANDIDATES = 8
+
+
+def _scan(text: str, start: int) -> tuple:
+    """
+    Walk one JSON object from the '{' at `start` and rewrite the common LLM mistakes on the way:
+    raw control characters inside strings are escaped, markdown fences outside strings are
+    dropped and commas directly before a closing bracket are dropped. Stops after the object
+    closes, so trailing prose is ignored.
+
+    Returns (repaired, stack, in_string, safe_points, end) where stack holds the brackets still
+    open when the text ran out, safe_points are (length, stack) states after complete values and
+    end is the index after the closing brace.
+    """
+    out = []
+    stack = []
+    in_string = False
+    escaped = False
+    safe_points = []
+
+    i = start
+    while i < len(text):
+        ch = text[i]
+        i += 1
+        if in_string:
+            if escaped:
+                escaped = False
+                out.append(ch)
+            elif ch == "\\":
+                escaped = True
+                out.append(ch)
+            elif ch == '"':
+                in_string = False
+                out.append(ch)
+            elif ch == "\n":
+                out.append("\\n")
+            elif ch == "\r":
+                out.append("\\r")
+            elif ch == "\t":
+                out.append("\\t")
+            elif ch < " ":
+                out.append(f"\\u{ord(ch):04x}")
+            else:
+                out.append(ch)
+            continue
+
+        if ch == "`":
+            fence = FENCE_PATTERN.match(text, i - 1)
+            if fence:
+                i = fence.end()
+            else:
+                out.append(ch)
+        elif ch == '"':
+            in_string = True
+            out.append(ch)
+        elif ch in CLOSERS:
+            stack.append(ch)
+            out.append(ch)
+        elif ch in "}]":
+            if not stack:
+                break
+            # Trailing comma before the closing bracket
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            # Close whatever is actually open, models sometimes mix up ] and }
+            out.append(CLOSERS[stack.pop()])
+            if not stack:
+                return "".join(out), [], False, safe_points, i
+            safe_points.append((len(out), list(stack)))
+        elif ch == ",":
+            safe_points.append((len(out), list(stack)))
+            out.append(ch)
+        else:
+            out.append(ch)
+
+    return "".join(out), stack, in_string, safe_points, i
+
+
+def _close(text: str, stack: list) -> str:
+    text = text.rstrip()
+    if text.endswith(","):
+        text = text[:-1]
+    elif text.endswith(":"):
+        # Key without a value
+        text += " null"
+    return text + "".join(CLOSERS[opener] for opener in reversed(stack))
+
+
+def _loads(text: str) -> Optional[Any]:
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return None
+
+
+def _is_item_boundary(stack: list) -> bool:
+    # Between two top-level keys or two array items, nothing half-written on either side
+    return len(stack) == 1 or stack[-1] == "["
+
+
+def _repair_truncated(repaired: str, stack: list, in_string: bool, safe_points: list) -> Optional[Any]:
+    # Stopped right after a complete item, only the brackets are missing
+    if not in_string and _is_item_boundary(stack) and repaired.rstrip()[-1:] in ('"', "}", "]"):
+        value = _loads(_close(repaired, stack))
+        if value is not None:
+            return value
+
+    # Stopped inside a value: drop the whole unfinished item rather than closing it where it was
+    # cut, a material named "Alu" or a half-written section would pass as complete
+    boundaries = [point for point in safe_points if _is_item_boundary(point[1])]
+    for length, safe_stack in reversed(boundaries[-MAX_BACKOFF_ATTEMPTS:]):
+        value = _loads(_close(repaired[:length], safe_stack))
+        if value is not None:
+            return value
+    return None
+
+
+def repair_json(text: str) -> tuple:
+    """
+    Best-effort local repair of a malformed LLM JSON object.
+
+    Handles markdown fences and prose around the object (braces in the prose included), trailing
+    commas, raw newlines inside strings and output truncated before the closing brackets.
+    Truncated output keeps only its complete top-level values and array items.
+
+    Returns (value, truncated) with value None when the text could not be repaired and truncated
+    True when the value was recovered from output that stopped early, so it may lack items.
+    """
+    start = text.find("{")
+    for _ in range(MAX_CANDIDATES):
+        if start == -1:
+            break
+        repaired, stack, in_string, safe_points, end = _scan(text, start)
+        if stack:
+            # Ran out of text inside this object, nothing after it to try
+            return _repair_truncated(repaired, stack, in_string, safe_points), True
+        value = _loads(repaired)
+        if value is not None:
+            return value, False
+        # Not JSON, e.g. "{see below}" in the prose, try the next top-level object
+        start = text.find("{", end)
+    return None, False
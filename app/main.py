@@ -1,24 +1,78 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse, JSONResponse, Response
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Dict, Optional
 import os
-from app.ai_service import get_material_recommendations
-from app.pdf_service import generate_pdf
+import json
+import asyncio
+import logging
+from app.ai_service import get_material_recommendations_async, stream_material_recommendations, refine_recommendations_async, get_cache_stats, get_llm_stats, is_incomplete_result, drain_refreshes, close_clients
+from app.report_jobs import submit_report, get_report_status, shutdown_report_pool, run_report_eviction
+from app.report_store import report_store
+from app.responses import RangeFileResponse, DuplexStreamingResponse, build_response, with_si_properties
+from app.metrics import timed_stage, render_metrics, mark_worker_stopped
+from app.materials_db import material_db, format_shortlist
+from app.history import history_store
+from app.job_queue import job_queue, submit_job, wait_for_job, start_job_workers, drain_job_workers, QueueFullError
+from app.similarity import similarity_index
+from app.units import parse_quantity
 import uuid
 
+# Leveled logging, LOG_LEVEL=OFF silences it entirely
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+if LOG_LEVEL == "OFF":
+    logging.disable(logging.CRITICAL)
+else:
+    logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger(__name__)
+
+# Max items of a batch generated at once
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+# Highest concurrency a batch request may ask for
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "32"))
+# Screened materials added to the prompt when a request has screening constraints
+MATERIAL_SHORTLIST_SIZE = int(os.getenv("MATERIAL_SHORTLIST_SIZE", "8"))
+# Longest a job status request may wait for the job to finish
+JOB_MAX_WAIT = float(os.getenv("JOB_MAX_WAIT", "30"))
+# Longest a refine waits for another server process to finish recording the recommendation it refines
+HISTORY_WRITE_WAIT = float(os.getenv("HISTORY_WRITE_WAIT", "5"))
+# Seconds a stopping worker gives running jobs, then background refreshes and history writes, to finish
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "20"))
+
 app = FastAPI(
     title="MaterialMind",
     description="AI-powered material recommendation system for mechanical engineers",
     version="1.0.0"
 )
 
+class PropertyRange(BaseModel):
+    min: Optional[float] = None
+    max: Optional[float] = None
+
+class ScreeningRequest(BaseModel):
+    constraints: Dict[str, PropertyRange] = {}  # Property key -> bounds, e.g. {"density": {"max": 3}}
+    service_temperature: Optional[PropertyRange] = None  # Operating range in °C the material must cover
+    categories: Optional[List[str]] = None
+    objectives: Optional[Dict[str, str]] = None  # Property key -> "min" or "max"
+    weights: Optional[Dict[str, float]] = None
+    rank: str = "pareto"
+    limit: int = 10
+
 class ProductRequest(BaseModel):
     description: str
     additional_requirements: Optional[str] = None
+    bypass_cache: bool = False
+    fan_out: Optional[bool] = None  # Generate per component in parallel, defaults to LLM_FAN_OUT
+    screening: Optional[ScreeningRequest] = None  # Pre-screen the material database and give the model a shortlist
+    allow_similar: Optional[bool] = None  # Answer from a near-duplicate earlier request, defaults to SIMILAR_MATCHING
+
+class RefineRequest(BaseModel):
+    requirement: str  # The one requirement to add, e.g. "must be food safe"
 
 class MaterialSpecification(BaseModel):
     name: str
     properties: dict
+    properties_si: Optional[dict] = None  # Property name -> {"key", "value", "min", "max", "unit"} in SI units
     application: str
     rationale: str
 
@@ -27,36 +81,417 @@ class RecommendationResponse(BaseModel):
     materials: List[MaterialSpecification]
     recommendations: str
     pdf_path: Optional[str] = None
+    report_id: Optional[str] = None
+    similar_match: Optional[dict] = None  # Set when served from a similar earlier request: score and its description
+    refined_from: Optional[str] = None  # Set by the refine endpoint: the request id that was refined
+    changes: Optional[dict] = None  # Set by the refine endpoint: removed, replaced and added materials, rewritten sections
+
+def run_screening(screening: ScreeningRequest, limit: Optional[int] = None) -> dict:
+    return material_db.screen(
+        constraints={key: bounds.model_dump() for key, bounds in screening.constraints.items()},
+        service_temperature=screening.service_temperature.model_dump() if screening.service_temperature else None,
+        categories=screening.categories,
+        objectives=screening.objectives,
+        weights=screening.weights,
+        rank=screening.rank,
+        limit=screening.limit if limit is None else limit
+    )
+
+def material_context(request: ProductRequest) -> Optional[str]:
+    """
+    Shortlist of screened materials for the prompt, None without screening constraints
+    """
+    if request.screening is None:
+        return None
+    with timed_stage("material_screening"):
+        shortlist = run_screening(request.screening, min(request.screening.limit, MATERIAL_SHORTLIST_SIZE))
+    return format_shortlist(shortlist["materials"]) or None
+
+def screening_context(request: ProductRequest) -> Optional[str]:
+    try:
+        return material_context(request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def queue_report(recommendations: dict) -> tuple:
+    """
+    Hand the PDF to the rendering pool, returns (report_id, pdf_filename)
+    """
+    # Generate a unique ID for this request
+    report_id = str(uuid.uuid4())
+    # Registering the report queries the report store, keep it off the event loop
+    pdf_filename = await asyncio.to_thread(submit_report, report_id, recommendations)
+    return report_id, pdf_filename
+
+history_tasks = {}  # report_id -> pending history write
+
+async def save_history(request: ProductRequest, recommendations: dict, report_id: str):
+    try:
+        with timed_stage("history_write"):
+            await asyncio.to_thread(
+                history_store.add, report_id, request.description, request.additional_requirements, recommendations
+            )
+    except Exception as e:
+        # History is a side record, never fail the request over it
+        logger.error("Could not store recommendation %s in history: %s", report_id, e)
+
+def record_history(request: ProductRequest, recommendations: dict, report_id: str):
+    """
+    Store the result in the history store in a worker thread, without holding up the response
+    """
+    if is_incomplete_result(recommendations):
+        return
+    task = asyncio.create_task(save_history(request, recommendations, report_id))
+    history_tasks[report_id] = task
+    task.add_done_callback(lambda _: history_tasks.pop(report_id, None))
+
+async def load_recommendation(request_id: str) -> Optional[dict]:
+    """
+    A stored recommendation for refining, waiting for its history write when that is still running
+    """
+    # A refine right after the original request may race its history write
+    pending = history_tasks.get(request_id)
+    if pending is not None:
+        await asyncio.shield(pending)
+    previous = await asyncio.to_thread(history_store.get_recommendation, request_id, False)
+    # Its report is registered before the response goes out, the history write follows in the
+    # background of whichever server process answered the original request
+    deadline = asyncio.get_running_loop().time() + HISTORY_WRITE_WAIT
+    while previous is None and asyncio.get_running_loop().time() < deadline and report_store.get_report_hash(request_id):
+        await asyncio.sleep(0.1)
+        previous = await asyncio.to_thread(history_store.get_recommendation, request_id, False)
+    return previous
+
+async def generate_response(request: ProductRequest, context: Optional[str]) -> dict:
+    """
+    Recommendations for a request with the report queued and history recorded, as a response dict.
+    context is the screened material shortlist, see material_context.
+    """
+    # Get material recommendations from AI
+    recommendations = await get_material_recommendations_async(
+        request.description,
+        request.additional_requirements,
+        use_cache=not request.bypass_cache,
+        fan_out=request.fan_out,
+        material_context=context,
+        allow_similar=request.allow_similar
+    )
+    similar_match = recommendations.pop("similar_match", None)
+
+    # Generate PDF in the rendering pool
+    report_id, pdf_filename = await queue_report(recommendations)
+    record_history(request, recommendations, report_id)
+    return build_response(request.description, recommendations, report_id, pdf_filename, similar_match)
 
 @app.post("/api/recommend-materials", response_model=RecommendationResponse)
-async def recommend_materials(request: ProductRequest, background_tasks: BackgroundTasks):
+async def recommend_materials(request: ProductRequest):
+    context = screening_context(request)
     try:
-        # Get material recommendations from AI
-        recommendations = get_material_recommendations(
-            request.description,
-            request.additional_requirements
-        )
-        
-        # Generate a unique ID for this request
-        request_id = str(uuid.uuid4())
-        pdf_filename = f"MaterialMind_Recommendation_{request_id}.pdf"
-        
-        # Generate PDF in the background
-        background_tasks.add_task(
-            generate_pdf,
-            recommendations,
-            pdf_filename
-        )
-        
-        return {
-            "product_description": request.description,
-            "materials": recommendations["materials"],
-            "recommendations": recommendations["general_recommendations"],
-            "pdf_path": pdf_filename
-        }
+        response = await generate_response(request, context)
+        with timed_stage("response_validation"):
+            return RecommendationResponse(**response)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating recommendations: {str(e)}")
 
+@app.post("/api/recommend-materials/stream")
+async def recommend_materials_stream(request: ProductRequest):
+    """
+    Stream recommendations as NDJSON: one line per material, one per text section, then a done line
+    """
+    context = screening_context(request)
+
+    async def event_stream():
+        yield json.dumps({"type": "start", "product_description": request.description}) + "\n"
+        try:
+            async for event in stream_material_recommendations(
+                request.description,
+                request.additional_requirements,
+                use_cache=not request.bypass_cache,
+                fan_out=request.fan_out,
+                material_context=context,
+                allow_similar=request.allow_similar
+            ):
+                if event["type"] == "complete":
+                    report_id, pdf_filename = await queue_report(event["data"])
+                    record_history(request, event["data"], report_id)
+                    yield json.dumps({"type": "done", "pdf_path": pdf_filename, "report_id": report_id}) + "\n"
+                elif event["type"] == "material":
+                    yield json.dumps({"type": "material", "data": with_si_properties(event["data"])}) + "\n"
+                else:
+                    yield json.dumps(event) + "\n"
+        except Exception as e:
+            yield json.dumps({"type": "error", "detail": f"Error generating recommendations: {str(e)}"}) + "\n"
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
+@app.post("/api/recommendations/{request_id}/refine", response_model=RecommendationResponse)
+async def refine_recommendation(request_id: str, refine: RefineRequest):
+    """
+    Adjust a stored recommendation for one new requirement. The model gets a compact form of the
+    previous result and returns only the materials and sections that change.
+    """
+    if not refine.requirement.strip():
+        raise HTTPException(status_code=400, detail="requirement must not be empty")
+    previous = await load_recommendation(request_id)
+    if previous is None:
+        raise HTTPException(status_code=404, detail="Recommendation not found")
+
+    requirements = "\n".join(filter(None, [previous["additional_requirements"], refine.requirement.strip()]))
+    request = ProductRequest(description=previous["product_description"], additional_requirements=requirements)
+    try:
+        recommendations, changes = await refine_recommendations_async(
+            previous["product_description"],
+            previous["additional_requirements"],
+            previous["recommendations"],
+            refine.requirement.strip()
+        )
+
+        # The report is rendered again in full, an empty patch reuses the previous PDF by content hash
+        report_id, pdf_filename = await queue_report(recommendations)
+        record_history(request, recommendations, report_id)
+
+        with timed_stage("response_validation"):
+            return RecommendationResponse(
+                **build_response(request.description, recommendations, report_id, pdf_filename),
+                refined_from=request_id,
+                changes=changes
+            )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error refining recommendations: {str(e)}")
+
+async def read_lines(http_request: Request):
+    """
+    Non-empty lines of the request body as they arrive, without buffering the whole body
+    """
+    pending = b""
+    async for chunk in http_request.stream():
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield line
+    if pending.strip():
+        yield pending
+
+@app.post("/api/recommend-materials/batch")
+async def recommend_materials_batch(http_request: Request,
+                                    concurrency: int = Query(BATCH_CONCURRENCY, ge=1, le=BATCH_MAX_CONCURRENCY)):
+    """
+    Run a JSONL body of ProductRequest objects with bounded concurrency.
+
+    Results stream back as JSONL in completion order, one line per item with its status,
+    so a failing item does not stop the rest of the batch. The body is read line by line
+    as slots free up, so a large batch is never held in memory.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    results = asyncio.Queue()
+    body_read = asyncio.Event()
+    tasks = []
+
+    async def run_item(index: int, line: bytes):
+        item = {"index": index}
+        try:
+            data = json.loads(line)
+            if isinstance(data, dict) and "id" in data:
+                item["id"] = data["id"]
+            request = ProductRequest(**data)
+            item.update({"status": "ok", "result": await generate_response(request, material_context(request))})
+        except Exception as e:
+            item.update({"status": "error", "error": str(e)})
+        finally:
+            semaphore.release()
+        await results.put(item)
+
+    async def feed():
+        try:
+            async for line in read_lines(http_request):
+                await semaphore.acquire()
+                tasks.append(asyncio.create_task(run_item(len(tasks), line)))
+        except Exception as e:
+            logger.warning("Batch body could not be read: %s", e)
+            await results.put({"status": "error", "error": f"Could not read the batch: {str(e)}"})
+        finally:
+            body_read.set()
+            await results.put(None)
+
+    async def result_stream():
+        feeder = asyncio.create_task(feed())
+        sent = 0
+        fed = False
+        try:
+            while not fed or sent < len(tasks):
+                item = await results.get()
+                if item is None:
+                    fed = True
+                    continue
+                if "index" in item:
+                    sent += 1
+                yield json.dumps(item) + "\n"
+        finally:
+            # Client went away or the batch finished, don't leave generations running
+            feeder.cancel()
+            for task in tasks:
+                task.cancel()
+
+    return DuplexStreamingResponse(result_stream(), body_read, media_type="application/x-ndjson")
+
+async def run_job(data: dict) -> dict:
+    request = ProductRequest(**data)
+    return await generate_response(request, material_context(request))
+
+def client_id(http_request: Request) -> str:
+    """
+    Who a job belongs to for fair scheduling: the X-Client-Id header, else the client address
+    """
+    client = http_request.headers.get("x-client-id") or (http_request.client.host if http_request.client else "")
+    return client[:128] or "anonymous"
+
+@app.post("/api/jobs", status_code=202)
+async def create_job(request: ProductRequest, http_request: Request):
+    """
+    Queue a recommendation request and return its job id right away
+    """
+    # Fail bad screening constraints now rather than in the worker
+    screening_context(request)
+    try:
+        job = await submit_job(client_id(http_request), request.model_dump())
+    except QueueFullError as e:
+        return JSONResponse(status_code=429, content={"detail": str(e)}, headers={"Retry-After": str(e.retry_after)})
+    return {**job, "status_url": f"/api/jobs/{job['job_id']}"}
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0):
+    """
+    Job status with the result once done. With `wait`, long-poll up to that many seconds for it to finish.
+    """
+    job = await wait_for_job(job_id, max(0.0, min(wait, JOB_MAX_WAIT)))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/api/jobs")
+async def job_stats():
+    return await asyncio.to_thread(job_queue.get_stats)
+
+@app.post("/api/materials/screen")
+async def screen_materials(request: ScreeningRequest):
+    """
+    Screen the bundled material database by property bounds and rank the candidates, no LLM call
+    """
+    try:
+        with timed_stage("material_screening"):
+            return run_screening(request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def parse_bound(value: Optional[str]) -> Optional[float]:
+    """
+    Query bound as SI value: "250 MPa" -> 2.5e8, plain numbers are taken as SI already
+    """
+    if value is None:
+        return None
+    quantity = parse_quantity(value)
+    if quantity is None or quantity["value"] is None:
+        raise HTTPException(status_code=400, detail=f"Could not parse bound '{value}'")
+    return quantity["value"]
+
+@app.get("/api/history/materials")
+async def history_materials(name: Optional[str] = None, exact: bool = False, sort_by: Optional[str] = None,
+                            order: str = "desc", min_value: Optional[str] = None, max_value: Optional[str] = None,
+                            limit: int = 50, offset: int = 0):
+    """
+    Past recommendations of a material, newest first or sorted by a stated property (SI values)
+    """
+    try:
+        with timed_stage("history_query"):
+            return await asyncio.to_thread(
+                history_store.query_materials,
+                name=name, exact=exact, sort_by=sort_by, order=order,
+                min_value=parse_bound(min_value), max_value=parse_bound(max_value),
+                limit=limit, offset=offset
+            )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/history/recommendations/{request_id}")
+async def history_recommendation(request_id: str):
+    recommendation = await asyncio.to_thread(history_store.get_recommendation, request_id)
+    if recommendation is None:
+        raise HTTPException(status_code=404, detail="Recommendation not found")
+    return recommendation
+
+@app.api_route("/api/reports/{report_id}", methods=["GET", "HEAD"])
+async def get_report(report_id: str, request: Request):
+    """
+    Download a rendered PDF report, or its status while it is still queued or rendering
+    """
+    # SQLite queries and file checks, off the event loop like the other store calls
+    status = await asyncio.to_thread(get_report_status, report_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Report not found")
+
+    if status["status"] == "done":
+        try:
+            return await asyncio.to_thread(
+                RangeFileResponse,
+                status["pdf_path"],
+                request.headers,
+                filename=os.path.basename(status["pdf_path"]),
+                method=request.method
+            )
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Report file no longer exists")
+
+    status_code = 500 if status["status"] == "failed" else 202
+    return JSONResponse(status_code=status_code, content={
+        "report_id": report_id,
+        "status": status["status"],
+        "error": status["error"]
+    })
+
+@app.get("/metrics")
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    return get_cache_stats()
+
+@app.get("/api/llm/stats")
+async def llm_stats():
+    return get_llm_stats()
+
+background_loops = []
+
+@app.on_event("startup")
+async def startup():
+    # Keep the reports directory within its size and age limits
+    background_loops.append(asyncio.create_task(run_report_eviction()))
+    # Load the similar-request index now rather than in the first request
+    await asyncio.to_thread(similarity_index.sync)
+    start_job_workers(run_job)
+
+@app.on_event("shutdown")
+async def shutdown():
+    for task in background_loops:
+        task.cancel()
+    # The server has stopped taking requests and finished in-flight ones, now drain background work.
+    # Jobs still running after the timeout go back to the queue for the next start or another process.
+    deadline = asyncio.get_running_loop().time() + SHUTDOWN_DRAIN_TIMEOUT
+
+    def remaining() -> float:
+        return max(0.0, deadline - asyncio.get_running_loop().time())
+
+    await drain_job_workers(remaining())
+    await drain_refreshes(remaining())
+    if history_tasks:
+        await asyncio.wait(list(history_tasks.values()), timeout=remaining())
+    await close_clients()
+    # Let queued reports finish rendering before the worker exits
+    await asyncio.to_thread(shutdown_report_pool, True)
+    mark_worker_stopped()
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to MaterialMind API"}
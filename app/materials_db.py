@@ -0,0 +1,198 @@
+import os
+import csv
+import numpy as np
+from typing import Dict, Any, List, Optional
+
+# Bundled dataset of typical handbook values, for screening rather than final design values
+MATERIALS_DATA_PATH = os.getenv("MATERIALS_DATA_PATH", os.path.join(os.path.dirname(__file__), "data", "materials.csv"))
+
+# Numeric columns of the dataset: key -> (label, unit)
+PROPERTIES = {
+    "density": ("Density", "g/cm³"),
+    "youngs_modulus": ("Young's Modulus", "GPa"),
+    "yield_strength": ("Yield Strength", "MPa"),
+    "tensile_strength": ("Tensile Strength", "MPa"),
+    "min_service_temp": ("Min Service Temperature", "°C"),
+    "max_service_temp": ("Max Service Temperature", "°C"),
+    "thermal_conductivity": ("Thermal Conductivity", "W/m·K"),
+    "cost": ("Cost", "INR/kg")
+}
+
+# Ashby performance indices computed from the columns above
+DERIVED_PROPERTIES = {
+    "specific_strength": ("Specific Strength", "MPa·cm³/g"),
+    "specific_stiffness": ("Specific Stiffness", "GPa·cm³/g")
+}
+
+DEFAULT_OBJECTIVES = {"cost": "min", "specific_strength": "max"}
+
+
+class MaterialDatabase:
+    """
+    Material property table held as NumPy columns: float32 per property, int8 category codes.
+
+    Screening is a vectorized mask over the columns, followed by Pareto or weighted ranking of
+    the candidates that pass.
+    """
+
+    def __init__(self, path: str):
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+
+        self.names = np.array([row["name"] for row in rows], dtype=object)
+        self.categories = sorted({row["category"] for row in rows})
+        self.category_codes = np.array([self.categories.index(row["category"]) for row in rows], dtype=np.int8)
+        # Missing values (e.g. yield strength of brittle materials) are NaN and fail any bound on that column
+        self.columns = {
+            key: np.array([float(row[key]) if row[key] else np.nan for row in rows], dtype=np.float32)
+            for key in PROPERTIES
+        }
+        # Ashby's failure strength: yield where defined, tensile strength for brittle materials and composites
+        strength = np.where(np.isnan(self.columns["yield_strength"]), self.columns["tensile_strength"], self.columns["yield_strength"])
+        self.columns["specific_strength"] = strength / self.columns["density"]
+        self.columns["specific_stiffness"] = self.columns["youngs_modulus"] / self.columns["density"]
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def _column(self, key: str) -> np.ndarray:
+        if key not in self.columns:
+            raise ValueError(f"Unknown material property '{key}', expected one of: {', '.join(self.columns)}")
+        return self.columns[key]
+
+    def screen_mask(self, constraints: Optional[Dict[str, Dict[str, Optional[float]]]] = None,
+                    service_temperature: Optional[Dict[str, Optional[float]]] = None,
+                    categories: Optional[List[str]] = None) -> np.ndarray:
+        """
+        Boolean mask of materials meeting every {"min", "max"} bound, covering the service
+        temperature range and belonging to one of the categories
+        """
+        mask = np.ones(len(self), dtype=bool)
+        with np.errstate(invalid="ignore"):
+            for key, bounds in (constraints or {}).items():
+                column = self._column(key)
+                if bounds.get("min") is not None:
+                    mask &= column >= bounds["min"]
+                if bounds.get("max") is not None:
+                    mask &= column <= bounds["max"]
+
+            if service_temperature:
+                if service_temperature.get("min") is not None:
+                    mask &= self.columns["min_service_temp"] <= service_temperature["min"]
+                if service_temperature.get("max") is not None:
+                    mask &= self.columns["max_service_temp"] >= service_temperature["max"]
+
+        if categories:
+            unknown = [c for c in categories if c not in self.categories]
+            if unknown:
+                raise ValueError(f"Unknown material category '{unknown[0]}', expected one of: {', '.join(self.categories)}")
+            mask &= np.isin(self.category_codes, [self.categories.index(c) for c in categories])
+        return mask
+
+    def _objective_matrix(self, indices: np.ndarray, objectives: Dict[str, str]) -> np.ndarray:
+        """
+        Candidates x objectives, min-max normalized to [0, 1] with lower always better.
+        Missing values count as the worst.
+        """
+        matrix = np.empty((len(indices), len(objectives)), dtype=np.float64)
+        for j, (key, direction) in enumerate(objectives.items()):
+            if direction not in ("min", "max"):
+                raise ValueError(f"Objective direction for '{key}' must be 'min' or 'max'")
+            values = self._column(key)[indices].astype(np.float64)
+            if direction == "max":
+                values = -values
+            if np.all(np.isnan(values)):
+                matrix[:, j] = 1.0
+                continue
+            low, high = np.nanmin(values), np.nanmax(values)
+            span = high - low if high > low else 1.0
+            matrix[:, j] = np.where(np.isnan(values), 1.0, (values - low) / span)
+        return matrix
+
+    @staticmethod
+    def pareto_fronts(matrix: np.ndarray) -> np.ndarray:
+        """
+        Pareto front number per row (0 = non-dominated), lower values better in every column
+        """
+        fronts = np.full(len(matrix), -1, dtype=np.int32)
+        remaining = np.arange(len(matrix))
+        front = 0
+        while remaining.size:
+            sub = matrix[remaining]
+            # dominated[i]: some j is at least as good everywhere and strictly better somewhere
+            no_worse = np.all(sub[None, :, :] <= sub[:, None, :], axis=2)
+            better = np.any(sub[None, :, :] < sub[:, None, :], axis=2)
+            dominated = np.any(no_worse & better, axis=1)
+            fronts[remaining[~dominated]] = front
+            remaining = remaining[dominated]
+            front += 1
+        return fronts
+
+    def screen(self, constraints: Optional[Dict[str, Dict[str, Optional[float]]]] = None,
+               service_temperature: Optional[Dict[str, Optional[float]]] = None,
+               categories: Optional[List[str]] = None,
+               objectives: Optional[Dict[str, str]] = None,
+               weights: Optional[Dict[str, float]] = None,
+               rank: str = "pareto",
+               limit: int = 10) -> Dict[str, Any]:
+        """
+        Screen the database and rank the candidates.
+
+        rank="pareto" orders by Pareto front over the objectives, then by weighted score within a
+        front. rank="weighted" orders by weighted score alone. Returns the total number of
+        candidates and the top `limit` materials.
+        """
+        if rank not in ("pareto", "weighted"):
+            raise ValueError("rank must be 'pareto' or 'weighted'")
+        objectives = objectives or DEFAULT_OBJECTIVES
+        mask = self.screen_mask(constraints, service_temperature, categories)
+        indices = np.flatnonzero(mask)
+
+        matrix = self._objective_matrix(indices, objectives)
+        weight_vector = np.array([(weights or {}).get(key, 1.0) for key in objectives], dtype=np.float64)
+        scores = matrix @ weight_vector / max(weight_vector.sum(), 1e-9)
+        if rank == "pareto":
+            fronts = self.pareto_fronts(matrix)
+            order = np.lexsort((scores, fronts))
+        else:
+            fronts = None
+            order = np.argsort(scores, kind="stable")
+
+        materials = []
+        for position in order[:max(0, limit)]:
+            index = indices[position]
+            material = {
+                "name": self.names[index],
+                "category": self.categories[self.category_codes[index]],
+                "properties": {key: self.value(key, index) for key in list(PROPERTIES) + list(DERIVED_PROPERTIES)},
+                "score": round(float(scores[position]), 4)
+            }
+            if fronts is not None:
+                material["pareto_front"] = int(fronts[position])
+            materials.append(material)
+        return {"total": int(indices.size), "materials": materials}
+
+    def value(self, key: str, index: int) -> Optional[float]:
+        value = float(self.columns[key][index])
+        return None if np.isnan(value) else round(value, 3)
+
+
+def format_property(key: str, value: Optional[float]) -> Optional[str]:
+    if value is None:
+        return None
+    label, unit = PROPERTIES.get(key) or DERIVED_PROPERTIES[key]
+    return f"{label}: {value:g} {unit}"
+
+
+def format_shortlist(materials: List[Dict[str, Any]]) -> str:
+    """
+    Compact prompt text for a screened shortlist, one line per material
+    """
+    lines = []
+    for material in materials:
+        properties = [format_property(key, material["properties"].get(key)) for key in PROPERTIES]
+        lines.append(f"- {material['name']} ({material['category']}): " + ", ".join(p for p in properties if p))
+    return "\n".join(lines)
+
+
+material_db = MaterialDatabase(MATERIALS_DATA_PATH)
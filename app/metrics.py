@@ -0,0 +1,147 @@
+import os
+import time
+import logging
+from contextlib import contextmanager
+from typing import Callable, Dict
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, generate_latest, multiprocess, CONTENT_TYPE_LATEST
+from prometheus_client.core import GaugeMetricFamily
+
+logger = logging.getLogger(__name__)
+
+# Set (by `app.cli serve` for several workers) to share metrics across server processes through files
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+# Buckets from 1 ms to 2 minutes, stages range from JSON parsing to full LLM generations
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+STAGE_LATENCY = Histogram(
+    "materialmind_stage_seconds",
+    "Latency of each request stage",
+    ["stage"],
+    buckets=LATENCY_BUCKETS
+)
+LLM_TOKENS = Counter(
+    "materialmind_llm_tokens_total",
+    "Tokens reported by the LLM usage field",
+    ["direction"]
+)
+PARSE_RESULTS = Counter(
+    "materialmind_parse_total",
+    "How AI responses were parsed (json, repaired, truncated, llm_fix or the raw-text fallback)",
+    ["result"]
+)
+PDF_RENDER_SECONDS = Histogram(
+    "materialmind_pdf_render_seconds",
+    "Time spent rendering a PDF report in the rendering pool",
+    buckets=LATENCY_BUCKETS
+)
+LLM_MODEL_SECONDS = Histogram(
+    "materialmind_llm_model_seconds",
+    "Latency of completed LLM calls per model",
+    ["model"],
+    buckets=LATENCY_BUCKETS
+)
+LLM_COST = Counter(
+    "materialmind_llm_cost_usd_total",
+    "Estimated LLM spend per model, from reported token usage and LLM_MODEL_PRICES",
+    ["model"]
+)
+LLM_HEDGES = Counter(
+    "materialmind_llm_hedges_total",
+    "Hedged duplicate LLM requests, by whether the duplicate answered first",
+    ["model", "outcome"]
+)
+QUEUE_DEPTH = Gauge(
+    "materialmind_queue_depth",
+    "Work waiting to start",
+    ["queue"],
+    multiprocess_mode="livesum"
+)
+
+# Queues kept in shared storage, their depth is read when metrics are scraped
+_shared_queue_depths: Dict[str, Callable[[], float]] = {}
+
+
+@contextmanager
+def timed_stage(stage: str):
+    """
+    Time a block and record it in the per-stage latency histogram
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_LATENCY.labels(stage).observe(elapsed)
+        logger.debug("stage %s took %.1f ms", stage, elapsed * 1000)
+
+
+def usage_tokens(usage) -> tuple:
+    """
+    (prompt_tokens, completion_tokens) from a completion's usage field (object, dict or None)
+    """
+    if usage is None:
+        return 0, 0
+    if isinstance(usage, dict):
+        return usage.get("prompt_tokens") or 0, usage.get("completion_tokens") or 0
+    return getattr(usage, "prompt_tokens", None) or 0, getattr(usage, "completion_tokens", None) or 0
+
+
+def record_usage(usage):
+    """
+    Record token counts from a completion's usage field (object or dict)
+    """
+    prompt_tokens, completion_tokens = usage_tokens(usage)
+    if prompt_tokens:
+        LLM_TOKENS.labels("prompt").inc(prompt_tokens)
+    if completion_tokens:
+        LLM_TOKENS.labels("completion").inc(completion_tokens)
+
+
+def register_queue_depth(queue: str, depth: Callable[[], float]):
+    """
+    Report a queue whose depth `depth()` reads from storage all server processes share
+    """
+    if PROMETHEUS_MULTIPROC_DIR:
+        # Function gauges aren't written to the shared files, SharedMetricsCollector adds them
+        _shared_queue_depths[queue] = depth
+    else:
+        QUEUE_DEPTH.labels(queue).set_function(depth)
+
+
+class SharedMetricsCollector:
+    """
+    Metrics of every server process from PROMETHEUS_MULTIPROC_DIR, plus the shared queue depths
+    """
+
+    def collect(self):
+        queue_family = None
+        for metric in multiprocess.MultiProcessCollector(None).collect():
+            if metric.name == "materialmind_queue_depth":
+                queue_family = metric
+            else:
+                yield metric
+        if queue_family is None:
+            queue_family = GaugeMetricFamily("materialmind_queue_depth", "Work waiting to start", labels=["queue"])
+        for queue, depth in _shared_queue_depths.items():
+            queue_family.add_sample("materialmind_queue_depth", {"queue": queue}, depth())
+        yield queue_family
+
+
+def render_metrics() -> tuple:
+    """
+    Prometheus text exposition, returns (body, content_type)
+    """
+    if not PROMETHEUS_MULTIPROC_DIR:
+        return generate_latest(), CONTENT_TYPE_LATEST
+    registry = CollectorRegistry()
+    registry.register(SharedMetricsCollector())
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_worker_stopped():
+    """
+    Drop this process's live gauge values from the shared metrics when it shuts down
+    """
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
@@ -1,9 +1,44 @@
 from fpdf import FPDF
+from fpdf.enums import MethodReturnValue
 import os
-from typing import Dict, Any
+import logging
+import tempfile
+from collections import OrderedDict
+from typing import Dict, Any, List
 from datetime import datetime
+from app.report_store import get_output_dir
+
+logger = logging.getLogger(__name__)
+
+# Define column widths (adjust as needed, total should be close to page width - margins)
+# Page width A4 = 210mm. Margins = 10mm + 10mm = 20mm. Usable width = 190mm
+COL_WIDTHS = {
+    "material": 40,  # Adjusted slightly
+    "properties": 55, # Adjusted slightly
+    "application": 40,
+    "rationale": 55
+}
+HEADERS = ["Material", "Properties", "Application", "Rationale"]
+HEADER_KEYS = ["material", "properties", "application", "rationale"] # Keys for width dict
+
+LINE_HEIGHT = 5 # Height per line of text in mm
+CELL_PADDING_HORIZ = 2  # Horizontal padding (left/right) in mm
+CELL_PADDING_VERT = 2   # Vertical padding (top/bottom) in mm
+HEADER_ROW_HEIGHT = 10
+
+# Wrapped lines per (font, width, text). Kept per process, so a pool worker re-rendering
+# a report only has to measure the cells that changed.
+LINE_CACHE_SIZE = 4096
+_line_cache = OrderedDict()
 
 class MaterialPDF(FPDF):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Report generation time, computed once rather than on every page
+        self.generated_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        # True right after a table header, where a row must be drawn even if it has to be split
+        self.at_table_top = False
+
     def header(self):
         # Set font for the main title
         self.set_font("Arial", "B", 16)
@@ -13,16 +48,11 @@ class MaterialPDF(FPDF):
 
         # Add a subtitle or report generation time
         self.set_font("Arial", "I", 9)
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         self.set_text_color(128) # Grey color for timestamp
-        self.cell(page_w, 8, f"Report Generated: {timestamp}", border=0, ln=1, align="C")
+        self.cell(page_w, 8, f"Report Generated: {self.generated_at}", border=0, ln=1, align="C")
         self.set_text_color(0) # Reset text color to black
 
-        # Add a line separator below the header
-        # self.line(self.l_margin, self.get_y(), self.w - self.r_margin, self.get_y()) # Draw line
-        # self.ln(5) # Add a bit more space after the line/header info
-
-        # Or just add spacing
+        # Add spacing
         self.ln(8) # Add space after header section before content starts
 
     def footer(self):
@@ -35,11 +65,88 @@ class MaterialPDF(FPDF):
         self.set_text_color(0) # Reset text color
 
 
-def generate_pdf(recommendations: Dict[str, Any], filename: str) -> str:
-    output_dir = os.path.join(os.getcwd(), "outputs")
-    os.makedirs(output_dir, exist_ok=True)
+def split_lines(pdf: FPDF, width: float, text: str) -> List[str]:
+    """
+    Wrap text to the given width with the current font, using fpdf's dry-run line splitting
+    """
+    key = (pdf.font_family, pdf.font_style, pdf.font_size_pt, width, text)
+    lines = _line_cache.get(key)
+    if lines is not None:
+        _line_cache.move_to_end(key)
+        return lines
 
-    pdf_path = os.path.join(output_dir, filename)
+    lines = pdf.multi_cell(width, LINE_HEIGHT, text, dry_run=True, output=MethodReturnValue.LINES)
+    _line_cache[key] = lines
+    if len(_line_cache) > LINE_CACHE_SIZE:
+        _line_cache.popitem(last=False)
+    return lines
+
+
+def draw_table_header(pdf: FPDF):
+    pdf.set_font("Arial", "B", 10) # Table header font
+    pdf.set_fill_color(224, 235, 255)  # Lighter Blue for header
+    for header, key in zip(HEADERS, HEADER_KEYS):
+        pdf.cell(COL_WIDTHS[key], HEADER_ROW_HEIGHT, header, border=1, align="C", fill=True)
+    pdf.ln() # Move to next line after header
+    pdf.set_font("Arial", "", 9) # Table body font
+
+
+def draw_table_row(pdf: MaterialPDF, cell_lines: List[List[str]]):
+    """
+    Draw one table row from pre-split cell lines.
+
+    The row moves to a new page (with a repeated table header) when it doesn't fit below the
+    current position. A row taller than a whole page is split across pages.
+    """
+    row_lines = max(1, max(len(lines) for lines in cell_lines))
+    printed = 0
+
+    while True:
+        start_y = pdf.get_y()
+        available = pdf.page_break_trigger - start_y - 2 * CELL_PADDING_VERT
+        fits = max(0, int(available // LINE_HEIGHT))
+        remaining = row_lines - printed
+
+        if fits < remaining and printed == 0 and not pdf.at_table_top:
+            # Start the row on a fresh page rather than splitting it
+            pdf.add_page()
+            draw_table_header(pdf)
+            pdf.at_table_top = True
+            continue
+
+        chunk = min(remaining, max(fits, 1))
+        row_height = chunk * LINE_HEIGHT + 2 * CELL_PADDING_VERT
+        # Text baseline of the first line, vertically centred like cell() would place it
+        baseline = start_y + CELL_PADDING_VERT + LINE_HEIGHT / 2 + 0.3 * pdf.font_size
+        x = pdf.l_margin
+        for key, lines in zip(HEADER_KEYS, cell_lines):
+            col_width = COL_WIDTHS[key]
+            pdf.rect(x, start_y, col_width, row_height) # Draw border rectangle
+            # Lines are already wrapped, so write them directly instead of going through cell()
+            text_x = x + CELL_PADDING_HORIZ + pdf.c_margin
+            text_y = baseline
+            for line in lines[printed:printed + chunk]:
+                if line:
+                    pdf.text(text_x, text_y, line)
+                text_y += LINE_HEIGHT
+            x += col_width
+
+        printed += chunk
+        pdf.set_xy(pdf.l_margin, start_y + row_height)
+        pdf.at_table_top = False
+        if printed >= row_lines:
+            return
+
+        # Continue the rest of an oversized row on the next page
+        pdf.add_page()
+        draw_table_header(pdf)
+        pdf.at_table_top = True
+
+
+def render_pdf(recommendations: Dict[str, Any]) -> bytes:
+    """
+    Render the recommendation report straight to an in-memory PDF
+    """
     pdf = MaterialPDF('P', 'mm', 'A4') # Use Portrait, mm units, A4 size
     pdf.alias_nb_pages() # Enable total page count alias '{nb}'
     pdf.set_auto_page_break(auto=True, margin=15) # Bottom margin
@@ -57,94 +164,36 @@ def generate_pdf(recommendations: Dict[str, Any], filename: str) -> str:
     pdf.ln(10) # Space after recommendations
 
     # --- Table Setup ---
-    pdf.set_font("Arial", "B", 10) # Table header font
-    pdf.set_fill_color(224, 235, 255)  # Lighter Blue for header
     pdf.set_text_color(0) # Black text
     pdf.set_line_width(0.3) # Thinner borders
 
-    # Define column widths (adjust as needed, total should be close to page width - margins)
-    # Page width A4 = 210mm. Margins = 10mm + 10mm = 20mm. Usable width = 190mm
-    col_widths = {
-        "material": 40,  # Adjusted slightly
-        "properties": 55, # Adjusted slightly
-        "application": 40,
-        "rationale": 55
-    }
-    # Ensure total width is manageable
-    total_width = sum(col_widths.values())
-    # Optional: print(f"Total table width: {total_width}mm / Usable: {pdf.w - pdf.l_margin - pdf.r_margin}mm")
-
-    headers = ["Material", "Properties", "Application", "Rationale"]
-    header_keys = ["material", "properties", "application", "rationale"] # Keys for width dict
-
-    # --- Draw Table Header ---
-    for i, header in enumerate(headers):
-        key = header_keys[i]
-        pdf.cell(col_widths[key], 10, header, border=1, align="C", fill=True)
-    pdf.ln() # Move to next line after header
+    # Rows handle their own page breaks, so keep fpdf from breaking inside a cell
+    pdf.set_auto_page_break(auto=False, margin=15)
+    if pdf.get_y() + HEADER_ROW_HEIGHT + LINE_HEIGHT + 2 * CELL_PADDING_VERT > pdf.page_break_trigger:
+        pdf.add_page()
+    draw_table_header(pdf)
+    pdf.at_table_top = True
 
     # --- Draw Table Rows ---
-    pdf.set_font("Arial", "", 9) # Table body font
-    pdf.set_fill_color(255, 255, 255) # White background for rows
-    line_height_ratio = 5 # Approx height per line of text in mm for multi_cell
-    cell_padding_horiz = 2  # Horizontal padding (left/right) in mm
-    cell_padding_vert = 2   # Vertical padding (top) in mm
-
     for material in recommendations.get("materials", []):
         # Prepare cell data
-        material_name = str(material.get("name", "N/A"))
         properties_str = "\n".join([f"{key}: {value}" for key, value in material.get("properties", {}).items()])
-        application_str = str(material.get("application", "N/A"))
-        rationale_str = str(material.get("rationale", "N/A"))
-
         cell_data = [
-            material_name,
+            str(material.get("name", "N/A")),
             properties_str,
-            application_str,
-            rationale_str
+            str(material.get("application", "N/A")),
+            str(material.get("rationale", "N/A"))
         ]
 
-        # Store cursor position before drawing the row
-        start_x = pdf.get_x()
-        start_y = pdf.get_y()
-        max_y = start_y # Track the lowest point reached by any cell's *content* in this row
-
-        # --- Calculate content height and draw text first (without borders) ---
-        content_end_y_per_cell = {}
-        current_x = start_x
-        for i, data in enumerate(cell_data):
-            key = header_keys[i]
-            col_width = col_widths[key]
-            text_area_width = col_width - (2 * cell_padding_horiz)
-            align = 'L'
-
-            # Set position for text content with padding
-            pdf.set_xy(current_x + cell_padding_horiz, start_y + cell_padding_vert)
-            pdf.multi_cell(text_area_width, line_height_ratio, data, border=0, align=align, fill=False)
-
-            # Record where the content ended for this cell
-            content_end_y_per_cell[i] = pdf.get_y()
-            # Update the maximum Y position based on content bottom + padding
-            max_y = max(max_y, content_end_y_per_cell[i] + cell_padding_vert)
-
-            # Update X for the next cell calculation (though we reset XY each time)
-            current_x += col_width
-
-        # --- Draw the Borders for the entire row ---
-        # Now that we know the maximum height needed (max_y - start_y)
-        actual_row_height = max_y - start_y
-        current_x = start_x # Reset X to start of row
-        for i, data in enumerate(cell_data):
-             key = header_keys[i]
-             col_width = col_widths[key]
-             pdf.rect(current_x, start_y, col_width, actual_row_height) # Draw border rectangle
-             current_x += col_width
-
-
-        # After drawing all cells & borders, move the cursor below the row
-        pdf.set_y(max_y)
+        # Measure each cell once
+        cell_lines = [
+            split_lines(pdf, COL_WIDTHS[key] - 2 * CELL_PADDING_HORIZ, data)
+            for key, data in zip(HEADER_KEYS, cell_data)
+        ]
+        draw_table_row(pdf, cell_lines)
 
     # --- END OF TABLE ---
+    pdf.set_auto_page_break(auto=True, margin=15)
     pdf.ln(10) # Add space after the table
 
     # --- Additional Sections ---
@@ -162,13 +211,34 @@ def generate_pdf(recommendations: Dict[str, Any], filename: str) -> str:
             pdf.multi_cell(0, 5, str(text), border=0, align="L")
             pdf.ln(5) # Add space after each section's content
 
+    return bytes(pdf.output())
+
+def generate_pdf(recommendations: Dict[str, Any], filename: str) -> str:
+    output_dir = get_output_dir()
+    os.makedirs(output_dir, exist_ok=True)
+    pdf_path = os.path.join(output_dir, filename)
+    # Reports are named by content, an existing one was rendered from the same data by another process
+    if os.path.isfile(pdf_path):
+        return pdf_path
+
     # --- Output PDF ---
+    tmp_path = None
     try:
-        pdf.output(pdf_path)
-        print(f"PDF generated successfully at: {pdf_path}") # Add confirmation
+        pdf_bytes = render_pdf(recommendations)
+        # Write to a temporary file of our own first so a half-written report is never served,
+        # other processes may be rendering the same report at the same time
+        fd, tmp_path = tempfile.mkstemp(dir=output_dir, prefix=filename + ".", suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(pdf_bytes)
+        os.replace(tmp_path, pdf_path)
+        logger.info("PDF generated successfully at: %s", pdf_path) # Add confirmation
         return pdf_path
     except Exception as e:
-        print(f"Error generating PDF: {e}") # Add error handling
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        if os.path.isfile(pdf_path):
+            return pdf_path
+        logger.error("Error generating PDF: %s", e) # Add error handling
         return None
 
 # Example Usage (how you'd call it):
@@ -0,0 +1,156 @@
+import os
+import re
+import time
+import asyncio
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, Future
+from typing import Dict, Any, Optional
+from app.report_store import report_store, content_hash, content_filename, get_output_dir, REPORT_EVICTION_INTERVAL
+from app.metrics import PDF_RENDER_SECONDS, register_queue_depth
+
+logger = logging.getLogger(__name__)
+
+# PDF rendering pool configuration
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "2"))  # Processes rendering PDFs
+REPORT_JOB_TTL = float(os.getenv("REPORT_JOB_TTL", "3600"))  # Seconds failed renders stay in the render table
+REPORT_RENDER_TIMEOUT = float(os.getenv("REPORT_RENDER_TIMEOUT", "600"))  # Seconds after which a queued render counts as abandoned
+
+REPORT_ID_PATTERN = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def legacy_report_filename(report_id: str) -> str:
+    # Reports rendered before content-addressed storage were named after the request id
+    return f"MaterialMind_Recommendation_{report_id}.pdf"
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Spawned workers don't inherit the server's event loop or threads
+            _executor = ProcessPoolExecutor(
+                max_workers=REPORT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+
+def render_report(recommendations: Dict[str, Any], filename: str, report_hash: str) -> tuple:
+    """
+    Runs in a pool worker: render the PDF and return (pdf_path, render_seconds)
+    """
+    # fpdf is only needed here, so server processes never import it
+    from app.pdf_service import generate_pdf
+    report_store.set_render_status(report_hash, "rendering")
+    start = time.perf_counter()
+    pdf_path = generate_pdf(recommendations, filename)
+    return pdf_path, time.perf_counter() - start
+
+
+def _on_render_done(report_hash: str, future: Future):
+    try:
+        pdf_path, render_seconds = future.result()
+        PDF_RENDER_SECONDS.observe(render_seconds)
+        error = None if pdf_path else "PDF rendering failed"
+    except Exception as e:
+        pdf_path = None
+        error = str(e)
+
+    if pdf_path:
+        report_store.add_blob(report_hash)
+    report_store.finish_render(report_hash, error)
+
+
+def submit_report(report_id: str, recommendations: Dict[str, Any]) -> str:
+    """
+    Register a report for a request and queue it for rendering unless a report with the
+    same content already exists or is being rendered, by this or another server process.
+    Returns the report filename.
+    """
+    report_hash = content_hash(recommendations)
+    filename = content_filename(report_hash)
+    report_store.add_report(report_id, report_hash)
+
+    if report_store.has_blob(report_hash):
+        report_store.touch_blob(report_hash)
+        return filename
+    if not report_store.claim_render(report_hash, REPORT_RENDER_TIMEOUT):
+        # Already queued or rendering
+        return filename
+    if report_store.has_blob(report_hash):
+        # Finished by another process since the check above
+        report_store.finish_render(report_hash)
+        return filename
+
+    future = _get_executor().submit(render_report, recommendations, filename, report_hash)
+    future.add_done_callback(lambda f: _on_render_done(report_hash, f))
+    return filename
+
+
+def get_report_status(report_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Status of a report: queued, rendering, done or failed. None if the report is unknown.
+    """
+    if not REPORT_ID_PATTERN.match(report_id):
+        return None
+
+    report_hash = report_store.get_report_hash(report_id)
+    if report_hash is None:
+        # Reports from before content-addressed storage that the eviction loop hasn't migrated yet
+        pdf_path = os.path.join(get_output_dir(), legacy_report_filename(report_id))
+        if os.path.isfile(pdf_path):
+            return {"report_id": report_id, "status": "done", "pdf_path": pdf_path, "error": None}
+        return None
+
+    render = report_store.get_render(report_hash)
+    if render is not None:
+        if render["status"] != "failed" and time.time() - render["updated_at"] > REPORT_RENDER_TIMEOUT:
+            # The process rendering it stopped, the next request for this content renders it again
+            return {"report_id": report_id, "status": "failed", "pdf_path": None, "error": "Rendering was abandoned"}
+        return {"report_id": report_id, "status": render["status"], "pdf_path": None, "error": render["error"]}
+
+    if report_store.has_blob(report_hash):
+        report_store.touch_blob(report_hash)
+        return {"report_id": report_id, "status": "done", "pdf_path": report_store.blob_path(report_hash), "error": None}
+    return None
+
+
+def get_queue_depth() -> int:
+    return report_store.render_queue_depth(REPORT_RENDER_TIMEOUT)
+
+
+register_queue_depth("pdf", get_queue_depth)
+
+
+async def run_report_eviction():
+    """
+    Background loop applying the report retention policy
+    """
+    while True:
+        try:
+            migrated = await asyncio.to_thread(report_store.migrate_legacy_reports)
+            if migrated:
+                logger.info("Moved %d legacy reports into content-addressed storage", migrated)
+            deleted = await asyncio.to_thread(report_store.evict)
+            await asyncio.to_thread(report_store.prune_renders, max(REPORT_JOB_TTL, REPORT_RENDER_TIMEOUT))
+            if deleted:
+                logger.info("Evicted %d old reports", deleted)
+        except Exception as e:
+            logger.error("Report eviction failed: %s", e)
+        await asyncio.sleep(REPORT_EVICTION_INTERVAL)
+
+
+def shutdown_report_pool(wait: bool = True):
+    """
+    Stop the rendering pool, by default after queued reports have finished
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=wait)
+            _executor = None
@@ -0,0 +1,239 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, Any, Optional
+from app.db import thread_local_connection
+
+# Retention policy for rendered reports
+REPORT_MAX_BYTES = int(os.getenv("REPORT_MAX_BYTES", str(512 * 1024 * 1024)))  # Total size kept on disk
+REPORT_MAX_AGE = float(os.getenv("REPORT_MAX_AGE", str(30 * 24 * 3600)))  # Seconds since last access
+REPORT_EVICTION_INTERVAL = float(os.getenv("REPORT_EVICTION_INTERVAL", "600"))  # Seconds between eviction runs
+
+
+def get_output_dir() -> str:
+    return os.path.join(os.getcwd(), "outputs")
+
+
+def content_hash(recommendations: Dict[str, Any]) -> str:
+    """
+    Hash of the recommendation content a report is rendered from
+    """
+    canonical = json.dumps(recommendations, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def content_filename(report_hash: str) -> str:
+    return f"MaterialMind_Report_{report_hash}.pdf"
+
+
+# Filenames of reports rendered before content-addressed storage
+LEGACY_REPORT_PATTERN = re.compile(
+    r"^MaterialMind_Recommendation_([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})\.pdf$"
+)
+
+
+REPORT_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS reports ("
+    "report_id TEXT PRIMARY KEY, content_hash TEXT NOT NULL, created_at REAL NOT NULL);"
+    "CREATE INDEX IF NOT EXISTS idx_reports_hash ON reports (content_hash);"
+    "CREATE TABLE IF NOT EXISTS blobs ("
+    "content_hash TEXT PRIMARY KEY, filename TEXT NOT NULL, size INTEGER NOT NULL, "
+    "created_at REAL NOT NULL, last_accessed REAL NOT NULL);"
+    "CREATE INDEX IF NOT EXISTS idx_blobs_accessed ON blobs (last_accessed);"
+    "CREATE TABLE IF NOT EXISTS renders ("
+    "content_hash TEXT PRIMARY KEY, status TEXT NOT NULL, error TEXT, "
+    "created_at REAL NOT NULL, updated_at REAL NOT NULL);"
+)
+
+
+class ReportStore:
+    """
+    SQLite index of content-addressed reports.
+
+    `reports` maps request ids to content hashes, `blobs` tracks one rendered file per content hash
+    with its size and last access time for eviction. `renders` holds the reports being rendered or
+    that failed, so every server process sees the same status and renders a content hash once.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = os.path.join(directory, "reports.db")
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        return thread_local_connection(self.path, self._local, REPORT_SCHEMA)
+
+    def blob_path(self, report_hash: str) -> str:
+        return os.path.join(self.directory, content_filename(report_hash))
+
+    def add_report(self, report_id: str, report_hash: str):
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO reports (report_id, content_hash, created_at) VALUES (?, ?, ?)",
+            (report_id, report_hash, time.time())
+        )
+        conn.commit()
+
+    def get_report_hash(self, report_id: str) -> Optional[str]:
+        row = self._connect().execute(
+            "SELECT content_hash FROM reports WHERE report_id = ?", (report_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def has_blob(self, report_hash: str) -> bool:
+        """
+        True when the report for this content is indexed and still on disk
+        """
+        row = self._connect().execute(
+            "SELECT filename FROM blobs WHERE content_hash = ?", (report_hash,)
+        ).fetchone()
+        return row is not None and os.path.isfile(os.path.join(self.directory, row[0]))
+
+    def add_blob(self, report_hash: str):
+        path = self.blob_path(report_hash)
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO blobs (content_hash, filename, size, created_at, last_accessed) VALUES (?, ?, ?, ?, ?)",
+            (report_hash, os.path.basename(path), os.path.getsize(path), now, now)
+        )
+        conn.commit()
+
+    def touch_blob(self, report_hash: str):
+        conn = self._connect()
+        conn.execute("UPDATE blobs SET last_accessed = ? WHERE content_hash = ?", (time.time(), report_hash))
+        conn.commit()
+
+    def claim_render(self, report_hash: str, stale_after: float) -> bool:
+        """
+        Mark a report as queued for rendering by the caller. False when it is already queued or
+        rendering, unless that render was last updated more than stale_after seconds ago.
+        """
+        now = time.time()
+        conn = self._connect()
+        claimed = conn.execute(
+            "INSERT INTO renders (content_hash, status, error, created_at, updated_at) VALUES (?, 'queued', NULL, ?, ?) "
+            "ON CONFLICT (content_hash) DO UPDATE SET status = 'queued', error = NULL, created_at = excluded.created_at, "
+            "updated_at = excluded.updated_at WHERE renders.status = 'failed' OR renders.updated_at <= ?",
+            (report_hash, now, now, now - stale_after)
+        ).rowcount
+        conn.commit()
+        return claimed == 1
+
+    def set_render_status(self, report_hash: str, status: str, error: Optional[str] = None):
+        conn = self._connect()
+        conn.execute(
+            "UPDATE renders SET status = ?, error = ?, updated_at = ? WHERE content_hash = ?",
+            (status, error, time.time(), report_hash)
+        )
+        conn.commit()
+
+    def finish_render(self, report_hash: str, error: Optional[str] = None):
+        """
+        A finished render is answered by its blob, only failures are kept
+        """
+        if error:
+            self.set_render_status(report_hash, "failed", error)
+            return
+        conn = self._connect()
+        conn.execute("DELETE FROM renders WHERE content_hash = ?", (report_hash,))
+        conn.commit()
+
+    def get_render(self, report_hash: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(
+            "SELECT status, error, updated_at FROM renders WHERE content_hash = ?", (report_hash,)
+        ).fetchone()
+        return {"status": row[0], "error": row[1], "updated_at": row[2]} if row else None
+
+    def render_queue_depth(self, stale_after: float) -> int:
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM renders WHERE status IN ('queued', 'rendering') AND updated_at > ?",
+            (time.time() - stale_after,)
+        ).fetchone()[0]
+
+    def prune_renders(self, max_age: float) -> int:
+        """
+        Forget failed and abandoned renders last updated more than max_age seconds ago
+        """
+        conn = self._connect()
+        deleted = conn.execute("DELETE FROM renders WHERE updated_at < ?", (time.time() - max_age,)).rowcount
+        conn.commit()
+        return deleted
+
+    def _delete_blob(self, conn: sqlite3.Connection, report_hash: str, filename: str):
+        try:
+            os.remove(os.path.join(self.directory, filename))
+        except FileNotFoundError:
+            pass
+        conn.execute("DELETE FROM blobs WHERE content_hash = ?", (report_hash,))
+        conn.execute("DELETE FROM reports WHERE content_hash = ?", (report_hash,))
+
+    def migrate_legacy_reports(self) -> int:
+        """
+        Move reports named after their request id into content-addressed storage so the retention
+        policy covers them. Their recommendations are gone, so they are keyed by a hash of the file.
+        Returns the number of reports migrated.
+        """
+        migrated = 0
+        self._connect()  # Creates the directory on first use
+        for name in os.listdir(self.directory):
+            match = LEGACY_REPORT_PATTERN.match(name)
+            if not match:
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, "rb") as f:
+                    report_hash = hashlib.sha256(f.read()).hexdigest()
+                last_accessed = os.path.getmtime(path)
+                os.replace(path, self.blob_path(report_hash))
+            except FileNotFoundError:
+                # Migrated by another process
+                continue
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO blobs (content_hash, filename, size, created_at, last_accessed) VALUES (?, ?, ?, ?, ?)",
+                (report_hash, content_filename(report_hash), os.path.getsize(self.blob_path(report_hash)), last_accessed, last_accessed)
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO reports (report_id, content_hash, created_at) VALUES (?, ?, ?)",
+                (match.group(1), report_hash, last_accessed)
+            )
+            conn.commit()
+            migrated += 1
+        return migrated
+
+    def evict(self, max_bytes: int = REPORT_MAX_BYTES, max_age: float = REPORT_MAX_AGE) -> int:
+        """
+        Delete reports not accessed within max_age, then the least recently accessed ones
+        until the total size fits in max_bytes. Returns the number of reports deleted.
+        """
+        conn = self._connect()
+        deleted = 0
+
+        expired = conn.execute(
+            "SELECT content_hash, filename FROM blobs WHERE last_accessed < ?", (time.time() - max_age,)
+        ).fetchall()
+        for report_hash, filename in expired:
+            self._delete_blob(conn, report_hash, filename)
+            deleted += 1
+
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        if total > max_bytes:
+            for report_hash, filename, size in conn.execute(
+                "SELECT content_hash, filename, size FROM blobs ORDER BY last_accessed"
+            ).fetchall():
+                if total <= max_bytes:
+                    break
+                self._delete_blob(conn, report_hash, filename)
+                total -= size
+                deleted += 1
+
+        conn.commit()
+        return deleted
+
+
+report_store = ReportStore(get_output_dir())
@@ -0,0 +1,134 @@
+import time
+import random
+import asyncio
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+
+class CircuitOpenError(Exception):
+    """Raised when the circuit breaker is open and calls are being rejected"""
+
+
+class TokenBucket:
+    """
+    Async token-bucket rate limiter.
+
+    Tokens refill continuously at `rate` per second up to `capacity`, a rate of 0 disables the limit.
+    A Retry-After from upstream can pause the whole bucket so no caller fires again before the server allows it.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def pause(self, seconds: float):
+        """Stop handing out tokens for `seconds`, e.g. after a 429 with Retry-After"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    async def acquire(self):
+        # The lock keeps waiters in FIFO order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                if self.rate <= 0:
+                    # Unlimited, only upstream pauses apply
+                    return
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for `reset_timeout`
+    seconds, then lets a single trial call through (half-open) before closing again.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.half_open_trial = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def check(self) -> bool:
+        """
+        Raise CircuitOpenError while open. Returns True when the caller got the half-open trial,
+        which must then end in record_success, record_failure or release_trial.
+        """
+        state = self.state
+        if state == "open":
+            raise CircuitOpenError("Groq API circuit breaker is open, try again later")
+        if state == "half-open":
+            if self.half_open_trial:
+                raise CircuitOpenError("Groq API circuit breaker is half-open, trial call in progress")
+            self.half_open_trial = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.half_open_trial = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.half_open_trial = False
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+    def release_trial(self):
+        """End a trial call whose outcome says nothing about upstream health, e.g. a 429 or a bad request"""
+        self.half_open_trial = False
+
+
+def backoff_delay(attempt: int, base: float, maximum: float) -> float:
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(maximum, base * (2 ** attempt)))
+
+
+def parse_retry_after(headers) -> Optional[float]:
+    """
+    Read a Retry-After (or retry-after-ms) header as seconds, None if absent or invalid
+    """
+    if headers is None:
+        return None
+    retry_ms = headers.get("retry-after-ms")
+    if retry_ms:
+        try:
+            return float(retry_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,188 @@
+import os
+import asyncio
+import hashlib
+import anyio
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Dict, Optional, Tuple
+from starlette.datastructures import Headers
+from starlette.responses import Response, StreamingResponse
+from starlette.types import Scope, Receive, Send
+from app.units import parse_properties
+
+
+def with_si_properties(material: Dict[str, Any]) -> Dict[str, Any]:
+    return {**material, "properties_si": parse_properties(material.get("properties") or {})}
+
+
+def build_response(description: str, recommendations: Dict[str, Any], report_id: str, pdf_filename: str,
+                   similar_match: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    The recommendation response body, shared by the API and the CLI's direct mode
+    """
+    return {
+        "product_description": description,
+        "materials": [with_si_properties(material) for material in recommendations["materials"]],
+        "recommendations": recommendations["general_recommendations"],
+        "pdf_path": pdf_filename,
+        "report_id": report_id,
+        "similar_match": similar_match
+    }
+
+
+def parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range "bytes=start-end" header into an inclusive (start, end).
+
+    Returns None when the header should be ignored (malformed, multiple ranges, or a last byte
+    before the first, which RFC 9110 treats as invalid) and (-1, -1) when the range can't be
+    satisfied because it starts past the end of the file.
+    """
+    unit, _, ranges = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in ranges:
+        return None
+    start_str, _, end_str = ranges.strip().partition("-")
+    try:
+        if not start_str:
+            # Suffix range, the last N bytes
+            length = int(end_str)
+            if length <= 0:
+                return (-1, -1)
+            return (max(0, size - length), size - 1)
+        start = int(start_str)
+        end = int(end_str) if end_str else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        return (-1, -1)
+    if end < start:
+        return None
+    return (start, min(end, size - 1))
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    Streaming response that starts while the request body is still being read.
+
+    StreamingResponse listens for the client disconnecting on the same receive channel the body
+    arrives on, which would swallow body chunks. Listening starts once `body_read` is set, until
+    then the body reader sees a disconnect itself.
+    """
+
+    def __init__(self, content, body_read: asyncio.Event, **kwargs):
+        super().__init__(content, **kwargs)
+        self.body_read = body_read
+
+    async def listen_for_disconnect(self, receive: Receive) -> None:
+        await self.body_read.wait()
+        await super().listen_for_disconnect(receive)
+
+
+class RangeFileResponse(Response):
+    """
+    File response with ETag/Last-Modified validation and single-range (206) support.
+
+    The body is sent with the ASGI zero-copy send extension when the server offers it,
+    otherwise it is streamed in chunks read off the event loop.
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, path: str, request_headers: Headers, media_type: str = "application/pdf", filename: Optional[str] = None, method: str = "GET"):
+        self.path = path
+        self.background = None
+        self.send_header_only = method.upper() == "HEAD"
+
+        stat_result = os.stat(path)
+        size = stat_result.st_size
+        etag = '"' + hashlib.md5(f"{stat_result.st_mtime}-{size}".encode(), usedforsecurity=False).hexdigest() + '"'
+        last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+
+        headers = {
+            "accept-ranges": "bytes",
+            "etag": etag,
+            "last-modified": last_modified
+        }
+        if filename:
+            headers["content-disposition"] = f'inline; filename="{filename}"'
+
+        self.status_code = 200
+        self.offset = 0
+        self.count = size
+
+        if self._not_modified(request_headers, etag, stat_result.st_mtime):
+            self.status_code = 304
+            self.count = 0
+        else:
+            range_header = request_headers.get("range")
+            if_range = request_headers.get("if-range")
+            # A stale If-Range means the client's partial copy is outdated, send the whole file
+            if range_header and (not if_range or if_range == etag or if_range == last_modified):
+                byte_range = parse_range(range_header, size)
+                if byte_range == (-1, -1):
+                    self.status_code = 416
+                    self.count = 0
+                    headers["content-range"] = f"bytes */{size}"
+                elif byte_range is not None:
+                    start, end = byte_range
+                    self.status_code = 206
+                    self.offset = start
+                    self.count = end - start + 1
+                    headers["content-range"] = f"bytes {start}-{end}/{size}"
+
+        if self.status_code != 304:
+            headers["content-length"] = str(self.count)
+        # Only responses carrying the file get a content type
+        self.media_type = media_type if self.status_code in (200, 206) else None
+        self.init_headers(headers)
+
+    @staticmethod
+    def _not_modified(request_headers: Headers, etag: str, mtime: float) -> bool:
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match:
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            return "*" in tags or etag in tags or f"W/{etag}" in tags
+        if_modified_since = request_headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers
+        })
+        if self.send_header_only or self.count == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            # Let the server sendfile() straight from the page cache
+            with open(self.path, "rb") as file:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": file,
+                    "offset": self.offset,
+                    "count": self.count,
+                    "more_body": False
+                })
+            return
+
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.offset)
+            remaining = self.count
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({
+                    "type": "http.response.body",
+                    "body": chunk,
+                    "more_body": remaining > 0
+                })
+            if remaining > 0:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
@@ -0,0 +1,254 @@
+import os
+import re
+import time
+import asyncio
+import threading
+from collections import deque
+from typing import Dict, Any, List, Optional, Callable, Awaitable
+from app.metrics import usage_tokens, LLM_MODEL_SECONDS, LLM_COST, LLM_HEDGES
+
+# Model routing configuration
+LLM_ROUTE_SLOWDOWN = float(os.getenv("LLM_ROUTE_SLOWDOWN", "2"))  # How much slower than the fastest capable model the preferred one may be
+LLM_HEDGE = os.getenv("LLM_HEDGE", "false").lower() in ("1", "true", "yes")  # Send a duplicate request when a call runs long
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))  # Latency samples needed before hedging a model
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5"))  # Seconds, lower bound of the p95 hedge delay
+LLM_ROUTE_MAX_AGE = float(os.getenv("LLM_ROUTE_MAX_AGE", "120"))  # Seconds a latency sample counts for routing
+LLM_ROUTE_PROBE_INTERVAL = float(os.getenv("LLM_ROUTE_PROBE_INTERVAL", "60"))  # Min seconds between probe calls to a model without recent samples
+LATENCY_WINDOW = 200  # Recent calls per model kept for percentiles
+
+# USD per million (prompt, completion) tokens, override or extend with
+# LLM_MODEL_PRICES="model=prompt/completion,..."
+DEFAULT_PRICES = {
+    "llama3-8b-8192": (0.05, 0.08),
+    "llama3-70b-8192": (0.59, 0.79),
+    "mixtral-8x7b-32768": (0.24, 0.24),
+    "gemma-7b-it": (0.07, 0.07)
+}
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+CLAUSE_PATTERN = re.compile(r"[,;\n]|\band\b|\bwith\b|\bwhile\b", re.IGNORECASE)
+NUMBER_PATTERN = re.compile(r"\d+(?:\.\d+)?")
+
+
+def count_tokens(text: Optional[str]) -> int:
+    """
+    Approximate token count without the model's tokenizer: one per word or symbol, plus one
+    per 8 characters of long words, which BPE vocabularies split
+    """
+    if not text:
+        return 0
+    return sum(1 + len(piece) // 8 for piece in TOKEN_PATTERN.findall(str(text)))
+
+
+def count_message_tokens(messages: List[Dict[str, Any]]) -> int:
+    # A few tokens of chat-template framing per message
+    return sum(count_tokens(message.get("content")) + 4 for message in messages)
+
+
+def request_complexity(product_description: str, additional_requirements: Any = None,
+                       material_context: Optional[str] = None) -> float:
+    """
+    Rough 0-1 score of how demanding a request is: its length, the number of separate requirements
+    and numeric constraints in it, and whether a screened shortlist has to be taken into account
+    """
+    text = f"{product_description or ''}\n{additional_requirements or ''}"
+    score = count_tokens(text) / 300
+    score += 0.05 * len(CLAUSE_PATTERN.findall(text))
+    score += 0.05 * len(NUMBER_PATTERN.findall(text))
+    if material_context:
+        score += 0.2
+    return min(1.0, score)
+
+
+def parse_prices(spec: str) -> Dict[str, tuple]:
+    prices = dict(DEFAULT_PRICES)
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        model, _, value = item.partition("=")
+        prompt_price, _, completion_price = value.partition("/")
+        prices[model.strip()] = (float(prompt_price), float(completion_price or prompt_price))
+    return prices
+
+
+class ModelStats:
+    """
+    Latency and usage of one model, with a window of recent call latencies for percentiles
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.probes = 0
+        self.last_probe = float("-inf")
+        self.recent = deque(maxlen=LATENCY_WINDOW)  # (monotonic time, seconds)
+
+    def percentile(self, fraction: float, max_age: Optional[float] = None) -> Optional[float]:
+        """
+        Latency percentile of the recent calls, of those in the last max_age seconds if given
+        """
+        since = float("-inf") if max_age is None else time.monotonic() - max_age
+        ordered = sorted(seconds for at, seconds in self.recent if at >= since)
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class ModelRouter:
+    """
+    Picks a model per request from LLM_MODELS, which lists models from cheapest to most capable.
+
+    The request's complexity sets the least capable model allowed. Of the allowed models, the
+    cheapest one is used unless its median latency is more than LLM_ROUTE_SLOWDOWN times that of
+    the fastest allowed one, so a congested model is routed around. The median ignores the odd
+    slow call, which hedging deals with.
+
+    Only calls from the last LLM_ROUTE_MAX_AGE seconds count. A model without any, because it was
+    routed around or never used, has an unknown latency. The preferred model then gets one probe
+    call per LLM_ROUTE_PROBE_INTERVAL, so it gets traffic back once it has recovered. The more
+    capable alternatives are only probed while the preferred model is measurably slow, so they
+    don't take requests the preferred model handles well.
+    """
+
+    def __init__(self, models: List[str], prices: Dict[str, tuple]):
+        if not models:
+            raise ValueError("LLM_MODELS must name at least one model")
+        self.models = models
+        self.prices = prices
+        self._stats = {model: ModelStats() for model in models}
+        self._lock = threading.Lock()
+
+    def stats_for(self, model: str) -> ModelStats:
+        with self._lock:
+            if model not in self._stats:
+                self._stats[model] = ModelStats()
+            return self._stats[model]
+
+    def choose(self, complexity: float) -> str:
+        minimum = min(len(self.models) - 1, int(complexity * len(self.models)))
+        candidates = self.models[minimum:]
+        now = time.monotonic()
+        with self._lock:
+            latencies = [self._stats[model].percentile(0.5, LLM_ROUTE_MAX_AGE) for model in candidates]
+            if latencies[0] is None:
+                # The preferred model was routed around or is unused so far, measure it again
+                probe = [candidates[0]]
+            else:
+                # Alternatives only get probe calls while the preferred model is slow. Their older
+                # samples still show that, after their recent ones expired.
+                reference = [
+                    latency if latency is not None else self._stats[model].percentile(0.5)
+                    for model, latency in zip(candidates, latencies)
+                ]
+                known = [latency for latency in reference if latency is not None]
+                probe = candidates[1:] if latencies[0] > min(known) * LLM_ROUTE_SLOWDOWN else []
+            for model in probe:
+                stats = self._stats[model]
+                if latencies[candidates.index(model)] is None and now - stats.last_probe >= LLM_ROUTE_PROBE_INTERVAL:
+                    stats.last_probe = now
+                    stats.probes += 1
+                    return model
+        known = [latency for latency in latencies if latency is not None]
+        if not known:
+            return candidates[0]
+        fastest = min(known)
+        for model, latency in zip(candidates, latencies):
+            if latency is not None and latency <= fastest * LLM_ROUTE_SLOWDOWN:
+                return model
+        return candidates[0]
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """
+        Seconds to wait before hedging a call to `model`: its p95 latency, None without enough samples
+        """
+        if not LLM_HEDGE:
+            return None
+        stats = self.stats_for(model)
+        with self._lock:
+            if len(stats.recent) < LLM_HEDGE_MIN_SAMPLES:
+                return None
+            return max(LLM_HEDGE_MIN_DELAY, stats.percentile(0.95))
+
+    def record(self, model: str, seconds: float, usage: Any = None):
+        prompt_tokens, completion_tokens = usage_tokens(usage)
+        prompt_price, completion_price = self.prices.get(model, (0.0, 0.0))
+        cost = (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+        stats = self.stats_for(model)
+        with self._lock:
+            stats.calls += 1
+            stats.prompt_tokens += prompt_tokens
+            stats.completion_tokens += completion_tokens
+            stats.cost += cost
+            stats.recent.append((time.monotonic(), seconds))
+        LLM_MODEL_SECONDS.labels(model).observe(seconds)
+        if cost:
+            LLM_COST.labels(model).inc(cost)
+
+    def record_error(self, model: str):
+        stats = self.stats_for(model)
+        with self._lock:
+            stats.errors += 1
+
+    def record_hedge(self, model: str, won: bool):
+        stats = self.stats_for(model)
+        with self._lock:
+            stats.hedges += 1
+            stats.hedge_wins += int(won)
+        LLM_HEDGES.labels(model, "won" if won else "lost").inc()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            models = {}
+            for model, stats in self._stats.items():
+                p50, p95 = stats.percentile(0.5), stats.percentile(0.95)
+                models[model] = {
+                    "calls": stats.calls,
+                    "errors": stats.errors,
+                    "hedges": stats.hedges,
+                    "hedge_wins": stats.hedge_wins,
+                    "probes": stats.probes,
+                    "p50_seconds": None if p50 is None else round(p50, 4),
+                    "p95_seconds": None if p95 is None else round(p95, 4),
+                    "prompt_tokens": stats.prompt_tokens,
+                    "completion_tokens": stats.completion_tokens,
+                    "cost_usd": round(stats.cost, 6),
+                    "cost_per_call_usd": round(stats.cost / stats.calls, 6) if stats.calls else None
+                }
+        return {"models": models, "hedging": LLM_HEDGE, "route_slowdown": LLM_ROUTE_SLOWDOWN, "route_max_age": LLM_ROUTE_MAX_AGE}
+
+
+async def hedged_call(call: Callable[[], Awaitable[Any]], delay: Optional[float],
+                      hedge: Optional[Callable[[], Awaitable[Any]]] = None,
+                      can_hedge: Optional[Callable[[], bool]] = None) -> tuple:
+    """
+    Run `call`, and if it hasn't finished after `delay` seconds run `hedge` (by default `call`
+    again) alongside it, unless `can_hedge()` says there is no capacity for it. The first successful
+    result wins and the other call is cancelled, as is every call when the caller is cancelled.
+    Returns (result, hedged, hedge_won).
+    """
+    first = asyncio.ensure_future(call())
+    pending = {first}
+    try:
+        if delay is not None:
+            _, pending = await asyncio.wait(pending, timeout=delay)
+        if not pending:
+            return first.result(), False, False
+        if delay is None or (can_hedge is not None and not can_hedge()):
+            return await first, False, False
+
+        second = asyncio.ensure_future((hedge or call)())
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), True, task is second
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
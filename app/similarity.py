@@ -0,0 +1,367 @@
+import os
+import re
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from typing import Dict, Any, Optional, Set, Iterable
+from app.cache import CACHE_DIR, CACHE_TTL
+from app.db import thread_local_connection
+from app.units import UNITS, canonical_unit
+
+# Near-duplicate request matching
+SIMILAR_DB_PATH = os.getenv("SIMILAR_DB_PATH", os.path.join(CACHE_DIR, "similar.db"))
+SIMILAR_MATCHING = os.getenv("SIMILAR_MATCHING", "false").lower() in ("1", "true", "yes")  # Default for ProductRequest.allow_similar
+SIMILAR_THRESHOLD = float(os.getenv("SIMILAR_THRESHOLD", "0.9"))  # Min Jaccard similarity of the normalized terms
+SIMILAR_REFRESH = os.getenv("SIMILAR_REFRESH", "true").lower() in ("1", "true", "yes")  # Regenerate similar matches in the background
+SIMILAR_REFRESH_MAX = int(os.getenv("SIMILAR_REFRESH_MAX", "4"))  # Max background regenerations at once
+SIMILAR_PERMUTATIONS = 64  # MinHash signature length
+SIMILAR_BANDS = 16  # LSH bands, candidates share at least one band of SIMILAR_PERMUTATIONS / SIMILAR_BANDS values
+SIMILAR_MERGE_SIZE = 1024  # New entries kept unsorted before they are merged into the band key index
+SIMILAR_CANDIDATES = 4  # Best estimated candidates checked against their exact terms
+
+# Prime just above 2^32, permutation h(x) = (a * x + b) mod p fits in uint64 for 32-bit x, a and b
+MERSENNE_PRIME = np.uint64(4294967311)
+_rng = np.random.RandomState(20240601)  # Fixed seed, signatures are persisted and shared across workers
+PERMUTATION_A = _rng.randint(1, 2 ** 32, size=SIMILAR_PERMUTATIONS, dtype=np.uint64)
+PERMUTATION_B = _rng.randint(0, 2 ** 32, size=SIMILAR_PERMUTATIONS, dtype=np.uint64)
+# Mixed into band keys so equal values in different bands don't collide
+BAND_SALTS = _rng.randint(1, 2 ** 63, size=SIMILAR_BANDS, dtype=np.uint64)
+
+# Words that mean the same thing in product descriptions -> one spelling, applied before stemming
+SYNONYMS = {
+    "uav": "drone", "uavs": "drone", "quadcopter": "drone", "multirotor": "drone", "multicopter": "drone",
+    "lightweight": "light", "light weight": "light", "low weight": "light", "featherweight": "light",
+    "tolerant": "resistant", "tolerance": "resistance", "withstand": "resistant", "withstands": "resistant",
+    "proof": "resistant", "durable": "robust", "tough": "robust", "rugged": "robust", "sturdy": "robust",
+    "aluminum": "aluminium", "enclosure": "housing", "casing": "housing", "shell": "housing",
+    "bike": "bicycle", "cycle": "bicycle", "inexpensive": "cheap", "affordable": "cheap", "low cost": "cheap",
+    "hot": "heat", "thermal": "heat", "temperatures": "temperature", "temp": "temperature",
+    "rust": "corrosion", "rusting": "corrosion", "corrosive": "corrosion", "outdoors": "outdoor",
+    "bracket": "mount", "mounting": "mount", "holder": "mount"
+}
+
+STOP_WORDS = {
+    "a", "an", "the", "and", "or", "for", "of", "to", "with", "in", "on", "at", "by", "from", "that", "which",
+    "must", "be", "should", "need", "needs", "i", "we", "want", "design", "designing", "make", "build", "able",
+    "can", "is", "are", "it", "its", "our", "my", "this", "very", "highly", "also", "use", "used", "using",
+    "product", "some", "good", "well", "as", "while", "between", "within", "has", "have", "will"
+}
+
+SUFFIXES = ("ations", "ation", "ness", "ments", "ment", "ings", "ing", "ance", "ence", "able", "ible",
+            "ant", "ent", "ive", "ers", "er", "ed", "ly", "s")
+
+# Multi-word synonyms, matched with a space or hyphen between the words ("low cost", "low-cost")
+PHRASE_PATTERN = re.compile(
+    r"\b(" + "|".join(re.escape(phrase).replace(r"\ ", "[ -]") for phrase in SYNONYMS if " " in phrase) + r")\b"
+)
+# Words and signed numbers: "impact", "-10°C", "6061"
+TOKEN_PATTERN = re.compile(r"[a-z]+|(?<![\w.])-?\d+(?:\.\d+)?|\d+(?:\.\d+)?")
+# Units found in product requests beyond the property units in app.units.UNITS
+REQUEST_UNITS = {
+    "n", "kn", "nm", "w", "kw", "v", "mah", "wh", "kwh", "hz", "khz", "db", "rpm", "h", "hr", "hrs", "hour",
+    "hours", "min", "km", "km/h", "kmh", "mph", "ft", "lb", "lbs", "oz", "l", "ml", "ton", "tons", "usd"
+}
+# "in" reads as a preposition after a number far more often than as inches
+QUANTITY_UNITS = sorted((set(UNITS) | REQUEST_UNITS) - {"in"}, key=len, reverse=True)
+# A number and the unit after it: "500 N", "-10°C", "300 INR". Words that aren't units ("10 years") leave the number alone.
+QUANTITY_PATTERN = re.compile(
+    r"(?<![\w.])(-?\d+(?:\.\d+)?)(?:\s*(°\s*[cf]|" + "|".join(map(re.escape, QUANTITY_UNITS)) + r")(?![a-z]))?"
+)
+# The word a negation applies to: "not corrosion resistant", "non-magnetic", "without coating", "doesn't rust"
+NEGATION_PATTERN = re.compile(
+    r"\b(?:not|no|non|without|never|nor|cannot)[\s-]+(?:be\s+|need\s+|require\s+)?([a-z]+)|\bnon([a-z]{3,})|n't\s+(?:be\s+)?([a-z]+)"
+)
+
+# Words that change the answer however much else two requests share: materials, environments,
+# required behaviour and the direction of limits
+STRICT_WORDS = {
+    "steel", "stainless", "aluminium", "titanium", "copper", "brass", "bronze", "magnesium", "zinc", "nickel",
+    "iron", "cast", "plastic", "polymer", "nylon", "abs", "pla", "pvc", "polycarbonate", "carbon", "glass",
+    "ceramic", "wood", "rubber", "composite", "concrete", "indoor", "outdoor", "marine", "underwater",
+    "submerged", "vacuum", "space", "food", "medical", "biocompatible", "cryogenic", "magnetic", "conductive",
+    "insulating", "transparent", "waterproof", "under", "over", "below", "above", "max", "min", "maximum",
+    "minimum", "least", "most", "less", "more"
+}
+
+
+def stem(word: str) -> str:
+    """
+    Crude suffix stripping, enough for "operating"/"operate" and "frames"/"frame" to meet
+    """
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            word = word[:-len(suffix)]
+            break
+    return word[:-1] if word.endswith("e") and len(word) > 4 else word
+
+
+def request_terms(product_description: str, additional_requirements: Any = None) -> Set[str]:
+    """
+    Normalized terms of a request: synonyms mapped, stop words dropped, words stemmed
+    """
+    text = f"{product_description or ''} {additional_requirements or ''}".lower()
+    text = PHRASE_PATTERN.sub(lambda match: SYNONYMS[re.sub(r"[ -]", " ", match.group(0))], text)
+    terms = set()
+    for token in TOKEN_PATTERN.findall(text):
+        word = SYNONYMS.get(token, token)
+        if word not in STOP_WORDS:
+            terms.add(stem(word) if word[0].isalpha() else word)
+    return terms
+
+
+def strict_terms(product_description: str, additional_requirements: Any = None) -> Set[str]:
+    """
+    Terms two requests must share exactly to stand in for each other: quantities with their unit,
+    negated words and the STRICT_WORDS they mention
+    """
+    text = f"{product_description or ''} {additional_requirements or ''}".lower()
+    text = PHRASE_PATTERN.sub(lambda match: SYNONYMS[re.sub(r"[ -]", " ", match.group(0))], text)
+    terms = {quantity_term(number, unit) for number, unit in QUANTITY_PATTERN.findall(text)}
+    for match in NEGATION_PATTERN.finditer(text):
+        word = next(filter(None, match.groups()))
+        terms.add("not " + stem(SYNONYMS.get(word, word)))
+    terms.update(word for word in (SYNONYMS.get(token, token) for token in TOKEN_PATTERN.findall(text)) if word in STRICT_WORDS)
+    return terms
+
+
+def quantity_term(number: str, unit: str) -> str:
+    """
+    A stated quantity in SI where app.units knows the unit, so "20 mm" and "2 cm" are the same term
+    """
+    value = float(number)
+    unit = canonical_unit(unit)
+    if unit in UNITS:
+        si_unit, factor, offset = UNITS[unit]
+        return f"{value * factor + offset:g}{si_unit}"
+    return f"{value:g}{unit}"
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+def minhash(terms: Set[str]) -> np.ndarray:
+    """
+    MinHash signature of a term set, SIMILAR_PERMUTATIONS uint32 values
+    """
+    hashes = np.fromiter((zlib.crc32(term.encode("utf-8")) for term in terms), dtype=np.uint64, count=len(terms))
+    permuted = (PERMUTATION_A[:, None] * hashes[None, :] + PERMUTATION_B[:, None]) % MERSENNE_PRIME
+    return permuted.min(axis=1).astype(np.uint32)
+
+
+def band_keys(signatures: np.ndarray, scope_hashes: np.ndarray) -> np.ndarray:
+    """
+    One uint64 key per LSH band for each row of an (n, SIMILAR_PERMUTATIONS) signature matrix.
+    The scope is part of the key, so only requests in the same scope become candidates.
+    """
+    rows = SIMILAR_PERMUTATIONS // SIMILAR_BANDS
+    bands = signatures.reshape(len(signatures), SIMILAR_BANDS, rows).astype(np.uint64)
+    keys = np.repeat(scope_hashes[:, None], SIMILAR_BANDS, axis=1) ^ BAND_SALTS
+    with np.errstate(over="ignore"):
+        for i in range(rows):
+            keys = (keys ^ bands[:, :, i]) * np.uint64(0x100000001B3)  # FNV-1a style mixing
+    return keys
+
+
+def make_scope(model: str, system_prompt: str) -> str:
+    """
+    Only requests answered with the same model and prompt can stand in for each other
+    """
+    return hashlib.sha256(f"{model}\0{system_prompt}".encode("utf-8")).hexdigest()[:16]
+
+
+def scope_hash(scope: str) -> int:
+    return int(hashlib.sha256(scope.encode("utf-8")).hexdigest()[:16], 16)
+
+
+SIMILAR_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS similar_requests ("
+    "id INTEGER PRIMARY KEY, scope TEXT NOT NULL, cache_key TEXT NOT NULL, "
+    "product_description TEXT NOT NULL, additional_requirements TEXT, terms TEXT NOT NULL, "
+    "signature BLOB NOT NULL, created_at REAL NOT NULL);"
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_similar_key ON similar_requests (scope, cache_key);"
+    "CREATE INDEX IF NOT EXISTS idx_similar_created ON similar_requests (created_at);"
+)
+
+
+class SimilarityIndex:
+    """
+    MinHash/LSH index of past requests, mapping a new request to the cache key of a near-duplicate.
+
+    Signatures live in SQLite so every worker shares them and they survive restarts. Each worker
+    keeps them in memory as NumPy arrays with the LSH band keys sorted, so a lookup is a handful
+    of binary searches rather than a scan; new entries wait in a small unsorted buffer until
+    SIMILAR_MERGE_SIZE of them are merged in. Candidates are checked against their exact terms,
+    and must state the same quantities, negations and materials (strict_terms).
+    """
+
+    def __init__(self, path: str, threshold: float = SIMILAR_THRESHOLD, max_age: float = CACHE_TTL):
+        self.path = path
+        self.threshold = threshold
+        self.max_age = max_age
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.stats = {"lookups": 0, "matches": 0, "indexed": 0}
+
+        # Entry arrays, row i is the i-th entry loaded
+        self._ids = np.empty(0, dtype=np.int64)
+        self._created = np.empty(0, dtype=np.float64)
+        self._scope_hashes = np.empty(0, dtype=np.uint64)
+        self._signatures = np.empty((0, SIMILAR_PERMUTATIONS), dtype=np.uint32)
+        # Sorted band keys and the entry row each belongs to, plus entries not merged yet
+        self._sorted_keys = np.empty(0, dtype=np.uint64)
+        self._sorted_rows = np.empty(0, dtype=np.int64)
+        self._pending_from = 0
+        self._last_id = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        return thread_local_connection(self.path, self._local, SIMILAR_SCHEMA)
+
+    def sync(self):
+        """
+        Load entries added since the last sync, by this worker or any other
+        """
+        rows = self._connect().execute(
+            "SELECT id, scope, signature, created_at FROM similar_requests WHERE id > ? AND created_at > ? ORDER BY id",
+            (self._last_id, time.time() - self.max_age)
+        ).fetchall()
+        with self._lock:
+            self._prune()
+            rows = [row for row in rows if row[0] > self._last_id]
+            if not rows:
+                return
+            self._ids = np.concatenate([self._ids, np.array([row[0] for row in rows], dtype=np.int64)])
+            self._created = np.concatenate([self._created, np.array([row[3] for row in rows], dtype=np.float64)])
+            self._scope_hashes = np.concatenate([self._scope_hashes, np.array([scope_hash(row[1]) for row in rows], dtype=np.uint64)])
+            signatures = np.frombuffer(b"".join(row[2] for row in rows), dtype=np.uint32).reshape(len(rows), SIMILAR_PERMUTATIONS)
+            self._signatures = np.concatenate([self._signatures, signatures])
+            self._last_id = rows[-1][0]
+            if len(self._ids) - self._pending_from >= SIMILAR_MERGE_SIZE:
+                self._merge()
+
+    def _prune(self):
+        # Drop entries past max_age once enough have expired to be worth re-sorting the band keys
+        expired = self._created <= time.time() - self.max_age
+        count = int(np.count_nonzero(expired))
+        if not count or (count < SIMILAR_MERGE_SIZE and count * 4 < len(self._ids)):
+            return
+        keep = ~expired
+        self._ids = self._ids[keep]
+        self._created = self._created[keep]
+        self._scope_hashes = self._scope_hashes[keep]
+        self._signatures = self._signatures[keep]
+        self._merge()
+
+    def _merge(self):
+        # Rebuild the sorted band keys over every entry, amortized over SIMILAR_MERGE_SIZE inserts
+        keys = band_keys(self._signatures, self._scope_hashes).ravel()
+        order = np.argsort(keys, kind="stable")
+        self._sorted_keys = keys[order]
+        self._sorted_rows = order // SIMILAR_BANDS
+        self._pending_from = len(self._ids)
+
+    def _candidate_rows(self, signature: np.ndarray, scope: str) -> np.ndarray:
+        query_keys = band_keys(signature[None, :], np.array([scope_hash(scope)], dtype=np.uint64))[0]
+        low = np.searchsorted(self._sorted_keys, query_keys, side="left")
+        high = np.searchsorted(self._sorted_keys, query_keys, side="right")
+        rows = [self._sorted_rows[lo:hi] for lo, hi in zip(low, high) if hi > lo]
+
+        # Entries not merged into the sorted keys yet
+        pending = self._signatures[self._pending_from:]
+        if len(pending):
+            matches = np.any(band_keys(pending, self._scope_hashes[self._pending_from:]) == query_keys, axis=1)
+            rows.append(np.flatnonzero(matches) + self._pending_from)
+        return np.unique(np.concatenate(rows)) if rows else np.empty(0, dtype=np.int64)
+
+    def find(self, scope: str, product_description: str, additional_requirements: Any = None) -> Optional[Dict[str, Any]]:
+        """
+        Most similar indexed request in the same scope at or above the threshold:
+        {"cache_key", "score", "product_description", "additional_requirements"}, or None
+        """
+        terms = request_terms(product_description, additional_requirements)
+        if not terms:
+            return None
+        self.sync()
+        signature = minhash(terms)
+        with self._lock:
+            self.stats["lookups"] += 1
+            rows = self._candidate_rows(signature, scope)
+            rows = rows[self._created[rows] > time.time() - self.max_age]
+            if not rows.size:
+                return None
+            # Estimated Jaccard similarity, the best few are checked exactly below
+            estimates = np.count_nonzero(self._signatures[rows] == signature, axis=1) / SIMILAR_PERMUTATIONS
+            best = rows[np.argsort(-estimates, kind="stable")[:SIMILAR_CANDIDATES]]
+            ids = [int(self._ids[row]) for row in best]
+        if not ids:
+            return None
+
+        required = strict_terms(product_description, additional_requirements)
+        placeholders = ",".join("?" * len(ids))
+        candidates = self._connect().execute(
+            f"SELECT cache_key, product_description, additional_requirements, terms FROM similar_requests WHERE id IN ({placeholders})",
+            ids
+        ).fetchall()
+        match = None
+        for cache_key, description, requirements, candidate_terms in candidates:
+            score = jaccard(terms, set(candidate_terms.split(" ")))
+            if score < self.threshold or (match is not None and score <= match["score"]):
+                continue
+            # "500 N" vs "5000 N" or "steel" vs "aluminium" differ in one term but need another answer
+            if strict_terms(description, requirements) == required:
+                match = {
+                    "cache_key": cache_key,
+                    "score": round(score, 4),
+                    "product_description": description,
+                    "additional_requirements": requirements
+                }
+        if match is not None:
+            with self._lock:
+                self.stats["matches"] += 1
+        return match
+
+    def add(self, scope: str, cache_key: str, product_description: str, additional_requirements: Any = None):
+        """
+        Index a request whose result is stored in the recommendation cache under cache_key
+        """
+        self.add_many([(scope, cache_key, product_description, additional_requirements)])
+
+    def add_many(self, entries: Iterable[tuple]):
+        """
+        Index (scope, cache_key, product_description, additional_requirements) entries in one transaction
+        """
+        now = time.time()
+        rows = []
+        for scope, cache_key, product_description, additional_requirements in entries:
+            terms = request_terms(product_description, additional_requirements)
+            if terms:
+                rows.append((
+                    scope, cache_key, product_description,
+                    None if additional_requirements is None else str(additional_requirements),
+                    " ".join(sorted(terms)), minhash(terms).tobytes(), now
+                ))
+        if not rows:
+            return
+        conn = self._connect()
+        conn.executemany(
+            "INSERT OR REPLACE INTO similar_requests "
+            "(scope, cache_key, product_description, additional_requirements, terms, signature, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        conn.execute("DELETE FROM similar_requests WHERE created_at <= ?", (now - self.max_age,))
+        conn.commit()
+        with self._lock:
+            self.stats["indexed"] += len(rows)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._ids)
+        return stats
+
+
+similarity_index = SimilarityIndex(SIMILAR_DB_PATH)
@@ -0,0 +1,116 @@
+import json
+from typing import Dict, Any, List, Optional
+
+
+class IncrementalRecommendationParser:
+    """
+    Incremental parser for the recommendation JSON as it streams in from the LLM.
+
+    Text is fed chunk by chunk. Each entry of the top-level "materials" array is emitted as soon
+    as its object closes, and every other top-level value (general_recommendations, alt_materials, ...)
+    is emitted as soon as it completes. Anything before the opening brace (stray prose, markdown fences)
+    is skipped.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._stack = []  # Open containers, "{" or "["
+        self._started = False
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._expect_key = False
+        self._key = None  # Current top-level key
+        self._value_start = None  # Start of the current top-level value
+        self._item_start = None  # Start of the current materials entry
+        self.done = False
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """
+        Consume a chunk of text and return the events completed by it
+        """
+        events = []
+        self.text += chunk
+        text = self.text
+        stack = self._stack
+
+        for i in range(self._pos, len(text)):
+            if self.done:
+                break
+            c = text[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if len(stack) == 1:
+                        if self._expect_key:
+                            self._key = self._decode(self._string_start, i + 1)
+                        else:
+                            self._emit_value(i + 1, events)
+                continue
+
+            if not stack:
+                # Skip anything before the root object
+                if c == "{" and not self._started:
+                    self._started = True
+                    stack.append(c)
+                    self._expect_key = True
+                continue
+
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+                if len(stack) == 1 and not self._expect_key:
+                    self._value_start = i
+            elif c in "{[":
+                if len(stack) == 1 and not self._expect_key:
+                    self._value_start = i
+                if len(stack) == 2 and c == "{" and stack[-1] == "[" and self._key == "materials":
+                    self._item_start = i
+                stack.append(c)
+                self._expect_key = c == "{"
+            elif c in "}]":
+                if len(stack) == 1 and self._value_start is not None:
+                    # Unquoted top-level value (number, true, null) ends at the closing brace
+                    self._emit_value(i, events)
+                stack.pop()
+                if len(stack) == 2 and c == "}" and self._item_start is not None:
+                    material = self._decode(self._item_start, i + 1)
+                    if isinstance(material, dict):
+                        events.append({"type": "material", "data": material})
+                    self._item_start = None
+                elif len(stack) == 1 and self._value_start is not None:
+                    self._emit_value(i + 1, events)
+                elif not stack:
+                    self.done = True
+                self._expect_key = False
+            elif c == ":":
+                self._expect_key = False
+            elif c == ",":
+                if len(stack) == 1 and self._value_start is not None:
+                    self._emit_value(i, events)
+                self._expect_key = stack[-1] == "{"
+            elif len(stack) == 1 and not self._expect_key and self._value_start is None and not c.isspace():
+                self._value_start = i
+
+        self._pos = len(text)
+        return events
+
+    def _decode(self, start: int, end: int) -> Optional[Any]:
+        try:
+            # strict=False tolerates raw newlines inside strings
+            return json.loads(self.text[start:end], strict=False)
+        except json.JSONDecodeError:
+            return None
+
+    def _emit_value(self, end: int, events: List[Dict[str, Any]]):
+        value = self._decode(self._value_start, end)
+        self._value_start = None
+        if self._key is None or self._key == "materials" or value is None:
+            return
+        events.append({"type": "section", "name": self._key, "data": value})
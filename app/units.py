@@ -0,0 +1,254 @@
+import re
+from typing import Dict, Any, Optional
+
+# Canonical unit spelling -> (SI unit, factor, offset), value_si = value * factor + offset
+# Keys are compared after canonical_unit(): lowercase, no spaces, brackets or separators
+UNITS = {
+    # Stress, strength, modulus
+    "pa": ("Pa", 1.0, 0.0),
+    "kpa": ("Pa", 1e3, 0.0),
+    "mpa": ("Pa", 1e6, 0.0),
+    "gpa": ("Pa", 1e9, 0.0),
+    "n/mm2": ("Pa", 1e6, 0.0),
+    "n/m2": ("Pa", 1.0, 0.0),
+    "psi": ("Pa", 6894.757, 0.0),
+    "ksi": ("Pa", 6894757.0, 0.0),
+    "msi": ("Pa", 6894757000.0, 0.0),
+    "bar": ("Pa", 1e5, 0.0),
+    # Density
+    "kg/m3": ("kg/m³", 1.0, 0.0),
+    "g/cm3": ("kg/m³", 1000.0, 0.0),
+    "g/cc": ("kg/m³", 1000.0, 0.0),
+    "g/ml": ("kg/m³", 1000.0, 0.0),
+    "lb/in3": ("kg/m³", 27679.9, 0.0),
+    "lb/ft3": ("kg/m³", 16.0185, 0.0),
+    # Temperature
+    "°c": ("K", 1.0, 273.15),
+    "c": ("K", 1.0, 273.15),
+    "degc": ("K", 1.0, 273.15),
+    "k": ("K", 1.0, 0.0),
+    "°f": ("K", 5 / 9, 273.15 - 32 * 5 / 9),
+    "f": ("K", 5 / 9, 273.15 - 32 * 5 / 9),
+    # Thermal conductivity
+    "w/mk": ("W/(m·K)", 1.0, 0.0),
+    "w/m°c": ("W/(m·K)", 1.0, 0.0),
+    "w/mc": ("W/(m·K)", 1.0, 0.0),
+    "btu/hrftf": ("W/(m·K)", 1.7307, 0.0),
+    # Specific heat
+    "j/kgk": ("J/(kg·K)", 1.0, 0.0),
+    "j/kg°c": ("J/(kg·K)", 1.0, 0.0),
+    "j/gk": ("J/(kg·K)", 1000.0, 0.0),
+    "j/g°c": ("J/(kg·K)", 1000.0, 0.0),
+    "kj/kgk": ("J/(kg·K)", 1000.0, 0.0),
+    # Thermal expansion
+    "1/k": ("1/K", 1.0, 0.0),
+    "/k": ("1/K", 1.0, 0.0),
+    "/°c": ("1/K", 1.0, 0.0),
+    "1/°c": ("1/K", 1.0, 0.0),
+    "µm/m°c": ("1/K", 1e-6, 0.0),
+    "µm/mk": ("1/K", 1e-6, 0.0),
+    "ppm/°c": ("1/K", 1e-6, 0.0),
+    "ppm/k": ("1/K", 1e-6, 0.0),
+    # Length
+    "m": ("m", 1.0, 0.0),
+    "cm": ("m", 1e-2, 0.0),
+    "mm": ("m", 1e-3, 0.0),
+    "µm": ("m", 1e-6, 0.0),
+    "in": ("m", 0.0254, 0.0),
+    # Mass
+    "kg": ("kg", 1.0, 0.0),
+    "g": ("kg", 1e-3, 0.0),
+    # Electrical resistivity
+    "ωm": ("Ω·m", 1.0, 0.0),
+    "ωcm": ("Ω·m", 1e-2, 0.0),
+    "µωcm": ("Ω·m", 1e-8, 0.0),
+    # Fracture toughness
+    "mpam": ("Pa·√m", 1e6, 0.0),
+    "mpa√m": ("Pa·√m", 1e6, 0.0),
+    # Dimensionless and non-SI scales, kept as stated
+    "%": ("%", 1.0, 0.0),
+    "hb": ("HB", 1.0, 0.0),
+    "hv": ("HV", 1.0, 0.0),
+    "hrc": ("HRC", 1.0, 0.0),
+    "hrb": ("HRB", 1.0, 0.0),
+    "shorea": ("Shore A", 1.0, 0.0),
+    "shored": ("Shore D", 1.0, 0.0),
+    # Cost, not converted between currencies
+    "inr/kg": ("INR/kg", 1.0, 0.0),
+    "₹/kg": ("INR/kg", 1.0, 0.0),
+    "inrperkg": ("INR/kg", 1.0, 0.0),
+    "rs/kg": ("INR/kg", 1.0, 0.0),
+    "inr": ("INR", 1.0, 0.0),
+    "₹": ("INR", 1.0, 0.0),
+    "rs": ("INR", 1.0, 0.0),
+    "usd/kg": ("USD/kg", 1.0, 0.0),
+    "$/kg": ("USD/kg", 1.0, 0.0)
+}
+
+# Property names as the LLM writes them -> canonical key (shared with materials_db where they overlap)
+PROPERTY_ALIASES = {
+    "density": "density",
+    "specific gravity": "specific_gravity",
+    "young's modulus": "youngs_modulus",
+    "youngs modulus": "youngs_modulus",
+    "elastic modulus": "youngs_modulus",
+    "modulus of elasticity": "youngs_modulus",
+    "tensile modulus": "youngs_modulus",
+    "yield strength": "yield_strength",
+    "yield stress": "yield_strength",
+    "proof stress": "yield_strength",
+    "0.2% proof stress": "yield_strength",
+    "tensile strength": "tensile_strength",
+    "ultimate tensile strength": "tensile_strength",
+    "uts": "tensile_strength",
+    "compressive strength": "compressive_strength",
+    "flexural strength": "flexural_strength",
+    "shear strength": "shear_strength",
+    "fatigue strength": "fatigue_strength",
+    "endurance limit": "fatigue_strength",
+    "fatigue limit": "fatigue_strength",
+    "elongation": "elongation",
+    "elongation at break": "elongation",
+    "hardness": "hardness",
+    "fracture toughness": "fracture_toughness",
+    "thermal conductivity": "thermal_conductivity",
+    "coefficient of thermal expansion": "thermal_expansion",
+    "thermal expansion": "thermal_expansion",
+    "cte": "thermal_expansion",
+    "specific heat": "specific_heat",
+    "specific heat capacity": "specific_heat",
+    "melting point": "melting_point",
+    "melting temperature": "melting_point",
+    "glass transition temperature": "glass_transition_temp",
+    "service temperature": "service_temperature",
+    "operating temperature": "service_temperature",
+    "max service temperature": "max_service_temp",
+    "maximum service temperature": "max_service_temp",
+    "min service temperature": "min_service_temp",
+    "minimum service temperature": "min_service_temp",
+    "electrical resistivity": "electrical_resistivity",
+    "cost": "cost",
+    "price": "cost",
+    "rough cost": "cost",
+    "approximate cost": "cost"
+}
+
+NUMBER = r"[-+]?\d+(?:,\d{3})*(?:\.\d+)?(?:[eE][-+]?\d+)?"
+# "200-300 MPa", "-40 to 115 °C", "200 MPa - 300 MPa"
+RANGE_PATTERN = re.compile(
+    rf"(?P<low>{NUMBER})(?![\d.eE])\s*(?:[^\d\s,;(](?:[^\s,;(]|\s(?!\d))*?\s*)?(?:-|to)\s*(?P<high>{NUMBER})\s*(?P<unit>[^,;]*)"
+)
+SINGLE_PATTERN = re.compile(rf"(?P<low>{NUMBER})\s*(?P<unit>[^,;]*)")
+# Trailing remarks: "276 MPa (typical)"
+REMARK_PATTERN = re.compile(r"\s*\([^()]*\)\s*$")
+# Currency written before the number: "₹350/kg", "Rs. 350 per kg"
+CURRENCY_PREFIXES = {"₹": "INR", "rs": "INR", "rs.": "INR", "inr": "INR", "$": "USD", "usd": "USD"}
+# Unit in a property name: "Density (g/cm³)"
+NAME_UNIT_PATTERN = re.compile(r"\(([^()]+)\)\s*$")
+# "x 10^-6", "×10⁻⁶", "e-6 " multipliers written after the number
+EXPONENT_PATTERN = re.compile(r"\s*[x×*]\s*10\s*\^?\s*([-+]?\d+)")
+# Qualifiers that end the unit: "310 MPa at 20 °C", "350 INR/kg for sheet"
+UNIT_END_PATTERN = re.compile(r"\s+(?:at|for|when|in|depending|typical|approx)\b.*$", re.IGNORECASE)
+
+TRANSLATE = str.maketrans({
+    "−": "-", "–": "-", "—": "-", "⁻": "-", "⁰": "0", "¹": "1", "²": "2", "³": "3", "⁴": "4",
+    "⁵": "5", "⁶": "6", "⁷": "7", "⁸": "8", "⁹": "9", "μ": "µ", "º": "°", "Ω": "ω"
+})
+
+
+def canonical_unit(unit: str) -> str:
+    unit = unit.translate(TRANSLATE).lower().strip().rstrip(".")
+    unit = unit.replace("deg ", "°").replace("degrees ", "°").replace(" per ", "/")
+    return re.sub(r"[\s()\[\]·*.\-^]", "", unit)
+
+
+def normalize_property_key(name: str) -> str:
+    """
+    Canonical key for a property name: "Yield Strength (MPa)" -> "yield_strength"
+    """
+    base = re.sub(r"\(.*?\)", "", name.lower()).strip(" :")
+    base = " ".join(base.replace("_", " ").split())
+    if base in PROPERTY_ALIASES:
+        return PROPERTY_ALIASES[base]
+    return re.sub(r"[^a-z0-9]+", "_", base).strip("_")
+
+
+def lookup_unit(unit: str) -> Optional[tuple]:
+    for candidate in (unit, REMARK_PATTERN.sub("", unit), unit.strip().split(" ")[0]):
+        # Then without a trailing remark, then the first token alone
+        key = canonical_unit(candidate)
+        if key in UNITS:
+            return UNITS[key]
+    return None
+
+
+def parse_quantity(text: Any) -> Optional[Dict[str, Any]]:
+    """
+    Parse a stated property value such as "550 MPa", "7.9 g/cm³" or "-40 to 115 °C" into SI.
+
+    Returns {"value", "min", "max", "unit"}, value being the midpoint of a range. Plain numbers
+    have "unit": None, numbers with an unknown unit have no value at all. None when the text
+    has no number.
+    """
+    if isinstance(text, bool) or not isinstance(text, (int, float, str)):
+        return None
+    if not isinstance(text, str):
+        return {"value": float(text), "min": float(text), "max": float(text), "unit": None}
+
+    cleaned = text.translate(TRANSLATE)
+    multiplier = 1.0
+    exponent = EXPONENT_PATTERN.search(cleaned)
+    if exponent:
+        multiplier = 10.0 ** int(exponent.group(1))
+        cleaned = cleaned[:exponent.start()] + " " + cleaned[exponent.end():]
+
+    match = SINGLE_PATTERN.search(cleaned)
+    if match is None:
+        return None
+    # A range has to start at the first number, not somewhere inside a unit like "g/cm3"
+    match = RANGE_PATTERN.match(cleaned, match.start()) or match
+
+    low = float(match.group("low").replace(",", "")) * multiplier
+    high = float(match.group("high").replace(",", "")) * multiplier if "high" in match.groupdict() else low
+    unit_text = UNIT_END_PATTERN.sub("", match.group("unit")).strip()
+    currency = CURRENCY_PREFIXES.get(cleaned[:match.start()].strip().lower().split(" ")[-1])
+    if currency and (not unit_text or unit_text.startswith("/") or unit_text.lower().startswith("per ")):
+        unit_text = currency + unit_text
+
+    if not unit_text:
+        return {"value": (low + high) / 2, "min": min(low, high), "max": max(low, high), "unit": None}
+    unit = lookup_unit(unit_text)
+    if unit is None:
+        return {"value": None, "min": None, "max": None, "unit": None}
+
+    si_unit, factor, offset = unit
+    low_si, high_si = low * factor + offset, high * factor + offset
+    return {
+        "value": (low_si + high_si) / 2,
+        "min": min(low_si, high_si),
+        "max": max(low_si, high_si),
+        "unit": si_unit
+    }
+
+
+def parse_properties(properties: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    Parse every property of a material: name -> {"key", "value", "min", "max", "unit"}
+    """
+    parsed = {}
+    for name, text in (properties or {}).items():
+        quantity = parse_quantity(text) or {"value": None, "min": None, "max": None, "unit": None}
+        name_unit = NAME_UNIT_PATTERN.search(name)
+        if quantity["value"] is not None and quantity["unit"] is None and name_unit:
+            # Unit given in the property name: "Density (g/cm³)": "2.7"
+            with_unit = parse_quantity(f"{text} {name_unit.group(1)}")
+            if with_unit and with_unit["unit"] is not None:
+                quantity = with_unit
+        parsed[name] = {
+            "key": normalize_property_key(name),
+            "value": quantity["value"],
+            "min": quantity["min"],
+            "max": quantity["max"],
+            "unit": quantity["unit"]
+        }
+    return parsed
@@ -0,0 +1,100 @@
+"""
+Recommendation history benchmark.
+
+Fills a temporary history store with synthetic recommendations (materials and property strings
+drawn from the bundled material database, in the unit spellings models use) and times the
+history queries.
+
+    python -m benchmarks.bench_history --recommendations 200000
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+from app.history import HistoryStore
+from app.materials_db import material_db
+
+MATERIALS_PER_RECOMMENDATION = 5
+
+QUERIES = [
+    ("name, newest first", {"name": "Aluminium 6061"}),
+    ("name, sorted by yield strength", {"name": "Aluminium 6061", "sort_by": "yield_strength"}),
+    ("exact name, sorted by yield strength", {"name": "Aluminium 6061-T6", "exact": True, "sort_by": "yield_strength"}),
+    ("name prefix, sorted by cost", {"name": "stainless", "sort_by": "cost", "order": "asc"}),
+    ("all names, sorted by density", {"sort_by": "density", "order": "asc"}),
+    ("all names, density window", {"sort_by": "density", "min_value": 2000, "max_value": 3000}),
+    ("deep page", {"name": "Aluminium 6061", "sort_by": "yield_strength", "offset": 400}),
+]
+
+
+def format_properties(index: int, rng: random.Random) -> dict:
+    """
+    Property strings for a database material, mixing units and formats as LLM output does
+    """
+    value = lambda key: material_db.value(key, index)
+    density = value("density")
+    strength = value("yield_strength") or value("tensile_strength")
+    return {
+        "Density": f"{density:.2f} g/cm³" if rng.random() < 0.5 else f"{density * 1000:.0f} kg/m³",
+        "Yield Strength": f"{strength:.0f} MPa" if rng.random() < 0.8 else f"{strength * 0.145:.1f} ksi",
+        "Tensile Strength": f"{value('tensile_strength') * 0.9:.0f}-{value('tensile_strength') * 1.1:.0f} MPa",
+        "Young's Modulus": f"{value('youngs_modulus'):g} GPa",
+        "Max Service Temperature": f"{value('max_service_temp'):.0f} °C",
+        "Thermal Conductivity": f"{value('thermal_conductivity'):g} W/(m·K)",
+        "Cost": f"₹{value('cost'):.0f}/kg"
+    }
+
+
+def make_recommendation(rng: random.Random) -> dict:
+    materials = [
+        {
+            "name": material_db.names[index],
+            "properties": format_properties(index, rng),
+            "application": "Frame",
+            "rationale": "Synthetic"
+        }
+        for index in rng.sample(range(len(material_db)), MATERIALS_PER_RECOMMENDATION)
+    ]
+    return {"materials": materials, "general_recommendations": "Synthetic recommendation"}
+
+
+def populate(store: HistoryStore, count: int, seed: int, batch_size: int = 1000) -> float:
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    for batch_start in range(0, count, batch_size):
+        store.add_many(
+            (f"bench-{i}", f"Product {i}", None, make_recommendation(rng), 1_700_000_000 + i)
+            for i in range(batch_start, min(count, batch_start + batch_size))
+        )
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark recommendation history queries")
+    parser.add_argument("--recommendations", type=int, default=200_000, help="Recommendations to store")
+    parser.add_argument("--repeat", type=int, default=20, help="Runs per query")
+    parser.add_argument("--limit", type=int, default=50, help="Rows per query")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = HistoryStore(os.path.join(directory, "history.db"))
+        elapsed = populate(store, args.recommendations, args.seed)
+        size = sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory))
+        print(f"stored {args.recommendations} recommendations in {elapsed:.1f}s "
+              f"({args.recommendations / elapsed:.0f}/s), {size / (1024 * 1024):.0f} MiB")
+
+        print(f"{'query':<40} {'rows':>6} {'median ms':>10} {'max ms':>10}")
+        for label, query in QUERIES:
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                rows = store.query_materials(limit=args.limit, **query)
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            print(f"{label:<40} {len(rows):>6} {timings[len(timings) // 2]:>10.2f} {timings[-1]:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
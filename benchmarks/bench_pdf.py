@@ -0,0 +1,97 @@
+"""
+PDF rendering benchmark.
+
+Renders reports with 5, 50 and 500 materials (each with a long property list) in memory and
+reports ms/report and peak Python memory per report size.
+
+    python -m benchmarks.bench_pdf --repeat 5
+"""
+import argparse
+import time
+import tracemalloc
+import warnings
+from app import pdf_service
+from app.pdf_service import render_pdf
+
+SIZES = [5, 50, 500]
+PROPERTIES_PER_MATERIAL = 12
+
+PROPERTY_NAMES = [
+    "Density", "Tensile Strength", "Yield Strength", "Elastic Modulus", "Elongation at Break",
+    "Hardness", "Thermal Conductivity", "Coefficient of Thermal Expansion", "Melting Point",
+    "Fatigue Strength", "Endurance Limit", "Cost"
+]
+
+
+def make_recommendations(material_count: int) -> dict:
+    materials = []
+    for i in range(material_count):
+        properties = {
+            PROPERTY_NAMES[j % len(PROPERTY_NAMES)] + (f" ({j})" if j >= len(PROPERTY_NAMES) else ""):
+                f"{100 + i + j * 7} MPa at 20-150 °C, typical for grade {i % 9}"
+            for j in range(PROPERTIES_PER_MATERIAL)
+        }
+        materials.append({
+            "name": f"Aluminium Alloy 60{i % 100:02d}-T6 (variant {i})",
+            "properties": properties,
+            "application": f"Component {i}: frame rails, mounting brackets and load-bearing ribs",
+            "rationale": "High specific strength, good corrosion resistance and machinability " * 3
+        })
+    section = "Material choices balance weight, stiffness, corrosion resistance and cost. " * 12
+    return {
+        "materials": materials,
+        "general_recommendations": section,
+        "alt_materials": section,
+        "manufacturing_considerations": section,
+        "cost_considerations": section
+    }
+
+
+def bench(material_count: int, repeat: int, warm: bool) -> dict:
+    recommendations = make_recommendations(material_count)
+    timings = []
+    size = 0
+    for _ in range(repeat):
+        if not warm:
+            pdf_service._line_cache.clear()
+        start = time.perf_counter()
+        pdf_bytes = render_pdf(recommendations)
+        timings.append((time.perf_counter() - start) * 1000)
+        size = len(pdf_bytes)
+    timings.sort()
+
+    # Memory is measured on a separate render, tracemalloc slows rendering down several times
+    if not warm:
+        pdf_service._line_cache.clear()
+    tracemalloc.start()
+    render_pdf(recommendations)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "materials": material_count,
+        "median_ms": timings[len(timings) // 2],
+        "min_ms": timings[0],
+        "peak_mib": peak / (1024 * 1024),
+        "pdf_kib": size / 1024
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PDF report rendering")
+    parser.add_argument("--repeat", type=int, default=5, help="Renders per report size")
+    parser.add_argument("--warm", action="store_true", help="Keep the line-split cache between renders")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="Material counts to render")
+    args = parser.parse_args()
+
+    # Core fonts substitute Arial with Helvetica on every render
+    warnings.simplefilter("ignore", UserWarning)
+
+    print(f"{'materials':>10} {'median ms':>10} {'min ms':>10} {'peak MiB':>10} {'PDF KiB':>10}")
+    for material_count in args.sizes:
+        result = bench(material_count, args.repeat, args.warm)
+        print(f"{result['materials']:>10} {result['median_ms']:>10.1f} {result['min_ms']:>10.1f} "
+              f"{result['peak_mib']:>10.1f} {result['pdf_kib']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
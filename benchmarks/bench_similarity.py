@@ -0,0 +1,85 @@
+"""
+Similar-request index benchmark.
+
+Fills a temporary similarity index with synthetic product descriptions, then times lookups of
+paraphrased (should match) and unrelated (should miss) requests as the index grows.
+
+    python -m benchmarks.bench_similarity --sizes 1000 10000 100000
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+from app.similarity import SimilarityIndex, make_scope
+
+PRODUCTS = ["drone frame", "bicycle frame", "heat sink", "pump housing", "gear", "shaft", "bracket", "enclosure",
+            "valve body", "spring", "turbine blade", "knife blade", "pressure vessel", "robot arm", "hinge"]
+QUALITIES = ["lightweight", "impact resistant", "corrosion resistant", "low cost", "high temperature", "food safe",
+             "waterproof", "high stiffness", "wear resistant", "electrically insulating", "recyclable", "outdoor"]
+USES = ["for marine use", "for aerospace", "for mass production", "for medical devices", "for a racing team",
+        "for consumer electronics", "for agricultural machinery", "for a chemical plant"]
+# Paraphrase of the first words of QUALITIES, as users write them
+PARAPHRASES = {"lightweight": "light", "impact resistant": "impact-tolerant", "low cost": "affordable",
+               "corrosion resistant": "rust proof", "high temperature": "high-temperatures"}
+
+
+def make_description(rng: random.Random, index: int) -> str:
+    qualities = rng.sample(QUALITIES, 2)
+    return f"{qualities[0]} {rng.choice(PRODUCTS)}, {qualities[1]}, {rng.choice(USES)}, model {index}"
+
+
+def paraphrase(description: str) -> str:
+    for phrase, replacement in PARAPHRASES.items():
+        description = description.replace(phrase, replacement)
+    # Reorder the comma-separated parts
+    parts = description.split(", ")
+    return ", ".join(reversed(parts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the similar-request index")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="Index sizes to test")
+    parser.add_argument("--lookups", type=int, default=500, help="Lookups per size")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    scope = make_scope("bench", "prompt")
+    print(f"{'entries':>8} {'add/s':>8} {'load ms':>8} {'hit p50 ms':>11} {'hit p99 ms':>11} {'miss p50 ms':>12} {'recall':>7} {'false +':>8}")
+    for size in args.sizes:
+        rng = random.Random(args.seed)
+        descriptions = [make_description(rng, i) for i in range(size)]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "similar.db")
+            writer = SimilarityIndex(path)
+            start = time.perf_counter()
+            for batch_start in range(0, size, 1000):
+                writer.add_many((scope, f"key-{i}", descriptions[i], None) for i in range(batch_start, min(size, batch_start + 1000)))
+            add_rate = size / (time.perf_counter() - start)
+
+            # A fresh index, as a new worker loads it from SQLite
+            index = SimilarityIndex(path)
+            start = time.perf_counter()
+            index.sync()
+            load_ms = (time.perf_counter() - start) * 1000
+
+            hits, misses, found, false_positives = [], [], 0, 0
+            for _ in range(args.lookups):
+                i = rng.randrange(size)
+                start = time.perf_counter()
+                match = index.find(scope, paraphrase(descriptions[i]))
+                hits.append((time.perf_counter() - start) * 1000)
+                found += match is not None and match["product_description"] == descriptions[i]
+
+                start = time.perf_counter()
+                match = index.find(scope, f"{rng.choice(PRODUCTS)} for an unrelated project {rng.random()}")
+                misses.append((time.perf_counter() - start) * 1000)
+                false_positives += match is not None
+            hits.sort()
+            misses.sort()
+            print(f"{size:>8} {add_rate:>8.0f} {load_ms:>8.1f} {hits[len(hits) // 2]:>11.3f} {hits[int(len(hits) * 0.99)]:>11.3f} "
+                  f"{misses[len(misses) // 2]:>12.3f} {found / args.lookups:>7.1%} {false_positives:>8}")
+
+
+if __name__ == "__main__":
+    main()
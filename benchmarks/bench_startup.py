@@ -0,0 +1,138 @@
+"""
+Server cold-start benchmark.
+
+Times what every new worker process pays before it can answer: importing the app in a fresh
+interpreter (with the slowest imports under app.main), and starting a one-worker server until
+its first response. Each run uses empty temporary data directories.
+
+    python -m benchmarks.bench_startup --runs 5
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import tempfile
+import statistics
+import subprocess
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SCRIPT = (
+    "import sys, time\n"
+    "start = time.perf_counter()\n"
+    "import app.main\n"
+    "elapsed = time.perf_counter() - start\n"
+    "print(elapsed, int('fpdf' in sys.modules))\n"
+)
+
+
+def bench_env(directory: str) -> dict:
+    env = dict(os.environ)
+    env.update(
+        PYTHONPATH=ROOT,
+        GROQ_API_KEY=env.get("GROQ_API_KEY", "unused"),
+        LOG_LEVEL="WARNING",
+        CACHE_DIR=os.path.join(directory, "cache"),
+        HISTORY_DB_PATH=os.path.join(directory, "history", "history.db"),
+        JOB_DB_PATH=os.path.join(directory, "jobs", "jobs.db")
+    )
+    return env
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_import(directory: str) -> tuple:
+    """
+    Seconds to import app.main in a fresh interpreter, and whether fpdf got imported
+    """
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT], cwd=directory, env=bench_env(directory),
+        capture_output=True, text=True, check=True
+    ).stdout.split()
+    return float(output[0]), output[1] == "1"
+
+
+def slowest_imports(directory: str, count: int) -> list:
+    """
+    (module, cumulative ms) for the slowest imports directly under app.main
+    """
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"], cwd=directory, env=bench_env(directory),
+        capture_output=True, text=True, check=True
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        fields = line.split("|")
+        if line.startswith("import time:") and len(fields) == 3 and fields[1].strip().isdigit():
+            rows.append((fields[2], int(fields[1]) / 1000))
+    # A module is listed after its imports, one indent level deeper than the module itself
+    end = next(index for index, (name, _) in enumerate(rows) if name.strip() == "app.main")
+    modules = []
+    for name, ms in reversed(rows[:end]):
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 0:
+            break
+        if depth == 1:
+            modules.append((name.strip(), ms))
+    return sorted(modules, key=lambda module: -module[1])[:count]
+
+
+def time_first_response(directory: str, timeout: float = 60) -> float:
+    """
+    Seconds from starting a one-worker server to its first successful response
+    """
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=directory, env=bench_env(directory), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        with httpx.Client(timeout=1) as client:
+            while time.perf_counter() - start < timeout:
+                try:
+                    if client.get(f"http://127.0.0.1:{port}/").status_code == 200:
+                        return time.perf_counter() - start
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.01)
+        raise RuntimeError("server did not answer in time")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark server cold start per worker")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh processes per measurement")
+    parser.add_argument("--top", type=int, default=8, help="Slowest direct imports of app.main to list")
+    args = parser.parse_args()
+
+    imports, first_responses, fpdf_loaded = [], [], False
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory() as directory:
+            seconds, loaded = time_import(directory)
+            imports.append(seconds)
+            fpdf_loaded = fpdf_loaded or loaded
+        with tempfile.TemporaryDirectory() as directory:
+            first_responses.append(time_first_response(directory))
+
+    print(f"{'measurement':<32} {'median ms':>10} {'min ms':>8} {'max ms':>8}")
+    for label, timings in (("import app.main", imports), ("start to first response", first_responses)):
+        print(f"{label:<32} {statistics.median(timings) * 1000:>10.0f} {min(timings) * 1000:>8.0f} {max(timings) * 1000:>8.0f}")
+    print(f"fpdf imported by the server: {'yes' if fpdf_loaded else 'no'}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        print("\nslowest imports under app.main (cumulative ms):")
+        for name, ms in slowest_imports(directory, args.top):
+            print(f"  {name:<40} {ms:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
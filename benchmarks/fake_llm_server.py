@@ -0,0 +1,220 @@
+"""
+Local stand-in for the Groq (OpenAI-compatible) chat completions API.
+
+Serves canned material recommendations with configurable latency, token rate, 429 injection,
+slow-response (tail latency) injection and malformed-JSON injection, so the request path can be load tested without spending Groq quota.
+Point the app at it with GROQ_BASE_URL:
+
+    python -m benchmarks.fake_llm_server --port 8765 --latency 0.3 --tokens-per-sec 400 --rate-limit-rate 0.05
+    GROQ_BASE_URL=http://127.0.0.1:8765 GROQ_API_KEY=fake python -m app.cli serve
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="Fake LLM server")
+
+config = {
+    "latency": 0.2,  # Seconds before the first token
+    "slow_rate": 0.0,  # Fraction of requests that wait slow_latency instead
+    "slow_latency": 2.0,
+    "tokens_per_sec": 500.0,  # Generation speed, 0 for instant
+    "rate_limit_rate": 0.0,  # Fraction of requests answered with a 429
+    "retry_after": 1.0,  # Retry-After sent with injected 429s
+    "malformed_rate": 0.0,  # Fraction of completions with broken JSON
+    "materials": 4  # Materials per recommendation
+}
+
+stats = {"requests": 0, "rate_limited": 0, "malformed": 0, "slow": 0, "models": {}}
+
+SECTION_TEXT = (
+    "Material selection balances stiffness, strength, weight, corrosion resistance, manufacturability "
+    "and cost across the operating temperature range. "
+) * 8
+
+SAMPLE_MATERIALS = [
+    ("Aluminium 6061-T6", {"Density": "2.70 g/cm³", "Yield Strength": "276 MPa", "Tensile Strength": "310 MPa", "Cost": "350 INR/kg"}),
+    ("Carbon Fibre Reinforced Polymer", {"Density": "1.60 g/cm³", "Tensile Strength": "600 MPa", "Elastic Modulus": "70 GPa", "Cost": "2500 INR/kg"}),
+    ("Stainless Steel 304", {"Density": "8.00 g/cm³", "Yield Strength": "215 MPa", "Tensile Strength": "505 MPa", "Cost": "250 INR/kg"}),
+    ("Polycarbonate", {"Density": "1.20 g/cm³", "Tensile Strength": "65 MPa", "Service Temperature": "-40 to 115 °C", "Cost": "300 INR/kg"}),
+    ("Titanium Ti-6Al-4V", {"Density": "4.43 g/cm³", "Yield Strength": "880 MPa", "Tensile Strength": "950 MPa", "Cost": "3500 INR/kg"}),
+    ("Nylon 6/6 (30% Glass Filled)", {"Density": "1.37 g/cm³", "Tensile Strength": "180 MPa", "Elastic Modulus": "9 GPa", "Cost": "400 INR/kg"})
+]
+
+
+def build_content(material_count: int, offset: int = 0) -> str:
+    materials = []
+    for i in range(material_count):
+        name, properties = SAMPLE_MATERIALS[(i + offset) % len(SAMPLE_MATERIALS)]
+        materials.append({
+            "name": name,
+            "properties": properties,
+            "application": f"Component {i + 1} of the product",
+            "rationale": "Good balance of specific strength, durability and cost for this part."
+        })
+    return json.dumps({
+        "materials": materials,
+        "general_recommendations": SECTION_TEXT,
+        "alt_materials": SECTION_TEXT,
+        "manufacturing_considerations": SECTION_TEXT,
+        "cost_considerations": SECTION_TEXT
+    }, ensure_ascii=False)
+
+
+def build_content_for(messages: list) -> str:
+    """
+    Answer in the format the system prompt asks for: a full recommendation, a refinement patch,
+    or the decomposition, per-component and section calls of fan-out mode
+    """
+    system = next((m.get("content", "") for m in messages if m.get("role") == "system"), "")
+    user = next((m.get("content", "") for m in messages if m.get("role") == "user"), "")
+    if '"remove"' in system:
+        material = json.loads(build_content(1, offset=sum(map(ord, user))))["materials"][0]
+        return json.dumps({"remove": [0], "add": [material], "sections": {"cost_considerations": SECTION_TEXT}},
+                          ensure_ascii=False)
+    if '"components"' in system:
+        return json.dumps({"components": [
+            {"name": f"Component {i + 1}", "function": "Carries structural loads in service"}
+            for i in range(config["materials"])
+        ]})
+    if '"materials"' not in system and '"general_recommendations"' in system:
+        return json.dumps({section: SECTION_TEXT for section in
+                           ["general_recommendations", "alt_materials", "manufacturing_considerations", "cost_considerations"]})
+    if "ONE component" in system:
+        content = json.loads(build_content(2, offset=sum(map(ord, user))))
+        return json.dumps({"materials": content["materials"]}, ensure_ascii=False)
+    return build_content(config["materials"])
+
+
+def malform(content: str) -> str:
+    """Break the JSON the way LLMs tend to"""
+    kind = random.choice(["prose", "fence", "trailing_comma", "truncated", "unquoted_keys"])
+    if kind == "prose":
+        return "Here are the material recommendations you asked for:\n" + content + "\nLet me know if you need more."
+    if kind == "fence":
+        return "```json\n" + content + "\n```"
+    if kind == "trailing_comma":
+        return content[:-1] + ",}"
+    if kind == "unquoted_keys":
+        return content.replace('"name":', 'name:')
+    return content[:int(len(content) * 0.9)]
+
+
+def split_tokens(content: str) -> list:
+    # Roughly 4 characters per token
+    return [content[i:i + 4] for i in range(0, len(content), 4)]
+
+
+@app.post("/openai/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+    model = body.get("model", "fake-model")
+    stats["models"][model] = stats["models"].get(model, 0) + 1
+
+    if random.random() < config["rate_limit_rate"]:
+        stats["rate_limited"] += 1
+        return JSONResponse(
+            status_code=429,
+            content={"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+            headers={"retry-after": str(config["retry_after"])}
+        )
+
+    content = build_content_for(body.get("messages", []))
+    if random.random() < config["malformed_rate"]:
+        stats["malformed"] += 1
+        content = malform(content)
+        if body.get("response_format", {}).get("type") == "json_object" and not body.get("stream"):
+            # Groq's JSON mode rejects invalid output and returns it in the error
+            return JSONResponse(status_code=400, content={"error": {
+                "message": "Failed to generate JSON. Please adjust your prompt. See 'failed_generation' for more details.",
+                "type": "invalid_request_error",
+                "code": "json_validate_failed",
+                "failed_generation": content
+            }})
+
+    tokens = split_tokens(content)
+    prompt_tokens = sum(len(m.get("content", "")) for m in body.get("messages", [])) // 4
+    usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens), "total_tokens": prompt_tokens + len(tokens)}
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    token_delay = 1 / config["tokens_per_sec"] if config["tokens_per_sec"] > 0 else 0
+
+    latency = config["latency"]
+    if random.random() < config["slow_rate"]:
+        stats["slow"] += 1
+        latency = config["slow_latency"]
+    await asyncio.sleep(latency)
+
+    if body.get("stream"):
+        async def event_stream():
+            start = time.perf_counter()
+            for i, token in enumerate(tokens):
+                chunk = {
+                    "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]
+                }
+                if i == len(tokens) - 1:
+                    chunk["choices"][0]["finish_reason"] = "stop"
+                    chunk["x_groq"] = {"usage": usage}
+                yield f"data: {json.dumps(chunk)}\n\n"
+                # Pace against the start time, sleeping per token drifts far behind at high rates
+                ahead = start + (i + 1) * token_delay - time.perf_counter()
+                if ahead > 0.001:
+                    await asyncio.sleep(ahead)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+    await asyncio.sleep(len(tokens) * token_delay)
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": created,
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": usage
+    }
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Groq/OpenAI-compatible completion server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=config["latency"], help="Seconds before the first token")
+    parser.add_argument("--slow-rate", type=float, default=config["slow_rate"], help="Fraction of requests delayed by --slow-latency instead")
+    parser.add_argument("--slow-latency", type=float, default=config["slow_latency"], help="Seconds before the first token of slow requests")
+    parser.add_argument("--tokens-per-sec", type=float, default=config["tokens_per_sec"], help="Generation speed, 0 for instant")
+    parser.add_argument("--rate-limit-rate", type=float, default=config["rate_limit_rate"], help="Fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=config["retry_after"], help="Retry-After seconds on injected 429s")
+    parser.add_argument("--malformed-rate", type=float, default=config["malformed_rate"], help="Fraction of completions with broken JSON")
+    parser.add_argument("--materials", type=int, default=config["materials"], help="Materials per recommendation")
+    args = parser.parse_args()
+
+    config.update({
+        "latency": args.latency,
+        "slow_rate": args.slow_rate,
+        "slow_latency": args.slow_latency,
+        "tokens_per_sec": args.tokens_per_sec,
+        "rate_limit_rate": args.rate_limit_rate,
+        "retry_after": args.retry_after,
+        "malformed_rate": args.malformed_rate,
+        "materials": args.materials
+    })
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+Load test for the recommendation endpoints against a local fake LLM server.
+
+Starts benchmarks.fake_llm_server in a subprocess (unless --llm-url is given), points the app at it
+with GROQ_BASE_URL and drives the FastAPI app in-process at fixed concurrency levels. Reports req/s,
+p50/p95/p99 latency, event-loop lag and RSS per level.
+
+    python -m benchmarks.load_test --concurrency 1 8 32 --requests 200
+    python -m benchmarks.load_test --endpoint stream --rate-limit-rate 0.05 --malformed-rate 0.1
+
+With --url the load goes to a running server instead, event-loop lag is then not measured.
+"""
+import os
+import sys
+import time
+import json
+import socket
+import asyncio
+import argparse
+import tempfile
+import warnings
+import subprocess
+from typing import List, Optional
+
+CONCURRENCY_LEVELS = [1, 8, 32]
+LAG_INTERVAL = 0.01  # Seconds between event-loop lag samples
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(pct / 100 * len(values))) - 1))
+    return values[index]
+
+
+def current_rss_mib() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    # ru_maxrss is the peak, in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_fake_server(args) -> tuple:
+    """
+    Run the fake LLM server in a subprocess, returns (process, base_url)
+    """
+    port = free_port()
+    process = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.fake_llm_server",
+        "--port", str(port),
+        "--latency", str(args.latency),
+        "--tokens-per-sec", str(args.tokens_per_sec),
+        "--rate-limit-rate", str(args.rate_limit_rate),
+        "--retry-after", str(args.retry_after),
+        "--malformed-rate", str(args.malformed_rate),
+        "--materials", str(args.materials)
+    ])
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise Exception("Fake LLM server exited during startup")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise Exception("Fake LLM server did not start")
+
+
+async def monitor_loop_lag(samples: List[float], stop: asyncio.Event):
+    """
+    Sleep for LAG_INTERVAL repeatedly and record how late each wakeup was
+    """
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(LAG_INTERVAL)
+        samples.append(max(0.0, loop.time() - start - LAG_INTERVAL))
+
+
+async def send_request(client, endpoint: str, payload: dict) -> bool:
+    """
+    Send one recommendation request, True when it completed successfully
+    """
+    if endpoint == "stream":
+        async with client.stream("POST", "/api/recommend-materials/stream", json=payload) as response:
+            if response.status_code != 200:
+                return False
+            last = None
+            async for line in response.aiter_lines():
+                if line.strip():
+                    last = json.loads(line)
+            return last is not None and last.get("type") == "done"
+
+    response = await client.post("/api/recommend-materials", json=payload)
+    return response.status_code == 200
+
+
+async def run_level(client, endpoint: str, concurrency: int, total: int, use_cache: bool,
+                    measure_lag: bool) -> dict:
+    latencies = []
+    errors = 0
+    next_index = 0
+    lag_samples = []
+    stop = asyncio.Event()
+
+    async def worker():
+        nonlocal next_index, errors
+        while next_index < total:
+            index = next_index
+            next_index += 1
+            payload = {
+                # Unique descriptions unless the cache is part of the test
+                "description": f"Lightweight drone frame, variant {index % 10 if use_cache else f'{concurrency}-{index}'}",
+                "additional_requirements": "Operating temperature -20 to 60 °C, budget under 5000 INR",
+                "bypass_cache": not use_cache
+            }
+            start = time.perf_counter()
+            try:
+                ok = await send_request(client, endpoint, payload)
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            if not ok:
+                errors += 1
+
+    monitor = asyncio.create_task(monitor_loop_lag(lag_samples, stop)) if measure_lag else None
+    rss_before = current_rss_mib()
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    if monitor is not None:
+        await monitor
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "lag_p99_ms": percentile(lag_samples, 99) * 1000 if measure_lag else None,
+        "lag_max_ms": max(lag_samples, default=0.0) * 1000 if measure_lag else None,
+        "rss_mib": current_rss_mib(),
+        "rss_delta_mib": current_rss_mib() - rss_before
+    }
+
+
+def format_ms(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.1f}"
+
+
+async def run(args):
+    import httpx
+
+    timeout = httpx.Timeout(args.timeout)
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=timeout,
+                                   limits=httpx.Limits(max_connections=max(args.concurrency)))
+        shutdown = None
+    else:
+        # Import after GROQ_BASE_URL and the working directory are set
+        from app.main import app
+        from app.report_jobs import shutdown_report_pool
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://app", timeout=timeout)
+        shutdown = shutdown_report_pool
+
+    print(f"{'conc':>5} {'reqs':>6} {'errors':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'lag p99':>8} {'lag max':>8} {'RSS MiB':>8} {'ΔRSS':>7}")
+    try:
+        for concurrency in args.concurrency:
+            result = await run_level(client, args.endpoint, concurrency, args.requests, args.cache,
+                                     measure_lag=not args.url)
+            print(f"{result['concurrency']:>5} {result['requests']:>6} {result['errors']:>6} {result['rps']:>8.1f} "
+                  f"{result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} {result['p99_ms']:>9.1f} "
+                  f"{format_ms(result['lag_p99_ms']):>8} {format_ms(result['lag_max_ms']):>8} "
+                  f"{result['rss_mib']:>8.1f} {result['rss_delta_mib']:>7.1f}")
+    finally:
+        await client.aclose()
+        if shutdown is not None:
+            shutdown(wait=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the recommendation endpoints against a fake LLM")
+    parser.add_argument("--endpoint", choices=["recommend", "stream"], default="recommend")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=CONCURRENCY_LEVELS, help="Concurrency levels to run")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per concurrency level")
+    parser.add_argument("--cache", action="store_true", help="Reuse 10 descriptions and let the cache answer repeats")
+    parser.add_argument("--timeout", type=float, default=120, help="Per-request timeout in seconds")
+    parser.add_argument("--url", help="Load test a running server instead of the in-process app")
+    parser.add_argument("--llm-url", help="Use an already running fake LLM server")
+    # Fake LLM server behaviour
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds before the first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=500, help="Generation speed, 0 for instant")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of LLM calls answered with 429")
+    parser.add_argument("--retry-after", type=float, default=0.5, help="Retry-After seconds on injected 429s")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Fraction of completions with broken JSON")
+    parser.add_argument("--materials", type=int, default=4, help="Materials per completion")
+    args = parser.parse_args()
+
+    fake_server = None
+    if not args.url:
+        if args.llm_url:
+            llm_url = args.llm_url
+        else:
+            fake_server, llm_url = start_fake_server(args)
+        os.environ["GROQ_BASE_URL"] = llm_url
+        os.environ.setdefault("GROQ_API_KEY", "fake-key")
+        os.environ.setdefault("LOG_LEVEL", "ERROR")
+        # Core fonts substitute Arial with Helvetica on every render, also in the spawned PDF workers
+        os.environ.setdefault("PYTHONWARNINGS", "ignore::UserWarning")
+        warnings.simplefilter("ignore", UserWarning)
+        # Keep the cache and rendered reports out of the working tree
+        workdir = tempfile.mkdtemp(prefix="materialmind-load-")
+        os.environ["CACHE_DIR"] = os.path.join(workdir, "cache")
+        sys.path.insert(0, os.getcwd())
+        os.chdir(workdir)
+
+    try:
+        asyncio.run(run(args))
+    finally:
+        if fake_server is not None:
+            fake_server.terminate()
+            fake_server.wait()
+
+
+if __name__ == "__main__":
+    main()
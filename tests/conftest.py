@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+
+# Keep the stores the app opens out of the working tree, before any app module is imported
+_data_dir = tempfile.mkdtemp(prefix="materialmind-tests-")
+os.environ.setdefault("CACHE_DIR", os.path.join(_data_dir, "cache"))
+os.environ.setdefault("HISTORY_DB_PATH", os.path.join(_data_dir, "history", "history.db"))
+os.environ.setdefault("JOB_DB_PATH", os.path.join(_data_dir, "jobs", "jobs.db"))
+os.environ.setdefault("GROQ_API_KEY", "test")
+os.chdir(_data_dir)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,68 @@
+import pytest
+
+from app import job_queue as jq
+from app.job_queue import JobQueue, QueueFullError
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.db"))
+
+
+def test_claims_round_robin_across_clients(queue):
+    for n in range(3):
+        queue.submit("batch", {"n": n})
+    queue.submit("alice", {"n": 0})
+    queue.submit("bob", {"n": 0})
+    claimed = [queue.claim("w") for _ in range(6)]
+    assert [(job["client_id"], job["request"]["n"]) for job in claimed[:5]] == [
+        ("batch", 0), ("alice", 0), ("bob", 0), ("batch", 1), ("batch", 2)
+    ]
+    assert claimed[5] is None
+
+
+def test_least_recently_served_client_goes_first(queue):
+    queue.submit("alice", {})
+    queue.finish(queue.claim("w")["job_id"], {"ok": True})
+    # Bob has never been served, so his later job beats Alice's
+    queue.submit("alice", {})
+    queue.submit("bob", {})
+    assert queue.claim("w")["client_id"] == "bob"
+
+
+def test_expired_lease_requeues_then_fails(queue, monkeypatch):
+    monkeypatch.setattr(jq, "JOB_MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(jq, "JOB_LEASE", -1)  # Every claim's lease has already run out
+    job_id = queue.submit("alice", {})["job_id"]
+    assert queue.claim("crashed")["job_id"] == job_id
+    # The next claim finds the lease expired and runs the job again
+    assert queue.claim("other")["job_id"] == job_id
+    assert queue.claim("other") is None
+    job = queue.get(job_id)
+    assert job["status"] == "failed"
+    assert job["error"] == "Job was interrupted too many times"
+
+
+def test_live_lease_is_not_reclaimed(queue):
+    queue.submit("alice", {})
+    assert queue.claim("w") is not None
+    assert queue.claim("other") is None
+    assert queue.get_stats()["running"] == 1
+
+
+def test_release_hands_jobs_back_without_using_an_attempt(queue):
+    job_id = queue.submit("alice", {})["job_id"]
+    queue.claim("stopping")
+    assert queue.release("stopping") == 1
+    assert queue.claim("w")["job_id"] == job_id
+    attempts = queue._connect().execute("SELECT attempts FROM jobs WHERE job_id = ?", (job_id,)).fetchone()[0]
+    assert attempts == 1
+
+
+def test_client_share_is_capped(queue, monkeypatch):
+    monkeypatch.setattr(jq, "JOB_CLIENT_MAX", 2)
+    queue.submit("alice", {})
+    queue.submit("alice", {})
+    with pytest.raises(QueueFullError):
+        queue.submit("alice", {})
+    assert queue.submit("bob", {})["queue_depth"] == 3
@@ -0,0 +1,41 @@
+from app.json_repair import repair_json
+
+
+def test_valid_json_is_returned_untouched():
+    assert repair_json('{"a": 1}') == ({"a": 1}, False)
+
+
+def test_fences_prose_and_trailing_commas():
+    assert repair_json('Here you go:\n```json\n{"a": [1, 2,],}\n```') == ({"a": [1, 2]}, False)
+    # Braces in the prose before the object are skipped
+    assert repair_json('See {below}\n{"a": "x"}') == ({"a": "x"}, False)
+    # Fences inside strings are content
+    assert repair_json('{"a": "```not a fence```"}') == ({"a": "```not a fence```"}, False)
+
+
+def test_raw_newline_inside_string():
+    assert repair_json('{"a": "line\nbreak"}') == ({"a": "line\nbreak"}, False)
+
+
+def test_truncated_output_backs_off_to_complete_items():
+    value, truncated = repair_json('{"materials": [{"name": "Steel", "props": {"d": "7.9"}}, {"name": "Alu", "pro')
+    assert truncated
+    assert value == {"materials": [{"name": "Steel", "props": {"d": "7.9"}}]}
+
+
+def test_truncated_output_drops_unfinished_top_level_value():
+    value, truncated = repair_json('{"materials": [{"name": "Steel"}], "general_recommendations": "Use a coat')
+    assert truncated
+    assert value == {"materials": [{"name": "Steel"}]}
+
+
+def test_truncated_after_a_complete_item_keeps_it():
+    assert repair_json('{"materials": [{"name": "Steel"}, {"name": "Alu"}') == (
+        {"materials": [{"name": "Steel"}, {"name": "Alu"}]}, True
+    )
+
+
+def test_unrepairable_text():
+    assert repair_json("no json here") == (None, False)
+    # Nothing complete before the cut
+    assert repair_json('{"materials": [{"name": "Ste') == (None, True)
@@ -0,0 +1,23 @@
+import os
+import time
+import uuid
+
+from app.report_store import ReportStore
+
+
+def test_legacy_reports_are_migrated_and_evicted(tmp_path):
+    store = ReportStore(str(tmp_path))
+    report_id = str(uuid.uuid4())
+    legacy = tmp_path / f"MaterialMind_Recommendation_{report_id}.pdf"
+    legacy.write_bytes(b"%PDF legacy report")
+    old = time.time() - 3600
+    os.utime(legacy, (old, old))
+
+    assert store.migrate_legacy_reports() == 1
+    assert not legacy.exists()
+    report_hash = store.get_report_hash(report_id)
+    assert store.has_blob(report_hash)
+    # Last access comes from the file's modification time
+    assert store.evict(max_age=60) == 1
+    assert not os.path.exists(store.blob_path(report_hash))
+    assert store.migrate_legacy_reports() == 0
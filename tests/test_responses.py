@@ -0,0 +1,21 @@
+from app.responses import parse_range
+
+
+def test_parse_range_satisfiable_ranges():
+    assert parse_range("bytes=0-99", 1000) == (0, 99)
+    assert parse_range("bytes=900-", 1000) == (900, 999)
+    assert parse_range("bytes=-100", 1000) == (900, 999)
+    # The last byte is clamped to the file size
+    assert parse_range("bytes=500-5000", 1000) == (500, 999)
+
+
+def test_parse_range_ignores_invalid_headers():
+    assert parse_range("bytes=500-100", 1000) is None
+    assert parse_range("bytes=0-1,5-6", 1000) is None
+    assert parse_range("items=0-1", 1000) is None
+    assert parse_range("bytes=a-b", 1000) is None
+
+
+def test_parse_range_unsatisfiable_past_end():
+    assert parse_range("bytes=1000-", 1000) == (-1, -1)
+    assert parse_range("bytes=-0", 1000) == (-1, -1)
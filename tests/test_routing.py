@@ -0,0 +1,77 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from app import ai_service, routing
+from app.resilience import CircuitBreaker
+from app.routing import ModelRouter, hedged_call
+
+
+def router_with(latencies, now=None):
+    """A router over cheap, mid and large with the given recent median latency per model"""
+    router = ModelRouter(["cheap", "mid", "large"], {})
+    now = time.monotonic() if now is None else now
+    for model, seconds in latencies.items():
+        router.stats_for(model).recent.extend([(now, seconds)] * 5)
+    return router
+
+
+def test_fast_preferred_model_keeps_traffic_without_probing_alternatives():
+    router = router_with({"cheap": 1.0})
+    assert [router.choose(0) for _ in range(5)] == ["cheap"] * 5
+    assert router.stats_for("large").probes == 0
+
+
+def test_slow_preferred_model_probes_alternative_once_per_interval():
+    stale = time.monotonic() - routing.LLM_ROUTE_MAX_AGE - 1
+    router = router_with({"cheap": 10.0})
+    router.stats_for("mid").recent.append((stale, 1.0))
+    # Both alternatives lack recent samples, each gets one probe
+    assert [router.choose(0), router.choose(0)] == ["mid", "large"]
+    # Probed recently, back to the preferred model until a probe's latency is recorded
+    assert router.choose(0) == "cheap"
+    router.record("mid", 1.0)
+    assert router.choose(0) == "mid"
+
+
+def test_routed_around_model_is_probed_again():
+    stale = time.monotonic() - routing.LLM_ROUTE_MAX_AGE - 1
+    router = router_with({"mid": 1.0}, now=stale)
+    router.record("mid", 1.0)
+    assert router.choose(0) == "cheap"
+    assert router.choose(0) == "mid"
+
+
+def test_empty_model_list_is_rejected():
+    try:
+        ModelRouter([], {})
+    except ValueError:
+        return
+    raise AssertionError("ModelRouter accepted an empty model list")
+
+
+def test_cancelled_hedge_loser_releases_breaker_trial_without_failure(monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=1)
+    breaker.failures = 3
+    breaker.opened_at = time.monotonic() - 2  # Half-open, the next call is the trial
+
+    async def hang(**kwargs):
+        await asyncio.sleep(30)
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=hang)))
+    monkeypatch.setattr(ai_service, "groq_circuit_breaker", breaker)
+    monkeypatch.setattr(ai_service, "get_async_groq_client", lambda: client)
+
+    async def hedge():
+        return "hedge"
+
+    async def run():
+        return await hedged_call(lambda: ai_service.create_chat_completion(model="cheap", messages=[]), 0.05, hedge)
+
+    result, hedged, hedge_won = asyncio.run(run())
+    assert (result, hedged, hedge_won) == ("hedge", True, True)
+    assert breaker.half_open_trial is False
+    assert breaker.failures == 3
+    assert breaker.state == "half-open"
+    # The next call gets the trial
+    assert breaker.check() is True
@@ -0,0 +1,53 @@
+from app.similarity import SimilarityIndex, jaccard, request_terms, strict_terms
+
+DRONE = "Lightweight drone frame for outdoor use, must carry a 500 N load"
+
+
+def index_with(tmp_path, *descriptions, threshold=0.9):
+    index = SimilarityIndex(str(tmp_path / "similar.db"), threshold=threshold)
+    index.add_many([("scope", f"key-{i}", description, None) for i, description in enumerate(descriptions)])
+    return index
+
+
+def test_strict_terms_only_take_known_units():
+    assert strict_terms("Lasts 10 years under a 500 N load") == {"10", "500n", "under"}
+    assert strict_terms("Bracket 2 in diameter") == {"2"}
+
+
+def test_strict_terms_compare_quantities_in_si():
+    assert strict_terms("Plate 20 mm thick") == strict_terms("Plate 2 cm thick")
+    assert strict_terms("Works at -10 °C") == strict_terms("Works at 14°F")
+    assert strict_terms("500 N load") != strict_terms("5000 N load")
+
+
+def test_strict_terms_record_negations():
+    assert "not magnetic" in strict_terms("A non-magnetic housing")
+    assert "not coat" in strict_terms("Steel bracket without coating")
+    assert "not corrosion" in strict_terms("Doesn't rust outdoors")
+
+
+def test_synonyms_make_rewordings_identical():
+    assert jaccard(request_terms(DRONE), request_terms("Light weight UAV frame for outdoors, must carry a 500 N load")) == 1.0
+
+
+def test_find_matches_rewording_above_threshold(tmp_path):
+    index = index_with(tmp_path, DRONE)
+    match = index.find("scope", "Light weight UAV frame for outdoors, must carry a 500 N load")
+    assert match["cache_key"] == "key-0"
+    assert match["score"] == 1.0
+    assert index.find("other-scope", DRONE) is None
+
+
+def test_find_rejects_different_strict_terms(tmp_path):
+    index = index_with(tmp_path, DRONE, "Drone frame that is not waterproof, must carry a 500 N load")
+    assert index.find("scope", DRONE.replace("500 N", "5000 N")) is None
+    assert index.find("scope", "Drone frame that is waterproof, must carry a 500 N load") is None
+
+
+def test_find_respects_threshold(tmp_path):
+    description = "Drone frame for outdoor racing with carbon arms, must carry a 500 N load"
+    strict = index_with(tmp_path, description)
+    # Two extra terms out of twelve drop the similarity below 0.9
+    assert strict.find("scope", description + ", folding telescopic arms") is None
+    loose = index_with(tmp_path / "loose", description, threshold=0.8)
+    assert loose.find("scope", description + ", folding telescopic arms")["score"] == round(10 / 12, 4)
@@ -0,0 +1,43 @@
+import pytest
+
+from app.units import parse_properties, parse_quantity
+
+
+def test_values_are_converted_to_si():
+    parsed = parse_properties({
+        "Tensile Strength": "310 MPa at 20 °C",
+        "Thermal expansion": "23 x 10^-6 /K",
+        "Fracture toughness": "29 MPa√m",
+        "Yield strength": "1,200 psi"
+    })
+    assert parsed["Tensile Strength"]["value"] == pytest.approx(310e6)
+    assert parsed["Tensile Strength"]["unit"] == "Pa"
+    assert parsed["Thermal expansion"]["value"] == pytest.approx(23e-6)
+    assert parsed["Fracture toughness"]["unit"] == "Pa·√m"
+    assert parsed["Yield strength"]["value"] == pytest.approx(1200 * 6894.757)
+
+
+def test_unit_from_property_name():
+    parsed = parse_properties({"Density (g/cm³)": "2.7"})
+    assert parsed["Density (g/cm³)"] == {"key": "density", "value": pytest.approx(2700.0), "min": pytest.approx(2700.0),
+                                         "max": pytest.approx(2700.0), "unit": "kg/m³"}
+
+
+def test_ranges_keep_bounds_and_midpoint():
+    quantity = parse_quantity("-40 to 115 °C")
+    assert quantity["min"] == pytest.approx(233.15)
+    assert quantity["max"] == pytest.approx(388.15)
+    assert quantity["value"] == pytest.approx(310.65)
+    assert parse_properties({"Operating temperature": "-40 to 115 °C"})["Operating temperature"]["key"] == "service_temperature"
+
+
+def test_currency_prefix_becomes_the_unit():
+    assert parse_quantity("₹350/kg")["unit"] == "INR/kg"
+
+
+def test_unparseable_values():
+    parsed = parse_properties({"Color": "silver", "Elongation": "12 furlongs", "Flag": True})
+    assert all(entry["value"] is None and entry["unit"] is None for entry in parsed.values())
+    # Plain numbers keep their value without a unit
+    assert parse_properties({"Young's modulus": 70})["Young's modulus"]["value"] == 70.0
+    assert parse_properties(None) == {}